@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+def route_class(view_name):
+    """Priority class of a URL name, or ``None`` for routes exempt from admission control."""
+    if view_name in settings.ADMISSION_EXEMPT_ROUTES:
+        return None
+    return settings.ADMISSION_ROUTE_CLASSES.get(view_name, 'default')
+
+class AdmissionController:
+    """
+    Per-process concurrency limits by priority class and route.
+
+    A class may only start a request while fewer than its share of
+    ``ADMISSION_MAX_CONCURRENCY`` requests are in flight, so cheap critical
+    requests keep slots that expensive ones cannot take. Routes in
+    ``ADMISSION_ROUTE_LIMITS`` are capped on their own as well. A request that
+    does not fit waits up to the class timeout in a queue of bounded length;
+    anything beyond that is rejected straight away.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.routes = defaultdict(int)
+        self.waiting = defaultdict(int)
+        self.rejected = defaultdict(int)
+
+    def _fits(self, route, name):
+        slots = settings.ADMISSION_MAX_CONCURRENCY * settings.ADMISSION_CLASSES[name]['share']
+        limit = settings.ADMISSION_ROUTE_LIMITS.get(route)
+        return self.in_flight < slots and (limit is None or self.routes[route] < limit)
+
+    def _take(self, route):
+        self.in_flight += 1
+        self.routes[route] += 1
+
+    def _enqueue(self, route, name):
+        """Take a slot (True), join the queue (None) or reject when the queue is full (False). Holds the lock."""
+        if self._fits(route, name):
+            self._take(route)
+            return True
+        if self.waiting[name] >= settings.ADMISSION_CLASSES[name]['queue']:
+            self.rejected[route, 'queue_full'] += 1
+            return False
+        self.waiting[name] += 1
+        return None
+
+    def _dequeue(self, route, name, admitted):
+        self.waiting[name] -= 1
+        if admitted:
+            self._take(route)
+        else:
+            self.rejected[route, 'timeout'] += 1
+        return admitted
+
+    def acquire(self, route, name):
+        with self._cond:
+            admitted = self._enqueue(route, name)
+            if admitted is not None:
+                return admitted
+            timeout = settings.ADMISSION_CLASSES[name]['timeout']
+            return self._dequeue(route, name, self._cond.wait_for(lambda: self._fits(route, name), timeout))
+
+    async def acquire_async(self, route, name):
+        # The event loop cannot block on the condition, so queued coroutines poll.
+        with self._cond:
+            admitted = self._enqueue(route, name)
+        if admitted is not None:
+            return admitted
+        deadline = time.monotonic() + settings.ADMISSION_CLASSES[name]['timeout']
+        while True:
+            await asyncio.sleep(settings.ADMISSION_POLL_INTERVAL)
+            with self._cond:
+                fits = self._fits(route, name)
+                if fits or time.monotonic() >= deadline:
+                    return self._dequeue(route, name, fits)
+
+    def release(self, route):
+        with self._cond:
+            self.in_flight -= 1
+            self.routes[route] -= 1
+            self._cond.notify_all()
+
+    def reject(self, route, reason):
+        with self._cond:
+            self.rejected[route, reason] += 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                'in_flight': self.in_flight,
+                'routes': {route: count for route, count in self.routes.items() if count},
+                'waiting': dict(self.waiting),
+                'rejected': dict(self.rejected),
+            }
+
+admission = AdmissionController()
+
+class CacheTokenBuckets:
+    """
+    Token buckets kept in the Django cache as GCRA "theoretical arrival times".
+
+    One value per bucket is read and written under a process lock, which makes
+    it exact for the per-process LocMemCache. Workers sharing a cache other than
+    Redis can race and admit a few requests over the limit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Spend one token; return 0 when granted, otherwise the seconds until one is available."""
+        now = time.time()
+        interval = 1 / rate
+        with self._lock:
+            tat = max(cache.get(key, now), now) + interval
+            wait = tat - now - burst * interval
+            if wait > 0:
+                return wait
+            cache.set(key, tat, timeout=max(1, int(tat - now) + 1))
+        return 0
+
+class RedisTokenBuckets:
+    """Token buckets shared by every worker, updated atomically by a Lua script (requires ``redis``)."""
+    prefix = 'sync:bucket:'
+    script = """
+    local now, interval, capacity = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now) + interval
+    local wait = tat - now - capacity
+    if wait > 0 then return tostring(wait) end
+    redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tat - now) * 1000) + 1000)
+    return '0'
+    """
+
+    def __init__(self):
+        import redis
+        self._take = redis.Redis.from_url(settings.ADMISSION_REDIS_URL).register_script(self.script)
+
+    def take(self, key, rate, burst):
+        interval = 1 / rate
+        return float(self._take(keys=[self.prefix + key], args=[time.time(), interval, burst * interval]))
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+def get_buckets():
+    global _buckets
+    if _buckets is None:
+        with _buckets_lock:
+            if _buckets is None:
+                _buckets = import_string(settings.ADMISSION_BUCKETS)()
+    return _buckets
+
+class TokenBucketThrottle(BaseThrottle):
+    """Rate limits each user (or client address) per priority class with the class's token bucket."""
+
+    def allow_request(self, request, view):
+        match = request.resolver_match
+        name = route_class(match.view_name) if match is not None else None
+        if name is None:
+            return True
+        config = settings.ADMISSION_CLASSES[name]
+        user = request.user
+        ident = f'user:{user.pk}' if user and user.is_authenticated else f'addr:{self.get_ident(request)}'
+        self.retry_after = get_buckets().take(f'admission:{name}:{ident}', config['rate'], config['burst'])
+        if self.retry_after:
+            admission.reject(match.view_name, 'rate_limited')
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
@@ -0,0 +1,13 @@
+from django.urls import path
+from .views.async_views import feed, explore_posts, user_detail, group_detail, login, register
+from .views.stream import stream
+
+urlpatterns = [
+    path("auth/register/", register, name="async-auth-register"),
+    path("auth/login/", login, name="async-auth-login"),
+    path("feed/", feed, name="async-feed"),
+    path("explore/", explore_posts, name="async-explore-posts"),
+    path("users/<str:username>/", user_detail, name="async-user-detail"),
+    path("groups/<int:pk>/", group_detail, name="async-group-detail"),
+    path("stream/", stream, name="async-stream"),
+]
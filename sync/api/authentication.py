@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .instrumentation import phase
+from .models import User
+from .objectcache import object_cache
+from .revocation import revocations
+from .routers import apply_pin
+
+class PrincipalCache:
+    """
+    Bounded per-process LRU of authenticated users, keyed by the token's user id.
+
+    Entries hold the user's column values plus the object-cache version they were
+    loaded at. Saves and deletes evict the local entry through signals, and the
+    version check catches writes made by other workers.
+    """
+
+    def __init__(self, max_size, ttl, verify_version=True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.verify_version = verify_version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = self.stale = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, version, db, names, values = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+        if self.verify_version and object_cache.version(User, user_id) != version:
+            with self._lock:
+                self._entries.pop(user_id, None)
+                self.stale += 1
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return User.from_db(db, names, values)
+
+    def set(self, user):
+        names = [field.attname for field in User._meta.concrete_fields]
+        values = [getattr(user, name) for name in names]
+        version = object_cache.version(User, user.pk) if self.verify_version else None
+        entry = (time.monotonic() + self.ttl, version, user._state.db, names, values)
+        with self._lock:
+            self._entries[user.pk] = entry
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'stale': self.stale,
+            }
+
+principal_cache = PrincipalCache(
+    max_size=settings.AUTH_PRINCIPAL_CACHE['MAX_SIZE'],
+    ttl=settings.AUTH_PRINCIPAL_CACHE['TTL'],
+    verify_version=settings.AUTH_PRINCIPAL_CACHE['VERIFY_VERSION'],
+)
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` that resolves the token's user through ``principal_cache`` and applies read-your-writes pins."""
+
+    def authenticate(self, request):
+        with phase('auth'):
+            return super().authenticate(request)
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        jti = token.get(api_settings.JTI_CLAIM)
+        if jti is not None and revocations.is_revoked(jti):
+            raise InvalidToken("Token is revoked")
+        return token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+        apply_pin(user_id)
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+        user = principal_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            principal_cache.set(user)
+        return user
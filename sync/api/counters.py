@@ -0,0 +1,54 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from .models import Comment, Follow, Group, GroupMembership, Like, Post, User
+from .objectcache import object_cache
+
+# (model, counter field, counted model, foreign key on the counted model)
+COUNTERS = [
+    (User, 'followers_count', Follow, 'followed'),
+    (User, 'following_count', Follow, 'follower'),
+    (User, 'posts_count', Post, 'user'),
+    (Group, 'members_count', GroupMembership, 'group'),
+    (Group, 'posts_count', Post, 'group'),
+    (Post, 'comments_count', Comment, 'post'),
+    (Post, 'likes_count', Like, 'post'),
+]
+
+def adjust(model, pk, field, delta, **changes):
+    if pk is None:
+        return
+    model.objects.filter(pk=pk).update(**{field: Greatest(F(field) + delta, Value(0))}, **changes)
+    object_cache.bump(model, pk)
+
+def latest(field, value):
+    """Update expression keeping the later of ``field`` and ``value``, for writes that may land out of order."""
+    return Greatest(Coalesce(F(field), Value(value)), Value(value))
+
+def actual_count(source, fk):
+    return Coalesce(
+        Subquery(
+            source.objects.filter(**{fk: OuterRef('pk')}).order_by()
+            .values(fk).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+def recount(model, field, source, fk, repair=True, batch_size=1000):
+    """Compare ``model.field`` against a COUNT over ``source`` in pk batches; return the stale pks."""
+    actual = actual_count(source, fk)
+    stale = []
+    last_pk = 0
+    while True:
+        pks = list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return stale
+        last_pk = pks[-1]
+        batch = list(
+            model.objects.filter(pk__in=pks).annotate(actual=actual)
+            .exclude(**{field: F('actual')}).values_list('pk', flat=True)
+        )
+        if batch and repair:
+            model.objects.filter(pk__in=batch).update(**{field: actual})
+            object_cache.bump_many(model, batch)
+        stale.extend(batch)
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .instrumentation import phase
+from .serializers import CommentSerializer, NotificationSerializer, PostSerializer
+
+class ValuesSerializer:
+    """
+    Read-only twin of a ``ModelSerializer`` that renders ``.values()`` rows.
+
+    The serializer's fields are introspected once and turned into a flat list of
+    column paths and converters, so a list page skips model instantiation and
+    per-field ``to_representation`` dispatch while producing the same output.
+    Only plain model fields, primary-key relations and nested serializers made of
+    those are supported.
+    """
+
+    def __init__(self, serializer_class, prefix=''):
+        self.serializer_class = serializer_class
+        self.prefix = prefix
+        self._compiled = None
+
+    @property
+    def compiled(self):
+        if self._compiled is None:
+            self._compiled = self._compile(self.serializer_class(), self.prefix)
+        return self._compiled
+
+    @property
+    def paths(self):
+        return list(self._paths(self.compiled))
+
+    def values(self, queryset, *extra):
+        return queryset.values(*extra, *self.paths)
+
+    def serialize(self, row):
+        with phase('serialize'):
+            return self._build(self.compiled, row, timezone.get_current_timezone())
+
+    def serialize_many(self, rows):
+        with phase('serialize'):
+            tz = timezone.get_current_timezone()
+            compiled = self.compiled
+            return [self._build(compiled, row, tz) for row in rows]
+
+    def _compile(self, serializer, prefix):
+        fields = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or '.' in field.source:
+                raise ImproperlyConfigured(f"{type(serializer).__name__}.{name} has an unsupported source.")
+            path = prefix + field.source
+            if isinstance(field, serializers.ModelSerializer):
+                fields.append((name, path, None, self._compile(field, path + '__')))
+            elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                fields.append((name, path, None, None))
+            elif isinstance(field, serializers.DateTimeField):
+                fields.append((name, path, self._datetime_converter(field), None))
+            elif isinstance(field, serializers.ModelField) or type(field) in (
+                serializers.CharField, serializers.EmailField, serializers.IntegerField,
+                serializers.BooleanField, serializers.SlugField, serializers.URLField,
+            ):
+                fields.append((name, path, None, None))
+            else:
+                raise ImproperlyConfigured(
+                    f"{type(serializer).__name__}.{name} ({type(field).__name__}) has no values() equivalent."
+                )
+        return fields
+
+    def _datetime_converter(self, field):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if not settings.USE_TZ or hasattr(field, 'timezone') or output_format is None \
+                or output_format.lower() != ISO_8601:
+            return lambda value, tz: field.to_representation(value)
+
+        def to_iso(value, tz):
+            if not value:
+                return None
+            text = value.astimezone(tz).isoformat()
+            return text[:-6] + 'Z' if text.endswith('+00:00') else text
+        return to_iso
+
+    def _paths(self, compiled):
+        for _, path, _, nested in compiled:
+            yield path
+            if nested is not None:
+                yield from self._paths(nested)
+
+    def _build(self, compiled, row, tz):
+        data = {}
+        for name, path, convert, nested in compiled:
+            if nested is not None:
+                data[name] = None if row[path] is None else self._build(nested, row, tz)
+            elif convert is not None:
+                data[name] = convert(row[path], tz)
+            else:
+                data[name] = row[path]
+        return data
+
+post_rows = ValuesSerializer(PostSerializer)
+explore_rows = ValuesSerializer(PostSerializer, prefix='post__')
+comment_rows = ValuesSerializer(CommentSerializer)
+notification_rows = ValuesSerializer(NotificationSerializer)
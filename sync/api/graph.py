@@ -0,0 +1,280 @@
+import heapq
+import logging
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import chain
+from operator import itemgetter
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from .models import Follow
+
+logger = logging.getLogger(__name__)
+
+SEQ_KEY = 'follow_graph:seq'
+ADD, REMOVE, REBUILD = 'add', 'remove', 'rebuild'
+
+def _log_key(seq):
+    return f'follow_graph:log:{seq}'
+
+def _append(op, follower_id=None, followed_id=None):
+    try:
+        seq = cache.incr(SEQ_KEY)
+    except ValueError:
+        cache.add(SEQ_KEY, 0, None)
+        seq = cache.incr(SEQ_KEY)
+    cache.set(_log_key(seq), (op, follower_id, followed_id), settings.FOLLOW_GRAPH_LOG_TTL)
+
+def record(op, follower_id, followed_id):
+    """Append a follow or unfollow to the change log every process replays, once the transaction commits."""
+    transaction.on_commit(lambda: _append(op, follower_id, followed_id))
+
+def invalidate():
+    """Make every process rebuild its graph from the table, after follows were written without signals."""
+    _append(REBUILD)
+
+class Adjacency:
+    """
+    One direction of the graph in CSR form: the neighbours of node ``u`` are
+    ``targets[offsets[u]:offsets[u + 1]]``, sorted. Node numbers are user ids.
+    """
+    __slots__ = ('offsets', 'targets')
+
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def from_edges(cls, sources, targets, size):
+        """Counting sort of the ``(sources[i], targets[i])`` edges into CSR arrays."""
+        offsets = array('q', bytes(8 * (size + 1)))
+        for source in sources:
+            offsets[source + 1] += 1
+        for node in range(size):
+            offsets[node + 1] += offsets[node]
+        position = array('q', offsets)
+        ordered = array('q', bytes(8 * len(targets)))
+        for source, target in zip(sources, targets):
+            ordered[position[source]] = target
+            position[source] += 1
+        for node in range(size):
+            start, end = offsets[node], offsets[node + 1]
+            if end - start > 1:
+                ordered[start:end] = array('q', sorted(ordered[start:end]))
+        return cls(offsets, ordered)
+
+    def bounds(self, node):
+        if node + 1 >= len(self.offsets):
+            return 0, 0
+        return self.offsets[node], self.offsets[node + 1]
+
+    def neighbours(self, node):
+        start, end = self.bounds(node)
+        return self.targets[start:end]
+
+    def has(self, node, target):
+        start, end = self.bounds(node)
+        index = bisect_left(self.targets, target, start, end)
+        return index < end and self.targets[index] == target
+
+class FollowGraph:
+    """
+    Per-process index of the follow graph for friends-of-friends questions.
+
+    Following and follower lists are two ``Adjacency`` arrays (16 bytes per
+    follow plus 8 per user id in each direction) built from the ``Follow``
+    table on first use. Follows and unfollows committed anywhere are appended
+    to a change log in the shared cache; every read first replays new entries
+    into small per-user overlays, which are folded back into the arrays once
+    they grow past ``FOLLOW_GRAPH_COMPACT_THRESHOLD``. A gap in the log (an
+    evicted entry, a flushed cache) triggers a rebuild from the table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._building = threading.Lock()
+        self._out = self._in = None
+        self._seq = 0
+        self._gap_since = None
+        self._reset_overlay()
+
+    def _reset_overlay(self):
+        self._added_out, self._added_in = defaultdict(set), defaultdict(set)
+        self._removed_out, self._removed_in = defaultdict(set), defaultdict(set)
+        self._changes = 0
+
+    def clear(self):
+        with self._lock:
+            self._out = self._in = None
+
+    def rebuild(self):
+        with self._building:
+            while self._load():
+                pass
+
+    def _load(self):
+        """Build the arrays from the table and swap them in; True if the log asks for another rebuild already."""
+        started = time.perf_counter()
+        seq = cache.get(SEQ_KEY, 0)
+        sources, targets = array('q'), array('q')
+        edges = Follow.objects.using(DEFAULT_DB_ALIAS).order_by('follower_id', 'followed_id')
+        edges = edges.values_list('follower_id', 'followed_id')
+        for follower_id, followed_id in edges.iterator(chunk_size=10000):
+            sources.append(follower_id)
+            targets.append(followed_id)
+        size = max(max(sources, default=0), max(targets, default=0)) + 1
+        out, in_ = Adjacency.from_edges(sources, targets, size), Adjacency.from_edges(targets, sources, size)
+        with self._lock:
+            self._out, self._in, self._seq, self._gap_since = out, in_, seq, None
+            self._reset_overlay()
+            # Entries logged while the table was read are applied again; both operations are idempotent.
+            stale = self._replay()
+        logger.info("Built follow graph of %d edges in %.2fs", len(targets), time.perf_counter() - started)
+        return stale
+
+    def _sync(self):
+        with self._lock:
+            if self._out is not None:
+                stale = self._replay()
+                if not stale and self._changes <= settings.FOLLOW_GRAPH_COMPACT_THRESHOLD:
+                    return
+            missing = self._out is None
+        # Readers keep using the current arrays while one thread rebuilds or
+        # compacts them; only the first build is waited for.
+        if not self._building.acquire(blocking=missing):
+            return
+        try:
+            if missing and self._out is not None:
+                return
+            if missing or stale:
+                while self._load():
+                    pass
+            else:
+                self._compact()
+        finally:
+            self._building.release()
+
+    def _replay(self):
+        """Apply new log entries; True if the graph has to be rebuilt from the table."""
+        latest = cache.get(SEQ_KEY, 0)
+        if latest < self._seq:
+            return True
+        if latest == self._seq:
+            return False
+        pending = range(self._seq + 1, latest + 1)
+        entries = cache.get_many([_log_key(seq) for seq in pending])
+        for seq in pending:
+            entry = entries.get(_log_key(seq))
+            if entry is None:
+                # Writers bump the sequence before storing the entry, so a
+                # missing entry is usually still on its way.
+                if self._gap_since is None:
+                    self._gap_since = time.monotonic()
+                elif time.monotonic() - self._gap_since > settings.FOLLOW_GRAPH_LOG_GRACE:
+                    return True
+                break
+            self._gap_since = None
+            if entry[0] == REBUILD:
+                return True
+            self._apply(*entry)
+            self._seq = seq
+        return False
+
+    def _apply(self, op, follower_id, followed_id):
+        in_base = self._out.has(follower_id, followed_id)
+        if op == ADD:
+            self._removed_out[follower_id].discard(followed_id)
+            self._removed_in[followed_id].discard(follower_id)
+            if not in_base:
+                self._added_out[follower_id].add(followed_id)
+                self._added_in[followed_id].add(follower_id)
+        else:
+            self._added_out[follower_id].discard(followed_id)
+            self._added_in[followed_id].discard(follower_id)
+            if in_base:
+                self._removed_out[follower_id].add(followed_id)
+                self._removed_in[followed_id].add(follower_id)
+        self._changes += 1
+
+    def _compact(self):
+        """Fold the overlays into new arrays, built outside the lock from a copy of them."""
+        with self._lock:
+            out = self._out
+            added = {node: set(targets) for node, targets in self._added_out.items() if targets}
+            removed = {node: set(targets) for node, targets in self._removed_out.items() if targets}
+        sources, targets = array('q'), array('q')
+        size = len(out.offsets) - 1
+        for node in chain(range(size), (node for node in added if node >= size)):
+            for target in self._list(out, added, removed, node):
+                sources.append(node)
+                targets.append(target)
+        size = max(max(sources, default=0), max(targets, default=0)) + 1
+        compacted = Adjacency.from_edges(sources, targets, size), Adjacency.from_edges(targets, sources, size)
+        with self._lock:
+            if self._out is not out:
+                return
+            # Changes replayed during the build are applied to the new arrays;
+            # the ones already folded in leave no overlay behind.
+            pending = [
+                (op, follower_id, followed_id)
+                for op, overlay in ((ADD, self._added_out), (REMOVE, self._removed_out))
+                for follower_id, followed in overlay.items() for followed_id in followed
+            ]
+            self._out, self._in = compacted
+            self._reset_overlay()
+            for entry in pending:
+                self._apply(*entry)
+            self._changes = sum(map(len, self._added_out.values())) + sum(map(len, self._removed_out.values()))
+
+    def _list(self, adjacency, added, removed, node):
+        base = adjacency.neighbours(node)
+        if not added.get(node) and not removed.get(node):
+            return base
+        gone = removed.get(node, ())
+        return [target for target in base if target not in gone] + sorted(added.get(node, ()))
+
+    def following(self, user_id):
+        self._sync()
+        with self._lock:
+            return self._list(self._out, self._added_out, self._removed_out, user_id)
+
+    def followers(self, user_id):
+        self._sync()
+        with self._lock:
+            return self._list(self._in, self._added_in, self._removed_in, user_id)
+
+    def mutual_count(self, viewer_id, user_id):
+        """How many of the accounts ``viewer_id`` follows also follow ``user_id``."""
+        self._sync()
+        with self._lock:
+            following = self._list(self._out, self._added_out, self._removed_out, viewer_id)
+            followers = self._list(self._in, self._added_in, self._removed_in, user_id)
+        small, large = sorted((following, followers), key=len)
+        return len(set(small).intersection(large))
+
+    def suggestions(self, viewer_id, limit):
+        """
+        Accounts followed by the most people ``viewer_id`` follows, as
+        ``(user_id, mutual count)`` pairs. Viewers following more than
+        ``FOLLOW_GRAPH_SUGGESTION_FRIENDS`` accounts are answered from a
+        stable sample of them.
+        """
+        self._sync()
+        with self._lock:
+            following = self._list(self._out, self._added_out, self._removed_out, viewer_id)
+            friends = following
+            if len(friends) > settings.FOLLOW_GRAPH_SUGGESTION_FRIENDS:
+                friends = random.Random(viewer_id).sample(list(friends), settings.FOLLOW_GRAPH_SUGGESTION_FRIENDS)
+            counts = Counter(chain.from_iterable(
+                self._list(self._out, self._added_out, self._removed_out, friend) for friend in friends
+            ))
+        counts.pop(viewer_id, None)
+        for followed_id in following:
+            counts.pop(followed_id, None)
+        return heapq.nlargest(limit, counts.items(), key=itemgetter(1))
+
+follow_graph = FollowGraph()
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from .fastpath import post_rows
+from .models import Group, GroupMembership, Post
+from .pagination import MergedKeysetPagination
+
+def _membership_key(user_id):
+    return f'group_memberships:{user_id}'
+
+def member_group_ids(user_id):
+    """
+    Ids of the groups ``user_id`` belongs to, cached until a membership of theirs changes.
+
+    Only for reads: the drop on change reaches other workers only through a
+    shared cache, so anything that authorizes a write must query the database.
+    """
+    key = _membership_key(user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(GroupMembership.objects.filter(user_id=user_id).values_list('group_id', flat=True))
+        cache.set(key, ids, settings.GROUP_MEMBERSHIP_CACHE_SECONDS)
+    return ids
+
+def forget_memberships(user_id):
+    transaction.on_commit(lambda: cache.delete(_membership_key(user_id)))
+
+def refresh_last_post_at():
+    """Recompute ``Group.last_post_at`` after posts were written without signals."""
+    newest = Post.all_objects.filter(group=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+    return Group.all_objects.update(last_post_at=Subquery(newest))
+
+class GroupFeedPagination(MergedKeysetPagination):
+    """
+    Pages of posts from every group the user belongs to, k-way merged from one
+    ``(created_at, id)`` window per group on ``post_group_recent_idx``.
+
+    Going forward, groups are visited newest ``last_post_at`` first and the
+    walk stops once a full page is newer than the next group's last post, so a
+    member of hundreds of groups only reads the few that are active.
+    """
+    model = Post
+
+    def __init__(self, user):
+        self.user = user
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_query_param in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.request, self.legacy = request, None
+        values, reverse = self.decode_cursor(request)
+        rows = []
+        for group_id, last_post_at in self.groups(values, reverse):
+            if not reverse and len(rows) > self.page_size and last_post_at < rows[self.page_size]['created_at']:
+                break
+            posts = post_rows.values(Post.objects.filter(group_id=group_id))
+            rows = self._merge([rows, self._fetch_source(self._window(posts, values, reverse), '')], reverse)
+        return self._set_page(rows, values, reverse)
+
+    def groups(self, values, reverse):
+        groups = Group.objects.filter(pk__in=member_group_ids(self.user.pk), last_post_at__isnull=False)
+        if reverse and values is not None:
+            # Only groups posted to since the cursor can have newer rows.
+            groups = groups.filter(last_post_at__gte=values[0])
+        return sorted(groups.values_list('pk', 'last_post_at'), key=lambda group: group[1], reverse=True)
+
+def group_feed(user):
+    return Post.objects.filter(
+        group_id__in=member_group_ids(user.pk), group__deleted_at__isnull=True,
+    ).order_by('-created_at', '-id')
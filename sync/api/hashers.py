@@ -0,0 +1,55 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.db import close_old_connections
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """
+    Django's scrypt hasher with its cost taken from ``PASSWORD_SCRYPT_*``.
+
+    The algorithm name is unchanged, so hashes made at another cost still
+    verify and are rewritten at the configured one on the next login.
+    """
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(settings.PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+    return _pool
+
+def _call(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+async def offload(func, *args, **kwargs):
+    """
+    Run ``func``, which hashes or checks a password, on the bounded hashing pool.
+
+    hashlib releases the GIL while hashing, so the pool's threads hash in
+    parallel while the event loop and the sync-view thread keep serving other
+    requests; a login storm queues here instead of taking every worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), partial(_call, func, args, kwargs))
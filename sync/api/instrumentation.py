@@ -0,0 +1,173 @@
+import bisect
+import threading
+from collections import defaultdict
+from contextvars import ContextVar
+from time import perf_counter
+
+# The timings of the request being handled. Threads started with sync_to_async
+# copy the context, so queries they run are counted against the same request.
+current = ContextVar('request_timings', default=None)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PHASES = ('db', 'auth', 'serialize', 'render')
+
+class RequestTimings:
+    __slots__ = ('queries', 'db', 'phases', 'active')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.phases = defaultdict(float)
+        self.active = set()
+
+    def server_timing(self, total):
+        """``Server-Timing`` value in milliseconds; ``app`` is whatever no other phase accounts for."""
+        parts = [f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"']
+        accounted = self.db
+        for name in PHASES[1:]:
+            if name in self.phases:
+                parts.append(f'{name};dur={self.phases[name] * 1000:.1f}')
+                accounted += self.phases[name]
+        parts.append(f'app;dur={max(total - accounted, 0.0) * 1000:.1f}')
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+def record_query(execute, sql, params, many, context):
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.db += perf_counter() - start
+
+def install_query_timer(connection):
+    # First in line, so connection.execute_wrapper() blocks that were open when
+    # the connection was made still pop their own wrapper off the end.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+class phase:
+    """Add the block's time to the current request's ``name`` phase, minus any queries it ran. Nested uses count once."""
+    __slots__ = ('name', 'timings', 'start', 'db')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        timings = current.get()
+        if timings is None or self.name in timings.active:
+            self.timings = None
+            return
+        timings.active.add(self.name)
+        self.timings = timings
+        self.db = timings.db
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        timings = self.timings
+        if timings is not None:
+            timings.active.discard(self.name)
+            timings.phases[self.name] += perf_counter() - self.start - (timings.db - self.db)
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+class RouteStats:
+    __slots__ = ('duration', 'db', 'queries', 'phases', 'statuses')
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.phases = defaultdict(float)
+        self.statuses = defaultdict(int)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+class RequestMetrics:
+    """Per-process request histograms by (route pattern, method), rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(RouteStats)
+
+    def observe(self, route, method, status, total, timings):
+        with self._lock:
+            stats = self._routes[route, method]
+            stats.duration.observe(total)
+            stats.db.observe(timings.db)
+            stats.queries.observe(timings.queries)
+            stats.statuses[status] += 1
+            stats.phases['db'] += timings.db
+            for name, seconds in timings.phases.items():
+                stats.phases[name] += seconds
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def _histogram(self, lines, name, key, histogram):
+        route, method = key
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(route=route, method=method, le=bound)} {cumulative}')
+        cumulative += histogram.counts[-1]
+        lines.append(f'{name}_bucket{_labels(route=route, method=method, le="+Inf")} {cumulative}')
+        lines.append(f'{name}_sum{_labels(route=route, method=method)} {histogram.sum}')
+        lines.append(f'{name}_count{_labels(route=route, method=method)} {cumulative}')
+
+    def render(self):
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                '# HELP sync_http_requests_total Requests handled, by route pattern, method and status.',
+                '# TYPE sync_http_requests_total counter',
+            ]
+            for (route, method), stats in routes:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'sync_http_requests_total{_labels(route=route, method=method, status=status)} {count}')
+            for name, attribute, help_text in (
+                ('sync_http_request_duration_seconds', 'duration', 'Time from the first middleware to the response.'),
+                ('sync_http_request_db_seconds', 'db', 'Time spent executing SQL per request.'),
+                ('sync_http_request_queries', 'queries', 'SQL queries per request.'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for key, stats in routes:
+                    self._histogram(lines, name, key, getattr(stats, attribute))
+            lines += [
+                '# HELP sync_http_request_phase_seconds_total Time spent in database, auth, serialization and rendering.',
+                '# TYPE sync_http_request_phase_seconds_total counter',
+            ]
+            for (route, method), stats in routes:
+                for name, seconds in sorted(stats.phases.items()):
+                    lines.append(
+                        f'sync_http_request_phase_seconds_total{_labels(route=route, method=method, phase=name)} {seconds}'
+                    )
+        return lines
+
+request_metrics = RequestMetrics()
+
+def gauge(lines, name, help_text, samples, kind='gauge'):
+    """Append a gauge (or ``kind``) family; ``samples`` are ``(labels dict, value)`` pairs, ``None`` values are skipped."""
+    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        if value is not None:
+            lines.append(f'{name}{_labels(**labels) if labels else ""} {float(value)}')
@@ -0,0 +1,77 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from .counters import recount
+from .models import Like, Post
+from .objectcache import object_cache
+from . import realtime
+
+logger = logging.getLogger(__name__)
+
+class LikeCountBuffer:
+    """
+    Write-behind buffer for ``Post.likes_count``.
+
+    Like and unlike only record a delta in memory; a timer flushes the summed
+    deltas with one ``UPDATE ... SET likes_count = likes_count + n`` per distinct
+    delta, so a hot post costs one row write per flush instead of one per like.
+    Deltas lost to a crash are repaired by ``reconcile_like_counts``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._timer = None
+
+    def add(self, post_id, delta):
+        transaction.on_commit(lambda: self._add(post_id, delta))
+
+    def _add(self, post_id, delta):
+        with self._lock:
+            self._pending[post_id] += delta
+            full = len(self._pending) >= settings.LIKE_BUFFER_MAX_PENDING
+            if self._timer is None and not full:
+                self._timer = threading.Timer(settings.LIKE_BUFFER_FLUSH_INTERVAL, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+        if full or getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            self.flush()
+
+    def _flush_in_background(self):
+        close_old_connections()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Flushing buffered like counts failed")
+        finally:
+            close_old_connections()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        by_delta = defaultdict(list)
+        for post_id, delta in pending.items():
+            if delta:
+                by_delta[delta].append(post_id)
+        for delta, post_ids in by_delta.items():
+            Post.objects.filter(pk__in=post_ids).update(
+                likes_count=Greatest(F('likes_count') + delta, Value(0))
+            )
+            object_cache.bump_many(Post, post_ids)
+        if by_delta:
+            realtime.publish_like_counts([post_id for post_ids in by_delta.values() for post_id in post_ids])
+        return len(pending)
+
+like_counts = LikeCountBuffer()
+atexit.register(like_counts.flush)
+
+def reconcile(batch_size=1000):
+    return len(recount(Post, 'likes_count', Like, 'post', batch_size=batch_size))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from ...counters import COUNTERS, recount
+from ...likes import like_counts
+
+class Command(BaseCommand):
+    help = "Check denormalized counters against the rows they count, optionally repairing them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help="Rewrite counters that have drifted.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        like_counts.flush()
+        drifted = 0
+        for model, field, source, fk in COUNTERS:
+            stale = recount(model, field, source, fk, repair=options['repair'], batch_size=options['batch_size'])
+            drifted += len(stale)
+            label = f"{model.__name__}.{field}"
+            if stale:
+                action = "repaired" if options['repair'] else "stale"
+                self.stdout.write(self.style.WARNING(f"{label}: {len(stale)} {action}"))
+            else:
+                self.stdout.write(f"{label}: ok")
+        if drifted and not options['repair']:
+            self.stdout.write("Run again with --repair to fix drifted counters.")
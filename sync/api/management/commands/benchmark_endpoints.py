@@ -0,0 +1,308 @@
+import json
+import logging
+import random
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from ...models import Comment, Group, GroupMembership, Post, User
+from ... import urls as api_urls
+
+# Relative weight of each (url name, method) in a traffic mix; "uniform" weighs every route equally.
+MIXES = {
+    'read-heavy': {
+        ('feed', 'GET'): 30, ('post-detail', 'GET'): 15, ('explore-posts', 'GET'): 10,
+        ('user-detail', 'GET'): 8, ('post-comments', 'GET'): 8, ('user-posts', 'GET'): 5,
+        ('search', 'GET'): 4, ('notification-list', 'GET'): 4, ('group-posts', 'GET'): 3,
+        ('group-detail', 'GET'): 2, ('post-likes-list', 'GET'): 2, ('user-followers', 'GET'): 1,
+        ('post-like', 'POST'): 5, ('post-comments', 'POST'): 2, ('post-list', 'POST'): 1,
+        ('user-follow', 'POST'): 1,
+    },
+    'write-heavy': {
+        ('feed', 'GET'): 15, ('post-detail', 'GET'): 10, ('post-like', 'POST'): 20,
+        ('post-comments', 'POST'): 10, ('post-list', 'POST'): 8, ('group-posts', 'POST'): 4,
+        ('user-follow', 'POST'): 6, ('group-membership', 'POST'): 3, ('batch-likes', 'POST'): 3,
+        ('notification-read', 'POST'): 2, ('auth-login', 'POST'): 2, ('post-detail', 'PUT'): 2,
+    },
+    'uniform': None,
+}
+
+class Traffic:
+    """Builds one realistic request per (url name, method) from a sample of the database."""
+
+    def __init__(self, rng, users, password):
+        self.rng = rng
+        self.users = users
+        self.password = password
+        user_ids = [user.pk for user in users]
+        self.posts = list(Post.objects.order_by('?').values_list('pk', 'user_id')[:500])
+        self.comments = list(Comment.objects.order_by('?').values_list('pk', flat=True)[:200])
+        self.groups = list(Group.objects.order_by('?').values_list('pk', flat=True)[:100])
+        self.memberships = list(
+            GroupMembership.objects.filter(user_id__in=user_ids).values_list('user_id', 'group_id')[:500]
+        )
+        self.usernames = list(User.objects.order_by('?').values_list('username', flat=True)[:500])
+        self.own_posts = list(Post.objects.filter(user_id__in=user_ids).values_list('pk', 'user_id')[:500])
+        if not self.posts or not self.groups:
+            raise CommandError("The database has no posts or groups; run generate_social_graph first.")
+        self.by_id = {user.pk: user for user in users}
+        self.serial = 0
+
+    def user(self):
+        return self.rng.choice(self.users)
+
+    def pick(self, rows):
+        return self.rng.choice(rows)
+
+    def kwargs(self, route):
+        """URL kwargs for a pattern such as ``posts/<int:pk>/like/``: the pk's kind comes from its first segment."""
+        kwargs = {}
+        if '<str:username>' in route:
+            kwargs['username'] = self.pick(self.usernames)
+        if '<int:pk>' in route:
+            kind = route.split('/', 1)[0]
+            if kind == 'comments':
+                kwargs['pk'] = self.pick(self.comments) if self.comments else 0
+            elif kind == 'groups':
+                kwargs['pk'] = self.pick(self.groups)
+            else:
+                kwargs['pk'] = self.pick(self.posts)[0]
+        return kwargs
+
+    def request(self, name, method, route):
+        """Return ``(user, url kwargs, query or body)`` for one request to ``name``."""
+        rng, user = self.rng, self.user()
+        kwargs = self.kwargs(route)
+        self.serial += 1
+        if name == 'auth-register':
+            unique = f'{time.time_ns()}{self.serial}'
+            return None, kwargs, {
+                'username': f'bench{unique}', 'email': f'bench{unique}@example.com',
+                'password': 'bench-pass-1', 'password2': 'bench-pass-1',
+            }
+        if name == 'auth-login':
+            return None, kwargs, {'username': user.username, 'password': self.password}
+        if name in ('auth-refresh', 'auth-logout'):
+            return user, kwargs, {'refresh': str(RefreshToken.for_user(user))}
+        if name == 'search':
+            return user, kwargs, {'q': rng.choice(['post', 'coffee', 'sync*', 'music trav*', 'group'])}
+        if name == 'post-detail' and method == 'PUT':
+            if self.own_posts:
+                kwargs['pk'], author = self.pick(self.own_posts)
+                user = self.by_id[author]
+            return user, kwargs, {'title': f'edited {self.serial}'}
+        if name in ('post-list', 'group-posts') and method == 'POST':
+            if name == 'group-posts' and self.memberships:
+                member, kwargs['pk'] = self.pick(self.memberships)
+                user = self.by_id[member]
+            return user, kwargs, {'title': f'bench post {self.serial}', 'content': 'written by benchmark_endpoints'}
+        if name == 'post-comments' and method == 'POST':
+            return user, kwargs, {'content': f'bench comment {self.serial}', 'post': kwargs['pk']}
+        if name == 'batch':
+            return user, kwargs, {'requests': [
+                {'method': 'GET', 'path': reverse('post-detail', kwargs={'pk': self.pick(self.posts)[0]})},
+                {'method': 'GET', 'path': reverse('user-detail', kwargs={'username': self.pick(self.usernames)})},
+                {'method': 'GET', 'path': reverse('group-detail', kwargs={'pk': self.pick(self.groups)})},
+            ]}
+        if name == 'batch-likes':
+            return user, kwargs, {'post_ids': [pk for pk, _ in rng.sample(self.posts, min(5, len(self.posts)))]}
+        if name == 'batch-follows':
+            return user, kwargs, {'usernames': rng.sample(self.usernames, min(5, len(self.usernames)))}
+        if name == 'batch-memberships':
+            return user, kwargs, {'group_ids': rng.sample(self.groups, min(3, len(self.groups)))}
+        if method == 'GET':
+            return user, kwargs, None
+        return user, kwargs, {}
+
+def percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+class Command(BaseCommand):
+    help = (
+        "Drive every route in api/urls.py in-process with a traffic mix and report latency percentiles, "
+        "throughput and queries per request. Writes requests to the configured database; "
+        "results are saved as JSON and compared with the previous run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', choices=sorted(MIXES), default='read-heavy')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--warmup', type=int, default=100)
+        parser.add_argument('--users', type=int, default=200, help="Distinct users the traffic is spread over.")
+        parser.add_argument('--password', default='password', help="Password of the sampled users, for auth-login.")
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output-dir', default=str(Path(settings.BASE_DIR) / 'benchmarks'))
+        parser.add_argument('--compare', help="Result file to compare against (defaults to the latest in --output-dir).")
+        parser.add_argument('--no-save', action='store_true')
+        parser.add_argument(
+            '--admission', action='store_true',
+            help="Keep admission control and rate limits on; by default every route is exempt for the run.",
+        )
+
+    def handle(self, *args, **options):
+        if options['admission']:
+            return self.run(options)
+        with override_settings(ADMISSION_EXEMPT_ROUTES=[pattern.name for pattern in api_urls.urlpatterns]):
+            return self.run(options)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        users = list(User.objects.filter(is_active=True).order_by('?')[:options['users']])
+        if not users:
+            raise CommandError("No users; run generate_social_graph first.")
+        traffic = Traffic(rng, users, options['password'])
+        routes = {
+            (pattern.name, method): str(pattern.pattern)
+            for pattern in api_urls.urlpatterns for method in self.methods(pattern)
+        }
+        weights = MIXES[options['mix']] or dict.fromkeys(sorted(routes), 1)
+        unknown = set(weights) - set(routes)
+        if unknown:
+            raise CommandError(f"Mix {options['mix']} names unknown routes: {sorted(unknown)}")
+        choices, cum = list(weights), []
+        for weight in weights.values():
+            cum.append((cum[-1] if cum else 0) + weight)
+
+        client = Client(HTTP_HOST=options['host'], raise_request_exception=False)
+        tokens = {user.pk: f'Bearer {RefreshToken.for_user(user).access_token}' for user in users}
+        samples = defaultdict(lambda: {'latency': [], 'queries': [], 'status': defaultdict(int)})
+
+        # Expected 4xx responses (already liked, already following) would flood the log.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        total = options['warmup'] + options['requests']
+        started = None
+        for i in range(total):
+            if i == options['warmup']:
+                started = time.perf_counter()
+            name, method = rng.choices(choices, cum_weights=cum)[0]
+            user, kwargs, data = traffic.request(name, method, routes[name, method])
+            headers = {'HTTP_AUTHORIZATION': tokens[user.pk]} if user else {}
+            url = reverse(name, kwargs=kwargs)
+            send = getattr(client, method.lower())
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                if method == 'GET':
+                    response = send(url, data, **headers)
+                else:
+                    response = send(url, json.dumps(data), content_type='application/json', **headers)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - start
+            if i >= options['warmup']:
+                sample = samples[f'{method} {name}']
+                sample['latency'].append(elapsed * 1000)
+                sample['queries'].append(len(queries))
+                sample['status'][response.status_code] += 1
+        wall = time.perf_counter() - started if started else 0.0
+
+        result = self.summarize(options, samples, wall)
+        self.report(result)
+        previous = self.previous(options)
+        if previous:
+            self.compare(previous, result)
+        if not options['no_save']:
+            directory = Path(options['output_dir'])
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"endpoints-{options['mix']}-{datetime.now():%Y%m%d-%H%M%S}.json"
+            path.write_text(json.dumps(result, indent=2))
+            self.stdout.write(f"Saved {path}")
+
+    def methods(self, pattern):
+        # @api_view functions expose their generated APIView as .cls, as_view() callbacks as .view_class.
+        view = getattr(pattern.callback, 'cls', None) or pattern.callback.view_class
+        return [
+            method.upper() for method in view.http_method_names
+            if method not in ('head', 'options') and hasattr(view, method)
+        ]
+
+    def summarize(self, options, samples, wall):
+        routes = {}
+        count = 0
+        for key in sorted(samples):
+            sample = samples[key]
+            latency = sorted(sample['latency'])
+            count += len(latency)
+            routes[key] = {
+                'requests': len(latency),
+                'p50_ms': percentile(latency, 50),
+                'p95_ms': percentile(latency, 95),
+                'p99_ms': percentile(latency, 99),
+                'mean_queries': sum(sample['queries']) / len(sample['queries']),
+                'max_queries': max(sample['queries']),
+                'status': {str(code): n for code, n in sorted(sample['status'].items())},
+            }
+        everything = sorted(latency for sample in samples.values() for latency in sample['latency'])
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'mix': options['mix'],
+            'commit': commit,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'dataset': {model.__name__: model.objects.count() for model in (User, Post, Comment, Group)},
+            'requests': count,
+            'seconds': wall,
+            'throughput_rps': count / wall if wall else None,
+            'p50_ms': percentile(everything, 50),
+            'p95_ms': percentile(everything, 95),
+            'p99_ms': percentile(everything, 99),
+            'routes': routes,
+        }
+
+    def report(self, result):
+        self.stdout.write(
+            f"{'route':<32}{'n':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}  status"
+        )
+        for key, route in result['routes'].items():
+            status = ' '.join(f'{code}x{n}' for code, n in route['status'].items())
+            self.stdout.write(
+                f"{key:<32}{route['requests']:>6}{route['p50_ms']:>9.1f}{route['p95_ms']:>9.1f}"
+                f"{route['p99_ms']:>9.1f}{route['mean_queries']:>9.1f}  {status}"
+            )
+        self.stdout.write(
+            f"{result['requests']} requests in {result['seconds']:.1f}s: {result['throughput_rps']:.0f} req/s, "
+            f"p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms"
+        )
+
+    def previous(self, options):
+        if options['compare']:
+            path = Path(options['compare'])
+        else:
+            runs = sorted(Path(options['output_dir']).glob(f"endpoints-{options['mix']}-*.json"))
+            if not runs:
+                return None
+            path = runs[-1]
+        try:
+            previous = json.loads(path.read_text())
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        previous['path'] = str(path)
+        return previous
+
+    def compare(self, previous, result):
+        self.stdout.write(f"Compared with {previous['path']} ({previous.get('commit') or 'unknown commit'}):")
+        for key, route in result['routes'].items():
+            before = previous['routes'].get(key)
+            if not before:
+                continue
+            change = (route['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+            queries = route['mean_queries'] - before['mean_queries']
+            self.stdout.write(f"  {key:<32} p95 {change:+6.1f}%  queries {queries:+.1f}")
+        if previous.get('throughput_rps') and result['throughput_rps']:
+            change = (result['throughput_rps'] / previous['throughput_rps'] - 1) * 100
+            self.stdout.write(f"  throughput {change:+.1f}%")
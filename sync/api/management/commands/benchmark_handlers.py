@@ -0,0 +1,103 @@
+import asyncio
+import time
+from io import BytesIO
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+from ...models import User
+
+class Command(BaseCommand):
+    help = "Compare requests/second of one WSGI worker against one ASGI worker for the sync and async read views."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username to authenticate as (defaults to the user following the most people).")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per run.")
+        parser.add_argument('--concurrency', type=int, default=20, help="In-flight requests on the ASGI worker.")
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help="Path under /api/ to compare, e.g. feed/ (repeatable). The async twin is /api/async/<path>.",
+        )
+
+    def _viewer(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = User.objects.filter(following__isnull=False).order_by('-following_count').first()
+        if user is None:
+            raise CommandError("No user to authenticate as; generate some data first.")
+        return user
+
+    def _wsgi(self, path, token, host, count):
+        handler = WSGIHandler()
+        failures = 0
+
+        def start_response(status, headers, exc_info=None):
+            nonlocal failures
+            if not status.startswith('200'):
+                failures += 1
+
+        start = time.perf_counter()
+        for _ in range(count):
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host,
+                'HTTP_AUTHORIZATION': f'Bearer {token}',
+                'wsgi.input': BytesIO(), 'wsgi.url_scheme': 'http',
+            }
+            response = handler(environ, start_response)
+            b''.join(response)
+            response.close()
+        return time.perf_counter() - start, failures
+
+    async def _asgi(self, path, token, host, count, concurrency):
+        handler = ASGIHandler()
+        limit = asyncio.Semaphore(concurrency)
+        failures = 0
+
+        async def one():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+                'query_string': b'', 'root_path': '', 'client': ('127.0.0.1', 0), 'server': (host, 80),
+                'headers': [(b'host', host.encode()), (b'authorization', f'Bearer {token}'.encode())],
+            }
+            sent = asyncio.Event()
+
+            async def receive():
+                if not sent.is_set():
+                    sent.set()
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await asyncio.Future()
+
+            async def send(message):
+                nonlocal failures
+                if message['type'] == 'http.response.start' and message['status'] != 200:
+                    failures += 1
+
+            async with limit:
+                await handler(scope, receive, send)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(count)))
+        return time.perf_counter() - start, failures
+
+    def handle(self, *args, **options):
+        viewer = self._viewer(options['user'])
+        token = str(AccessToken.for_user(viewer))
+        count, concurrency, host = options['requests'], options['concurrency'], options['host']
+        paths = options['paths'] or ['feed/', 'explore/', f'users/{viewer.username}/']
+        self.stdout.write(f"{count} requests as {viewer.username}, ASGI concurrency {concurrency}")
+        for path in paths:
+            runs = [
+                ('WSGI, sync view', self._wsgi(f'/api/{path}', token, host, count)),
+                ('ASGI, sync view', asyncio.run(self._asgi(f'/api/{path}', token, host, count, concurrency))),
+                ('ASGI, async view', asyncio.run(self._asgi(f'/api/async/{path}', token, host, count, concurrency))),
+            ]
+            self.stdout.write(f"/api/{path}")
+            for label, (elapsed, failures) in runs:
+                line = f"  {label:18} {count / elapsed:8.1f} req/s per worker"
+                if failures:
+                    line += f"  ({failures} non-200 responses)"
+                self.stdout.write(line)
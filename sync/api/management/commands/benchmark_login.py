@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import time
+from io import BytesIO
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from ...models import User
+
+class Command(BaseCommand):
+    help = "Measure password verifications and logins per second per core for the configured hashers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help="Logins per run.")
+        parser.add_argument('--concurrency', type=int, default=20, help="In-flight logins on the ASGI worker.")
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--username', default='benchmark-login', help="Throwaway user created for the run and deleted after.")
+
+    def _hashers(self, count):
+        password = 'benchmark-password'
+        self.stdout.write("Verifications per second on one core")
+        for hasher in get_hashers():
+            try:
+                encoded = hasher.encode(password, hasher.salt())
+            except ValueError as exc:
+                self.stdout.write(f"  {hasher.algorithm:18} unavailable ({exc})")
+                continue
+            start = time.perf_counter()
+            for _ in range(count):
+                hasher.verify(password, encoded)
+            self.stdout.write(f"  {hasher.algorithm:18} {count / (time.perf_counter() - start):8.1f}/s")
+
+    def _wsgi(self, path, body, host, count):
+        handler = WSGIHandler()
+        failures = 0
+
+        def start_response(status, headers, exc_info=None):
+            nonlocal failures
+            if not status.startswith('200'):
+                failures += 1
+
+        start = time.perf_counter()
+        for _ in range(count):
+            environ = {
+                'REQUEST_METHOD': 'POST', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host,
+                'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+                'wsgi.input': BytesIO(body), 'wsgi.url_scheme': 'http',
+            }
+            response = handler(environ, start_response)
+            b''.join(response)
+            response.close()
+        return time.perf_counter() - start, failures
+
+    async def _asgi(self, path, body, host, count, concurrency):
+        handler = ASGIHandler()
+        limit = asyncio.Semaphore(concurrency)
+        failures = 0
+
+        async def one():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'POST', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+                'query_string': b'', 'root_path': '', 'client': ('127.0.0.1', 0), 'server': (host, 80),
+                'headers': [
+                    (b'host', host.encode()), (b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()),
+                ],
+            }
+            sent = asyncio.Event()
+
+            async def receive():
+                if not sent.is_set():
+                    sent.set()
+                    return {'type': 'http.request', 'body': body, 'more_body': False}
+                await asyncio.Future()
+
+            async def send(message):
+                nonlocal failures
+                if message['type'] == 'http.response.start' and message['status'] != 200:
+                    failures += 1
+
+            async with limit:
+                await handler(scope, receive, send)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(count)))
+        return time.perf_counter() - start, failures
+
+    def handle(self, *args, **options):
+        count, concurrency, host = options['requests'], options['concurrency'], options['host']
+        self._hashers(count)
+        password = 'benchmark-password'
+        User.objects.filter(username=options['username']).delete()
+        user = User.objects.create_user(options['username'], f"{options['username']}@example.com", password)
+        body = json.dumps({'username': user.username, 'password': password}).encode()
+        # The sync view runs on one thread; the async one hashes on the pool, one core per worker thread.
+        cores = min(settings.PASSWORD_HASH_WORKERS, concurrency, os.cpu_count() or 1)
+        try:
+            self.stdout.write(f"{count} logins with {get_hashers()[0].algorithm}, ASGI concurrency {concurrency}")
+            runs = [
+                ('WSGI, sync view', 1, self._wsgi('/api/auth/login/', body, host, count)),
+                ('ASGI, sync view', 1, asyncio.run(self._asgi('/api/auth/login/', body, host, count, concurrency))),
+                ('ASGI, async view', cores,
+                 asyncio.run(self._asgi('/api/async/auth/login/', body, host, count, concurrency))),
+            ]
+            for label, used, (elapsed, failures) in runs:
+                line = f"  {label:18} {count / elapsed:8.1f} logins/s, {count / elapsed / used:8.1f} per core"
+                if failures:
+                    line += f"  ({failures} non-200 responses)"
+                self.stdout.write(line)
+        finally:
+            user.delete()
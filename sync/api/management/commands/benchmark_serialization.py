@@ -0,0 +1,46 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from ...fastpath import post_rows
+from ...models import Post
+from ...renderers import FastJSONRenderer
+from ...serializers import PostSerializer
+
+class Command(BaseCommand):
+    help = "Compare per-item CPU cost of PostSerializer + JSONRenderer against the values() fast path."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100, help="Posts per serialized page.")
+        parser.add_argument('--rounds', type=int, default=50)
+
+    def _time(self, rounds, func):
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            output = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
+
+    def handle(self, *args, **options):
+        queryset = Post.objects.order_by('-created_at', '-id')[:options['items']]
+        instances = list(PostSerializer.setup_eager_loading(queryset))
+        rows = list(post_rows.values(queryset))
+        if not rows:
+            raise CommandError("No posts to serialize; generate some data first.")
+        count = len(rows)
+        rounds = options['rounds']
+
+        stock_time, stock = self._time(
+            rounds, lambda: JSONRenderer().render(PostSerializer(instances, many=True).data)
+        )
+        fast_time, fast = self._time(
+            rounds, lambda: FastJSONRenderer().render(post_rows.serialize_many(rows))
+        )
+        if stock != fast:
+            raise CommandError("Fast path output differs from PostSerializer output.")
+
+        self.stdout.write(f"{count} posts, best of {rounds} rounds (serialize + render, excluding queries)")
+        self.stdout.write(f"  PostSerializer + JSONRenderer:   {stock_time / count * 1e6:8.1f} us/item")
+        self.stdout.write(f"  post_rows + FastJSONRenderer:    {fast_time / count * 1e6:8.1f} us/item")
+        self.stdout.write(f"  speedup: {stock_time / fast_time:.1f}x")
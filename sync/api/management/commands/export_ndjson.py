@@ -0,0 +1,38 @@
+import gzip
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from ...ndjson import MODELS, MODELS_BY_LABEL, live_rows, records
+
+def open_stream(path, mode):
+    """``-`` is stdin/stdout; paths ending in ``.gz`` are gzip-compressed."""
+    if path == '-':
+        return (sys.stdin if 'r' in mode else sys.stdout).buffer
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+class Command(BaseCommand):
+    help = "Stream users, follows, groups, memberships, posts, comments and likes to an NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file; '-' for stdout, a .gz suffix compresses.")
+        parser.add_argument('--models', nargs='+', choices=sorted(MODELS_BY_LABEL), help="Export only these models.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        models = [model for model in MODELS if not options['models'] or model._meta.label_lower in options['models']]
+        stream = open_stream(options['path'], 'wb')
+        try:
+            for model in models:
+                count = 0
+                for line in records(live_rows(model).order_by('pk'), options['chunk_size']):
+                    stream.write(line)
+                    count += 1
+                self.stderr.write(f"{model._meta.label_lower}: {count} rows")
+        except BrokenPipeError:
+            raise CommandError("Output closed before the export finished.")
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+            else:
+                stream.flush()
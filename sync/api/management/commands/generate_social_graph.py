@@ -0,0 +1,229 @@
+import math
+import random
+import time
+from array import array
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import accumulate
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from ...counters import COUNTERS, recount
+from ...models import Comment, Follow, Group, GroupMembership, Like, Post, User
+from ...ndjson import explicit_timestamps
+from ...timeline import CELEBRITY_CACHE_KEY, rebuild_timeline
+from ... import graph, groupfeed, search, trending
+
+WORDS = (
+    'sync', 'morning', 'coffee', 'launch', 'weekend', 'music', 'travel', 'photo', 'update', 'python',
+    'django', 'release', 'team', 'design', 'garden', 'recipe', 'match', 'goal', 'city', 'night',
+    'project', 'idea', 'book', 'movie', 'run', 'trail', 'sunset', 'build', 'test', 'deploy',
+)
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-generate a synthetic social graph: power-law followers with celebrity accounts, "
+        "groups of very different sizes, and posts, likes and comments skewed towards popular authors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--likes', type=int, default=500000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--groups', type=int, default=200)
+        parser.add_argument('--avg-following', type=int, default=50, help="Mean accounts followed per user.")
+        parser.add_argument('--celebrities', type=int, default=10, help="Accounts followed by --celebrity-reach of users.")
+        parser.add_argument('--celebrity-reach', type=float, default=0.5)
+        parser.add_argument('--alpha', type=float, default=1.1, help="Exponent of the popularity power law.")
+        parser.add_argument('--days', type=int, default=30, help="Spread posts over this many days.")
+        parser.add_argument('--prefix', default='gen', help="Prefix of generated usernames and group names.")
+        parser.add_argument('--password', default='password', help="Password of every generated user.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skip-timelines', action='store_true', help="Leave home timelines to rebuild_timelines.")
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users named {options['prefix']}* already exist; pass another --prefix.")
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        started = time.perf_counter()
+
+        self.phase("users", self.create_users)
+        self.phase("follows", self.create_follows)
+        self.phase("groups", self.create_groups)
+        self.phase("memberships", self.create_memberships)
+        self.phase("posts", self.create_posts)
+        self.phase("likes", self.create_likes)
+        self.phase("comments", self.create_comments)
+        self.phase("stale counters", self.repair_counters)
+        self.phase("group activity", groupfeed.refresh_last_post_at)
+        cache.delete(CELEBRITY_CACHE_KEY)
+        graph.invalidate()
+        self.phase("trending", trending.rebuild)
+        self.phase("search index", search.rebuild)
+        if not options['skip_timelines']:
+            self.phase("timelines", self.rebuild_timelines)
+        self.stdout.write(f"Done in {time.perf_counter() - started:.1f}s")
+
+    def phase(self, label, func):
+        started = time.perf_counter()
+        count = func()
+        self.stdout.write(f"{label:>14}: {count:>10} rows in {time.perf_counter() - started:6.1f}s")
+
+    def insert(self, model, objects):
+        """Bulk-insert ``objects`` in batches and return the new primary keys in insertion order."""
+        last_pk = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        batch = []
+        with transaction.atomic():
+            for obj in objects:
+                batch.append(obj)
+                if len(batch) >= self.batch_size:
+                    model.objects.bulk_create(batch, ignore_conflicts=True)
+                    batch = []
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+        return array('q', model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True).iterator())
+
+    def sample_users(self, k):
+        return self.rng.choices(self.user_ids, cum_weights=self.user_cum, k=k)
+
+    def text(self, words):
+        return ' '.join(self.rng.choices(WORDS, k=words))
+
+    def create_users(self):
+        prefix, count = self.options['prefix'], self.options['users']
+        if count < 2:
+            raise CommandError("Generate at least two users.")
+        password = make_password(self.options['password'])
+        self.user_ids = self.insert(User, (
+            User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=password,
+                 first_name=self.rng.choice(WORDS).title())
+            for i in range(count)
+        ))
+        # Popularity falls off as rank ** -alpha; the first --celebrities users are the celebrities.
+        weights = [1 / (rank + 1) ** self.options['alpha'] for rank in range(len(self.user_ids))]
+        self.user_cum = array('d', accumulate(weights))
+        self.weight_by_user = dict(zip(self.user_ids, weights))
+        return len(self.user_ids)
+
+    def create_follows(self):
+        options = self.options
+        mean = options['avg_following']
+        celebrities = self.user_ids[:options['celebrities']]
+
+        def follows():
+            for follower in self.user_ids:
+                # Log-normal out-degree with the requested mean; in-degree follows the popularity power law.
+                degree = min(len(self.user_ids) - 1, int(self.rng.lognormvariate(math.log(max(mean, 1)) - 0.5, 1.0)))
+                followed = set(self.sample_users(degree))
+                followed.update(c for c in celebrities if self.rng.random() < options['celebrity_reach'])
+                followed.discard(follower)
+                for followed_id in followed:
+                    yield Follow(follower_id=follower, followed_id=followed_id)
+        return len(self.insert(Follow, follows()))
+
+    def create_groups(self):
+        prefix, count = self.options['prefix'], self.options['groups']
+        self.group_creators = self.sample_users(count)
+        self.group_ids = self.insert(Group, (
+            Group(name=f'{prefix}-group-{i}', description=self.text(8), creator_id=creator)
+            for i, creator in enumerate(self.group_creators)
+        ))
+        return len(self.group_ids)
+
+    def create_memberships(self):
+        # The largest group holds a third of all users; sizes fall off with the same power law.
+        largest = max(2, len(self.user_ids) // 3)
+        self.memberships = {}
+        objects = []
+        for rank, (group_id, creator) in enumerate(zip(self.group_ids, self.group_creators)):
+            size = max(2, int(largest / (rank + 1) ** self.options['alpha']))
+            members = set(self.rng.sample(self.user_ids, min(size, len(self.user_ids))))
+            members.add(creator)
+            for user_id in members:
+                self.memberships.setdefault(user_id, []).append(group_id)
+                objects.append(GroupMembership(user_id=user_id, group_id=group_id))
+        return len(self.insert(GroupMembership, objects))
+
+    def create_posts(self):
+        days = self.options['days']
+        count = self.options['posts']
+
+        def posts():
+            for offset in range(0, count, self.batch_size):
+                for author in self.sample_users(min(self.batch_size, count - offset)):
+                    # Recent days are busier than old ones.
+                    created_at = self.now - timedelta(days=days * self.rng.random() ** 2)
+                    groups = self.memberships.get(author)
+                    group = self.rng.choice(groups) if groups and self.rng.random() < 0.2 else None
+                    yield Post(
+                        user_id=author, group_id=group, title=self.text(3).capitalize(),
+                        content=self.text(20), created_at=created_at, updated_at=created_at,
+                    )
+
+        with explicit_timestamps(Post._meta.get_field('created_at'), Post._meta.get_field('updated_at')):
+            self.post_ids = self.insert(Post, posts())
+        # Likes and comments land on posts in proportion to their author's popularity.
+        posts = Post.objects.filter(pk__gte=self.post_ids[0] if self.post_ids else 0).order_by('pk')
+        weights, self.post_times = array('d'), array('d')
+        for author, created_at in posts.values_list('user_id', 'created_at').iterator():
+            weights.append(self.weight_by_user[author])
+            self.post_times.append(created_at.timestamp())
+        self.post_cum = array('d', accumulate(weights))
+        return len(self.post_ids)
+
+    def interactions(self, count, likers):
+        """
+        Yield ``(user_id, post_id, created_at)``: popular authors' posts, acted on
+        by users drawn by ``likers`` at a time between the post and now.
+        """
+        if not self.post_ids:
+            return
+        now = self.now.timestamp()
+        for offset in range(0, count, self.batch_size):
+            k = min(self.batch_size, count - offset)
+            posts = self.rng.choices(range(len(self.post_ids)), cum_weights=self.post_cum, k=k)
+            for user_id, index in zip(likers(k), posts):
+                # Most engagement comes soon after a post goes up.
+                posted = self.post_times[index]
+                at = posted + (now - posted) * self.rng.random() ** 3
+                yield user_id, self.post_ids[index], datetime.fromtimestamp(at, tz=dt_timezone.utc)
+
+    def create_likes(self):
+        def likes():
+            seen = set()
+            for user_id, post_id, created_at in self.interactions(
+                self.options['likes'], lambda k: self.rng.choices(self.user_ids, k=k),
+            ):
+                if (user_id, post_id) not in seen:
+                    seen.add((user_id, post_id))
+                    yield Like(user_id=user_id, post_id=post_id, created_at=created_at)
+
+        with explicit_timestamps(Like._meta.get_field('created_at')):
+            return len(self.insert(Like, likes()))
+
+    def create_comments(self):
+        with explicit_timestamps(Comment._meta.get_field('created_at')):
+            return len(self.insert(Comment, (
+                Comment(user_id=user_id, post_id=post_id, content=self.text(10), created_at=created_at)
+                for user_id, post_id, created_at in self.interactions(self.options['comments'], self.sample_users)
+            )))
+
+    def repair_counters(self):
+        # Bulk inserts skip the signals that maintain the denormalized counters.
+        return sum(
+            len(recount(model, field, source, fk, batch_size=self.batch_size))
+            for model, field, source, fk in COUNTERS
+        )
+
+    def rebuild_timelines(self):
+        # Committing per chunk of users rather than per user saves most of the fsyncs.
+        total = 0
+        for start in range(0, len(self.user_ids), 100):
+            with transaction.atomic():
+                total += sum(rebuild_timeline(user_id) for user_id in self.user_ids[start:start + 100])
+        return total
@@ -0,0 +1,122 @@
+import json
+import os
+import time
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+from ...counters import COUNTERS, recount
+from ...models import User
+from ...ndjson import explicit_timestamps, parse
+from ...timeline import CELEBRITY_CACHE_KEY, rebuild_timeline
+from ... import graph, groupfeed, search, trending
+from .export_ndjson import open_stream
+
+class Command(BaseCommand):
+    help = (
+        "Load an NDJSON export in batched bulk inserts, keeping primary keys. Foreign keys are checked "
+        "and counters, timelines, trending and search rebuilt once at the end; an interrupted import "
+        "resumes from its checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File written by export_ndjson; '-' for stdin, a .gz suffix decompresses.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--checkpoint', help="Progress file, by default PATH.progress. Delete it to start over.",
+        )
+        parser.add_argument('--skip-timelines', action='store_true', help="Leave home timelines to rebuild_timelines.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        self.checkpoint = options['checkpoint'] or (None if path == '-' else f'{path}.progress')
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+        self.done = self.read_checkpoint()
+        if self.done:
+            self.stderr.write(f"Resuming after line {self.done}")
+
+        stream = open_stream(path, 'rb')
+        self.models = set()
+        # Rows are committed batch by batch with foreign key checks off, like
+        # loaddata, and every imported table is checked once when all are in.
+        with connection.constraint_checks_disabled():
+            try:
+                self.load(stream)
+            finally:
+                if path != '-':
+                    stream.close()
+        tables = [model._meta.db_table for model in self.models]
+        try:
+            connection.check_constraints(table_names=tables)
+        except IntegrityError as e:
+            raise CommandError(f"Imported rows reference missing rows: {e}")
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), list(self.models)):
+                cursor.execute(sql)
+
+        self.repair(options['skip_timelines'])
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        self.stdout.write(f"Done in {time.perf_counter() - started:.1f}s")
+
+    def load(self, stream):
+        batch, model, last = [], None, self.done
+        for number, line in enumerate(stream, 1):
+            if number <= self.done or not line.strip():
+                continue
+            try:
+                obj = parse(line)
+            except (ValueError, KeyError, TypeError, ValidationError) as e:
+                self.flush(model, batch, last)
+                raise CommandError(f"Line {number}: {e}")
+            if batch and (type(obj) is not model or len(batch) >= self.batch_size):
+                self.flush(model, batch, last)
+                batch = []
+            model = type(obj)
+            batch.append(obj)
+            last = number
+        self.flush(model, batch, last)
+
+    def flush(self, model, batch, last):
+        if not batch:
+            return
+        timestamps = [
+            field for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+        ]
+        # Replaying a batch whose checkpoint was not written skips the rows already in.
+        with explicit_timestamps(*timestamps), transaction.atomic():
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+        self.models.add(model)
+        self.done = last
+        if self.checkpoint:
+            with open(self.checkpoint, 'w') as f:
+                json.dump({'line': last}, f)
+        self.stderr.write(f"{model._meta.label_lower}: through line {last}")
+
+    def read_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as f:
+            return json.load(f)['line']
+
+    def repair(self, skip_timelines):
+        # Bulk inserts skip the signals that maintain counters, caches and indexes.
+        stale = sum(len(recount(model, field, source, fk, batch_size=self.batch_size)) for model, field, source, fk in COUNTERS)
+        self.stderr.write(f"counters: {stale} repaired")
+        cache.delete(CELEBRITY_CACHE_KEY)
+        graph.invalidate()
+        groupfeed.refresh_last_post_at()
+        trending.rebuild()
+        self.stderr.write(f"search: {search.rebuild()} documents")
+        if skip_timelines:
+            return
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        last_pk = 0
+        while chunk := list(user_ids.filter(pk__gt=last_pk)[:100]):
+            with transaction.atomic():
+                for user_id in chunk:
+                    rebuild_timeline(user_id)
+            last_pk = chunk[-1]
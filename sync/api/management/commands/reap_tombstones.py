@@ -0,0 +1,35 @@
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from ...models import Comment, Group, Post
+from ...reaper import Reaper
+
+class Command(BaseCommand):
+    help = (
+        "Delete tombstoned groups, posts and comments with everything that depends on them, in batches. "
+        "Picks up tombstones whose background reaper task never ran or failed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.REAPER_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        totals = Counter()
+
+        def progress(model, action, count):
+            label = model._meta.label_lower
+            totals[label, action] += count
+            self.stdout.write(f"{label}: {action} {count} (total {totals[label, action]})")
+
+        reaper = Reaper(options['batch_size'], progress)
+        for model in (Group, Post, Comment):
+            tombstones = model.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at')
+            while pks := list(tombstones.values_list('pk', flat=True)[:options['batch_size']]):
+                for pk in pks:
+                    try:
+                        reaper.reap(model, [pk])
+                    except IntegrityError as e:
+                        raise CommandError(f"{model._meta.label_lower} {pk} gained a dependent while reaping: {e}")
+        deleted = sum(count for (_, action), count in totals.items() if action == 'deleted')
+        self.stdout.write(f"Deleted {deleted} rows")
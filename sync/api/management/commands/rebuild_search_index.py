@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from ...search import rebuild, reconcile
+
+class Command(BaseCommand):
+    help = "Rebuild every search document from posts, comments, groups and users, or repair the ones that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--reconcile', action='store_true',
+            help="Only fix missing, stale and orphaned documents; safe to run periodically.",
+        )
+
+    def handle(self, *args, **options):
+        if options['reconcile']:
+            self.stdout.write(f"Fixed {reconcile(options['batch_size'])} documents")
+        else:
+            self.stdout.write(f"Indexed {rebuild(options['batch_size'])} documents")
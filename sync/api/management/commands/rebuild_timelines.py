@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from ...models import User
+from ...timeline import rebuild_timeline
+
+class Command(BaseCommand):
+    help = "Rebuild materialized home timelines from the Follow and Post tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Users whose timelines should be rebuilt.")
+        parser.add_argument('--all', action='store_true', help="Rebuild every user's timeline.")
+
+    def handle(self, *args, **options):
+        if options['all']:
+            users = User.objects.all()
+        elif options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+        else:
+            raise CommandError("Pass one or more usernames or --all.")
+        for user_id, username in users.values_list('id', 'username').iterator():
+            count = rebuild_timeline(user_id)
+            self.stdout.write(f"{username}: {count} entries")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from ...likes import like_counts, reconcile
+
+class Command(BaseCommand):
+    help = "Recompute Post.likes_count from Like rows and fix any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        like_counts.flush()
+        fixed = reconcile(batch_size=options['batch_size'])
+        self.stdout.write(f"Fixed likes_count on {fixed} posts")
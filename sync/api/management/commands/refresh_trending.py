@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from ...trending import prune, rebuild
+
+class Command(BaseCommand):
+    help = "Prune expired rows from the trending table, or rebuild it from likes and comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Recompute every score from scratch.")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(f"Rebuilt {rebuild()} trending entries")
+        else:
+            self.stdout.write(f"Pruned {prune()} expired trending entries")
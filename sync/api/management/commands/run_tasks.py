@@ -0,0 +1,28 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ...tasks import run_pending
+
+class Command(BaseCommand):
+    help = "Run jobs queued with BACKGROUND_TASK_BACKEND = 'database' on a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.BACKGROUND_TASK_WORKERS)
+        parser.add_argument('--batch-size', type=int, default=settings.BACKGROUND_TASK_BATCH_SIZE)
+        parser.add_argument('--once', action='store_true', help="Exit once no job is due.")
+
+    def handle(self, *args, **options):
+        total = 0
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='sync-jobs') as executor:
+            try:
+                while True:
+                    claimed = run_pending(options['batch_size'], executor)
+                    total += claimed
+                    if not claimed:
+                        if options['once']:
+                            break
+                        time.sleep(settings.BACKGROUND_TASK_POLL_INTERVAL)
+            except KeyboardInterrupt:
+                pass
+        self.stdout.write(f"Ran {total} jobs")
@@ -0,0 +1,123 @@
+from time import perf_counter
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+from django.utils.decorators import sync_and_async_middleware
+from .admission import admission, route_class
+from .instrumentation import RequestTimings, current, request_metrics
+from .routers import pin_to_primary, replica_reads
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+def _finish(request):
+    user = getattr(request, 'user', None)
+    if request.method not in SAFE_METHODS and user is not None and user.is_authenticated:
+        pin_to_primary(user.pk)
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    """Allow replica reads for safe methods and pin writers to the primary afterwards."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = replica_reads.set(request.method in SAFE_METHODS)
+            try:
+                response = await get_response(request)
+            finally:
+                replica_reads.reset(token)
+            _finish(request)
+            return response
+    else:
+        def middleware(request):
+            token = replica_reads.set(request.method in SAFE_METHODS)
+            try:
+                response = get_response(request)
+            finally:
+                replica_reads.reset(token)
+            _finish(request)
+            return response
+    return middleware
+
+def _record(request, response, timings, total):
+    match = request.resolver_match
+    route = match.route if match is not None else 'unmatched'
+    request_metrics.observe(route, request.method, response.status_code, total, timings)
+    response['Server-Timing'] = timings.server_timing(total)
+    return response
+
+@sync_and_async_middleware
+def performance_middleware(get_response):
+    """Time queries, auth, serialization and rendering per request; report them in Server-Timing and /api/metrics/."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            timings = RequestTimings()
+            token = current.set(timings)
+            start = perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                current.reset(token)
+            return _record(request, response, timings, perf_counter() - start)
+    else:
+        def middleware(request):
+            timings = RequestTimings()
+            token = current.set(timings)
+            start = perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                current.reset(token)
+            return _record(request, response, timings, perf_counter() - start)
+    return middleware
+
+def _admission_route(request):
+    try:
+        view_name = resolve(request.path_info).view_name
+    except Resolver404:
+        return None, None
+    return view_name, route_class(view_name)
+
+def _overloaded():
+    response = JsonResponse({"error": "The server is overloaded, try again shortly."}, status=503)
+    response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+    return response
+
+def _release_when_sent(response, route):
+    """Hold the slot of a streamed response until the server closes it, whether or not the body was read."""
+    if not response.streaming:
+        admission.release(route)
+        return response
+    # close() runs each closer once, however often it is called.
+    response._resource_closers.append(lambda: admission.release(route))
+    return response
+
+@sync_and_async_middleware
+def admission_control_middleware(get_response):
+    """Shed load before any work is done: 503 with Retry-After when a route's class or cap is full."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            route, name = _admission_route(request)
+            if name is None:
+                return await get_response(request)
+            if not await admission.acquire_async(route, name):
+                return _overloaded()
+            try:
+                response = await get_response(request)
+            except BaseException:
+                admission.release(route)
+                raise
+            return _release_when_sent(response, route)
+    else:
+        def middleware(request):
+            route, name = _admission_route(request)
+            if name is None:
+                return get_response(request)
+            if not admission.acquire(route, name):
+                return _overloaded()
+            try:
+                response = get_response(request)
+            except BaseException:
+                admission.release(route)
+                raise
+            return _release_when_sent(response, route)
+    return middleware
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:22
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+COUNTERS = [
+    ('User', 'followers_count', 'Follow', 'followed'),
+    ('User', 'following_count', 'Follow', 'follower'),
+    ('User', 'posts_count', 'Post', 'user'),
+    ('Group', 'members_count', 'GroupMembership', 'group'),
+    ('Group', 'posts_count', 'Post', 'group'),
+    ('Post', 'comments_count', 'Comment', 'post'),
+]
+
+
+def backfill_counters(apps, schema_editor):
+    for model_name, field, source_name, fk in COUNTERS:
+        model = apps.get_model('api', model_name)
+        source = apps.get_model('api', source_name)
+        total = Subquery(
+            source.objects.filter(**{fk: OuterRef('pk')}).order_by()
+            .values(fk).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        )
+        model.objects.update(**{field: Coalesce(total, Value(0))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_trendingscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='members_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
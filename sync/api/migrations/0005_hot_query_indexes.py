@@ -0,0 +1,86 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:36
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    Like = apps.get_model('api', 'Like')
+    Post = apps.get_model('api', 'Post')
+    duplicates = (
+        Like.objects.order_by().values('user', 'post')
+        .annotate(copies=Count('pk'), keep=Min('pk')).filter(copies__gt=1)
+    )
+    posts = set()
+    for row in duplicates.iterator():
+        Like.objects.filter(user=row['user'], post=row['post']).exclude(pk=row['keep']).delete()
+        posts.add(row['post'])
+    total = Subquery(
+        Like.objects.filter(post=OuterRef('pk')).order_by()
+        .values('post').annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField(),
+    )
+    Post.objects.filter(pk__in=posts).update(likes_count=Coalesce(total, Value(0)))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='like',
+            unique_together={('user', 'post')},
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created_at', '-id'], name='comment_post_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['followed', '-created_at', '-id'], name='follow_followed_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', '-created_at', '-id'], name='follow_follower_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['-created_at', '-id'], name='group_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupmembership',
+            index=models.Index(fields=['group', 'date_joined', 'id'], name='membership_group_joined_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['post', '-created_at', '-id'], name='like_post_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='post_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='post_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-created_at', '-id'], name='post_group_recent_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='timelineentry',
+            name='timeline_user_recent_idx',
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['followers_count'], name='user_followers_count_idx'),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:40
+
+from django.db import migrations, models
+
+
+SOURCES = [
+    ('post', 'Post', ('title',), ('content',)),
+    ('comment', 'Comment', (), ('content',)),
+    ('group', 'Group', ('name',), ('description',)),
+    ('user', 'User', ('username',), ('first_name', 'last_name')),
+]
+
+SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE api_searchindex USING fts5("
+    "kind UNINDEXED, object_id UNINDEXED, title, body, "
+    "content='api_searchdocument', content_rowid='id', prefix='2 3')",
+    "INSERT INTO api_searchindex(api_searchindex, rank) VALUES ('rank', 'bm25(0, 0, 10.0, 1.0)')",
+    "CREATE TRIGGER api_searchdocument_ai AFTER INSERT ON api_searchdocument BEGIN "
+    "INSERT INTO api_searchindex(rowid, kind, object_id, title, body) "
+    "VALUES (new.id, new.kind, new.object_id, new.title, new.body); END",
+    "CREATE TRIGGER api_searchdocument_ad AFTER DELETE ON api_searchdocument BEGIN "
+    "INSERT INTO api_searchindex(api_searchindex, rowid, kind, object_id, title, body) "
+    "VALUES ('delete', old.id, old.kind, old.object_id, old.title, old.body); END",
+    "CREATE TRIGGER api_searchdocument_au AFTER UPDATE ON api_searchdocument BEGIN "
+    "INSERT INTO api_searchindex(api_searchindex, rowid, kind, object_id, title, body) "
+    "VALUES ('delete', old.id, old.kind, old.object_id, old.title, old.body); "
+    "INSERT INTO api_searchindex(rowid, kind, object_id, title, body) "
+    "VALUES (new.id, new.kind, new.object_id, new.title, new.body); END",
+    "INSERT INTO api_searchindex(api_searchindex) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS api_searchdocument_ai",
+    "DROP TRIGGER IF EXISTS api_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS api_searchdocument_au",
+    "DROP TABLE IF EXISTS api_searchindex",
+]
+
+POSTGRESQL_INDEX = [
+    "ALTER TABLE api_searchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED",
+    "CREATE INDEX api_searchdocument_vector_idx ON api_searchdocument USING GIN (search_vector)",
+]
+
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS api_searchdocument_vector_idx",
+    "ALTER TABLE api_searchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def backfill_documents(apps, schema_editor):
+    SearchDocument = apps.get_model('api', 'SearchDocument')
+    for kind, model_name, title_fields, body_fields in SOURCES:
+        model = apps.get_model('api', model_name)
+        batch = []
+        for row in model.objects.values('pk', *title_fields, *body_fields).iterator(chunk_size=2000):
+            batch.append(SearchDocument(
+                kind=kind, object_id=row['pk'],
+                title=' '.join(filter(None, (row[field] for field in title_fields))),
+                body=' '.join(filter(None, (row[field] for field in body_fields))),
+            ))
+            if len(batch) >= 2000:
+                SearchDocument.objects.bulk_create(batch)
+                batch = []
+        SearchDocument.objects.bulk_create(batch)
+
+
+def create_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_INDEX, 'postgresql': POSTGRESQL_INDEX}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Post'), ('comment', 'Comment'), ('group', 'Group'), ('user', 'User')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(blank=True, max_length=150)),
+                ('body', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:21
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_last_post_at(apps, schema_editor):
+    Group = apps.get_model('api', 'Group')
+    Post = apps.get_model('api', 'Post')
+    newest = Post.objects.filter(group=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+    Group.objects.update(last_post_at=Subquery(newest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='last_post_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_last_post_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:49
+
+from django.db import migrations, models
+
+
+# SQLite alters the column by copying the table, which drops the triggers that
+# keep api_searchindex in sync; the copy keeps every id, so the index stays valid.
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER api_searchdocument_ai AFTER INSERT ON api_searchdocument BEGIN "
+    "INSERT INTO api_searchindex(rowid, kind, object_id, title, body) "
+    "VALUES (new.id, new.kind, new.object_id, new.title, new.body); END",
+    "CREATE TRIGGER api_searchdocument_ad AFTER DELETE ON api_searchdocument BEGIN "
+    "INSERT INTO api_searchindex(api_searchindex, rowid, kind, object_id, title, body) "
+    "VALUES ('delete', old.id, old.kind, old.object_id, old.title, old.body); END",
+    "CREATE TRIGGER api_searchdocument_au AFTER UPDATE ON api_searchdocument BEGIN "
+    "INSERT INTO api_searchindex(api_searchindex, rowid, kind, object_id, title, body) "
+    "VALUES ('delete', old.id, old.kind, old.object_id, old.title, old.body); "
+    "INSERT INTO api_searchindex(rowid, kind, object_id, title, body) "
+    "VALUES (new.id, new.kind, new.object_id, new.title, new.body); END",
+]
+
+SQLITE_DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS api_searchdocument_ai",
+    "DROP TRIGGER IF EXISTS api_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS api_searchdocument_au",
+]
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_TRIGGERS:
+            schema_editor.execute(sql)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_DROP_TRIGGERS:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_revoked_tokens'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.AlterField(
+            model_name='searchdocument',
+            name='object_id',
+            field=models.PositiveBigIntegerField(),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
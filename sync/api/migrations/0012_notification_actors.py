@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_actors(apps, schema_editor):
+    # Only the latest actor of an unread row is known; the others may be counted again.
+    Notification = apps.get_model('api', 'Notification')
+    NotificationActor = apps.get_model('api', 'NotificationActor')
+    unread = Notification.objects.filter(read_at__isnull=True).values_list('pk', 'actor_id')
+    NotificationActor.objects.bulk_create(
+        [NotificationActor(notification_id=pk, actor_id=actor_id) for pk, actor_id in unread.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_search_document_bigint_object_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actors', to='api.notification')),
+            ],
+            options={
+                'unique_together': {('notification', 'actor')},
+            },
+        ),
+        migrations.RunPython(backfill_actors, migrations.RunPython.noop),
+    ]
@@ -1,18 +1,86 @@
 from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import Signal
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    # Counter columns are maintained with F() updates, and deleted_at only by
+    # tombstone(), so a full save() of a possibly stale instance must not write them back.
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields and field.name != 'deleted_at'
+            ]
+        super().save(*args, **kwargs)
+
+class LiveManager(models.Manager):
+    """Default manager of tombstoned models: deleted rows disappear from every query at once."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+# Sent by User.close() once the account is closed.
+account_closed = Signal()
+
+def _update_once(instance, condition, **changes):
+    """
+    Write ``changes`` if the row still matches ``condition``, and only then run
+    the ``post_save`` receivers a ``save(update_fields=...)`` would have; they
+    lower counters, drop search documents and queue the reaper, so concurrent
+    deletes must not both get there. Returns whether this call made the change.
+    """
+    rows = type(instance)._base_manager.filter(pk=instance.pk, **condition)
+    if not rows.update(**changes):
+        return False
+    for field, value in changes.items():
+        setattr(instance, field, value)
+    post_save.send(
+        sender=type(instance), instance=instance, created=False,
+        update_fields=frozenset(changes), raw=False, using=rows.db,
+    )
+    return True
+
+class TombstoneMixin:
+    # Deleting sets deleted_at; api.reaper removes the row and its dependents
+    # later in small batches. ``all_objects`` still sees rows awaiting the reaper.
+    def tombstone(self):
+        return _update_once(self, {'deleted_at__isnull': True}, deleted_at=timezone.now())
+
+class User(CounterFieldsMixin, AbstractUser):
     email = models.EmailField(unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    posts_count = models.PositiveIntegerField(default=0)
 
+    counter_fields = ('followers_count', 'following_count', 'posts_count')
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['email']
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['followers_count'], name='user_followers_count_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
-class Post(models.Model):
+    def close(self):
+        """
+        Close the account: it can no longer sign in or authenticate at once, and
+        api.reaper deletes it with everything it made later, in small batches.
+        """
+        if not _update_once(self, {'is_active': True}, is_active=False):
+            return False
+        account_closed.send(sender=type(self), instance=self)
+        return True
+
+class Post(TombstoneMixin, CounterFieldsMixin, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     group = models.ForeignKey('Group', on_delete=models.CASCADE, null=True, blank=True, related_name='posts')
     title = models.CharField(max_length=100)
@@ -20,17 +88,72 @@ class Post(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     likes_count = models.IntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    counter_fields = ('likes_count', 'comments_count')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='post_recent_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='post_user_recent_idx'),
+            models.Index(fields=['group', '-created_at', '-id'], name='post_group_recent_idx'),
+            models.Index(fields=['deleted_at'], name='post_tombstone_idx', condition=models.Q(deleted_at__isnull=False)),
+        ]
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_recent_idx'),
+        ]
+
+class TrendingScore(models.Model):
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-post'], name='trending_rank_idx'),
+            models.Index(fields=['created_at'], name='trending_created_idx'),
+        ]
 
 class Like(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
-class Comment(models.Model):
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['post', '-created_at', '-id'], name='like_post_recent_idx'),
+        ]
+
+class Comment(TombstoneMixin, CounterFieldsMixin, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', '-created_at', '-id'], name='comment_post_recent_idx'),
+            models.Index(fields=['deleted_at'], name='comment_tombstone_idx', condition=models.Q(deleted_at__isnull=False)),
+        ]
 
 class Follow(models.Model):
     follower = models.ForeignKey(User, related_name='following', on_delete=models.CASCADE)
@@ -39,16 +162,36 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('follower', 'followed')
+        indexes = [
+            models.Index(fields=['followed', '-created_at', '-id'], name='follow_followed_recent_idx'),
+            models.Index(fields=['follower', '-created_at', '-id'], name='follow_follower_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.follower.username} follows {self.followed.username}"
 
-class Group(models.Model):
+class Group(TombstoneMixin, CounterFieldsMixin, models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField()
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name="created_groups")
     members = models.ManyToManyField(User, through='GroupMembership', related_name="joined_groups")
     created_at = models.DateTimeField(auto_now_add=True)
+    members_count = models.PositiveIntegerField(default=0)
+    posts_count = models.PositiveIntegerField(default=0)
+    # Creation time of the newest post ever made in the group; deletes leave it as is.
+    last_post_at = models.DateTimeField(null=True, blank=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    counter_fields = ('members_count', 'posts_count')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='group_recent_idx'),
+            models.Index(fields=['deleted_at'], name='group_tombstone_idx', condition=models.Q(deleted_at__isnull=False)),
+        ]
 
     def __str__(self):
         return self.name
@@ -60,6 +203,94 @@ class GroupMembership(models.Model):
 
     class Meta:
         unique_together = ('user', 'group')
+        indexes = [
+            models.Index(fields=['group', 'date_joined', 'id'], name='membership_group_joined_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} in {self.group.name}"
+
+class SearchDocument(models.Model):
+    """
+    Searchable text of a post, comment, group or user.
+
+    The full-text index over it is created by migration: an external-content
+    FTS5 table kept in sync by triggers on SQLite, and a generated ``tsvector``
+    column with a GIN index on PostgreSQL.
+    """
+    POST, COMMENT, GROUP, USER = 'post', 'comment', 'group', 'user'
+    KIND_CHOICES = [(POST, 'Post'), (COMMENT, 'Comment'), (GROUP, 'Group'), (USER, 'User')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=150, blank=True)
+    body = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+class Notification(models.Model):
+    """
+    Something that happened to the recipient's content or account.
+
+    Unread notifications about the same target are coalesced: further likes on a
+    post bump ``actor_count`` and ``actor`` (the most recent actor) on one row.
+    The actors already counted are kept as ``NotificationActor`` rows, so one
+    who likes, unlikes and likes again is counted once.
+    """
+    LIKE, COMMENT, FOLLOW, JOIN = 'like', 'comment', 'follow', 'join'
+    VERB_CHOICES = [(LIKE, 'Like'), (COMMENT, 'Comment'), (FOLLOW, 'Follow'), (JOIN, 'Join')]
+
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    verb = models.CharField(max_length=10, choices=VERB_CHOICES)
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    actor_count = models.PositiveIntegerField(default=1)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', '-updated_at', '-id'], name='notification_recent_idx'),
+            models.Index(
+                fields=['recipient', 'verb', 'post', 'group'], name='notification_unread_idx',
+                condition=models.Q(read_at__isnull=True),
+            ),
+        ]
+
+class NotificationActor(models.Model):
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actors')
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = ('notification', 'actor')
+
+class RevokedToken(models.Model):
+    """A JWT revoked before it expires; rows are pruned once ``expires_at`` passes."""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='revoked_token_expiry_idx'),
+            models.Index(fields=['revoked_at'], name='revoked_token_recent_idx'),
+        ]
+
+class Job(models.Model):
+    """A deferred call stored for ``manage.py run_tasks`` when ``BACKGROUND_TASK_BACKEND = 'database'``."""
+    func = models.CharField(max_length=200)
+    args = models.JSONField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    token = models.CharField(max_length=32, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_at', 'id'], name='job_due_idx'),
+            models.Index(fields=['token'], name='job_token_idx'),
+        ]
@@ -0,0 +1,129 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Group, Notification, NotificationActor, Post, User
+from .tasks import defer
+
+logger = logging.getLogger(__name__)
+
+class NotificationBuffer:
+    """
+    Collects notification events after commit and hands them to the task queue in batches.
+
+    Recording an event is a list append, so the like, comment, follow and join
+    requests that cause them do no extra queries. Each batch becomes one
+    ``deliver`` task, which coalesces the events and writes them in bulk.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._timer = None
+
+    def add(self, verb, actor_id, post_id=None, group_id=None, recipient_id=None):
+        """Queue an event; when ``recipient_id`` is omitted it is the post's author or the group's creator."""
+        event = [verb, actor_id, post_id, group_id, recipient_id]
+        transaction.on_commit(lambda: self._add(event))
+
+    def _add(self, event):
+        with self._lock:
+            self._pending.append(event)
+            full = len(self._pending) >= settings.NOTIFICATION_MAX_PENDING
+            if self._timer is None and not full:
+                self._timer = threading.Timer(settings.NOTIFICATION_FLUSH_INTERVAL, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+        if full or getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            self.flush()
+
+    def _flush_in_background(self):
+        close_old_connections()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Queueing buffered notifications failed")
+        finally:
+            close_old_connections()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if pending:
+            defer(deliver, pending)
+        return len(pending)
+
+pending_notifications = NotificationBuffer()
+atexit.register(pending_notifications.flush)
+
+def deliver(events):
+    """Coalesce ``events`` by recipient and target into existing unread rows, creating the rest in one insert."""
+    # An actor or recipient may have been deleted since the event was queued.
+    users = {actor for _, actor, _, _, _ in events} | {recipient for *_, recipient in events if recipient is not None}
+    users = set(User.objects.filter(pk__in=users).values_list('pk', flat=True))
+    events = [event for event in events if event[1] in users and (event[4] is None or event[4] in users)]
+    authors = dict(
+        Post.objects.filter(pk__in={post for _, _, post, _, recipient in events if post and recipient is None})
+        .values_list('pk', 'user_id')
+    )
+    creators = dict(
+        Group.objects.filter(pk__in={group for _, _, _, group, recipient in events if group and recipient is None})
+        .values_list('pk', 'creator_id')
+    )
+    actors = defaultdict(list)
+    for verb, actor_id, post_id, group_id, recipient_id in events:
+        if recipient_id is None:
+            recipient_id = authors.get(post_id) if post_id else creators.get(group_id)
+        if recipient_id is None or recipient_id == actor_id:
+            continue
+        key = (recipient_id, verb, post_id, group_id)
+        if actor_id in actors[key]:
+            actors[key].remove(actor_id)
+        actors[key].append(actor_id)
+    if not actors:
+        return 0
+    recipients = {key[0] for key in actors}
+    posts = {key[2] for key in actors if key[2]}
+    groups = {key[3] for key in actors if key[3]}
+    unread = {
+        (notification.recipient_id, notification.verb, notification.post_id, notification.group_id): notification
+        for notification in Notification.objects.filter(
+            Q(post_id__in=posts) | Q(group_id__in=groups) | Q(verb=Notification.FOLLOW),
+            recipient_id__in=recipients, read_at__isnull=True,
+        )
+        if (notification.recipient_id, notification.verb, notification.post_id, notification.group_id) in actors
+    }
+    counted = set(
+        NotificationActor.objects.filter(
+            notification__in=unread.values(), actor_id__in={actor for key in unread for actor in actors[key]},
+        ).values_list('notification_id', 'actor_id')
+    )
+    now = timezone.now()
+    updated, seen = [], []
+    for key, notification in unread.items():
+        new_actors = actors.pop(key)
+        notification.actor_id = new_actors[-1]
+        fresh = [actor for actor in new_actors if (notification.pk, actor) not in counted]
+        notification.actor_count += len(fresh)
+        notification.updated_at = now
+        updated.append(notification)
+        seen.extend(NotificationActor(notification=notification, actor_id=actor) for actor in fresh)
+    Notification.objects.bulk_update(updated, ['actor', 'actor_count', 'updated_at'])
+    created = Notification.objects.bulk_create([
+        Notification(
+            recipient_id=recipient_id, verb=verb, post_id=post_id, group_id=group_id,
+            actor_id=new_actors[-1], actor_count=len(new_actors),
+        )
+        for (recipient_id, verb, post_id, group_id), new_actors in actors.items()
+    ])
+    for notification, new_actors in zip(created, actors.values()):
+        seen.extend(NotificationActor(notification=notification, actor_id=actor) for actor in new_actors)
+    NotificationActor.objects.bulk_create(seen, ignore_conflicts=True)
+    return len(updated) + len(actors)
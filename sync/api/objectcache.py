@@ -0,0 +1,110 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+from .routers import primary_reads
+
+class ObjectCache:
+    """
+    Serialized representations cached per ``(model, pk, version)``.
+
+    Every object has a version counter in the shared cache that signal handlers
+    bump on save, delete and counter updates. A cached representation also
+    records the objects it embeds (a post embeds its author), and the ETag is
+    built from all of their versions, so a conditional GET can be answered with
+    a 304 from the cache alone.
+    """
+
+    def _label(self, model):
+        return model._meta.label_lower
+
+    def _version_key(self, label, pk):
+        return f'objcache:ver:{label}:{pk}'
+
+    def bump(self, model, pk):
+        key = self._version_key(self._label(model), pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Seed from the clock so a version lost to eviction is never reused.
+            cache.set(key, time.time_ns(), None)
+
+    def version(self, model, pk):
+        return self._versions([(self._label(model), pk)])[0]
+
+    def bump_many(self, model, pks):
+        for pk in pks:
+            self.bump(model, pk)
+
+    def lookup(self, model, field, value):
+        """Return the cached pk for a unique lookup such as a username, if known."""
+        return cache.get(f'objcache:key:{self._label(model)}:{field}:{value}')
+
+    def remember(self, model, field, value, pk):
+        cache.set(f'objcache:key:{self._label(model)}:{field}:{value}', pk, settings.OBJECT_CACHE_TIMEOUT)
+
+    def _versions(self, refs):
+        keys = [self._version_key(label, pk) for label, pk in refs]
+        found = cache.get_many(keys)
+        for key in keys:
+            if key not in found:
+                cache.add(key, time.time_ns(), None)
+                found[key] = cache.get(key)
+        return [found[key] for key in keys]
+
+    def _etag(self, versions):
+        return '"' + '-'.join(str(version) for version in versions) + '"'
+
+    def _matches(self, request, etag):
+        header = request.META.get('HTTP_IF_NONE_MATCH', '')
+        return etag in [tag.strip().removeprefix('W/') for tag in header.split(',')]
+
+    def respond(self, request, model, pk, build, dependencies=None, extend=None, vary=None):
+        """
+        Answer a GET for ``model``/``pk`` from the cache.
+
+        ``build()`` returns the serialized data on a miss, ``dependencies(data)``
+        lists the ``(model, pk)`` pairs embedded in it, and ``extend(data)`` adds
+        per-request fields that are not cached. ``vary`` lists the ``(model, pk)``
+        pairs those fields depend on, such as the viewer; their versions go into
+        the ETag but not into the cache key.
+        """
+        label = self._label(model)
+        deps_key = f'objcache:deps:{label}:{pk}'
+        vary = [(self._label(vary_model), vary_pk) for vary_model, vary_pk in (vary or [])]
+        dependencies_known = cache.get(deps_key)
+        if dependencies_known is not None:
+            refs = [(label, pk)] + dependencies_known
+            versions = self._versions(refs + vary)
+            etag, tag = self._etag(versions[:len(refs)]), self._etag(versions)
+            if self._matches(request, tag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': tag})
+            data = cache.get(f'objcache:rep:{label}:{pk}:{etag}')
+            if data is not None:
+                return self._ok(data, tag, extend)
+        # Read the versions before building so a concurrent write can only make
+        # the cached entry unreachable, never mislabel stale data as current.
+        # Build from the primary: a lagging replica's copy stored under the
+        # current version would be served to the writer who just changed it.
+        refs = dependencies_known or []
+        versions = self._versions([(label, pk)] + refs + vary)
+        with primary_reads():
+            data = build()
+        built = [(self._label(dep_model), dep_pk) for dep_model, dep_pk in (dependencies(data) if dependencies else [])]
+        if built != refs:
+            # The embedded objects' versions were not read before this build:
+            # remember them for the next one and serve this one uncached.
+            cache.set(deps_key, built, settings.OBJECT_CACHE_TIMEOUT)
+            return self._ok(data, None, extend)
+        etag, tag = self._etag(versions[:1 + len(refs)]), self._etag(versions)
+        cache.set(deps_key, refs, settings.OBJECT_CACHE_TIMEOUT)
+        cache.set(f'objcache:rep:{label}:{pk}:{etag}', data, settings.OBJECT_CACHE_TIMEOUT)
+        return self._ok(data, tag, extend)
+
+    def _ok(self, data, etag, extend):
+        if extend is not None:
+            data = extend(dict(data))
+        return Response(data, headers={'ETag': etag} if etag else None)
+
+object_cache = ObjectCache()
@@ -0,0 +1,200 @@
+import asyncio
+import base64
+import heapq
+import json
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a unique ordering such as ``(created_at, id)``.
+
+    Each page is a range scan from the previous page's last row, so it costs the
+    same at any depth and never runs a COUNT. Requests that pass ``?page=`` are
+    served by ``PageNumberPagination`` for older clients.
+    """
+    page_size = 10
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+    page_query_param = 'page'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        if self.page_query_param in request.query_params:
+            self.legacy = PageNumberPagination()
+            self.legacy.page_size = self.page_size
+            return self.legacy.paginate_queryset(queryset.order_by(*self.ordering), request, view)
+        self.legacy = None
+
+        values, reverse = self.decode_cursor(request)
+        rows = self.fetch(self._window(queryset, values, reverse), self.page_size + 1)
+        return self._set_page(rows, values, reverse)
+
+    def _window(self, queryset, values, reverse):
+        ordering = self._ordering(reverse)
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._after(ordering, values))
+        return queryset
+
+    def _set_page(self, rows, values, reverse):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = rows
+        return rows
+
+    def fetch(self, queryset, limit):
+        return list(queryset[:limit])
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, row, reverse):
+        values = []
+        for name in self._field_names():
+            value = self._row_value(row, name)
+            values.append(value.isoformat() if isinstance(value, datetime) else value)
+        payload = json.dumps({'v': values, 'r': int(reverse)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            names = self._field_names()
+            if len(payload['v']) != len(names):
+                raise ValueError
+            values = [
+                self.model._meta.get_field(name).to_python(value)
+                for name, value in zip(names, payload['v'])
+            ]
+            return values, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def _ordering(self, reverse):
+        if not reverse:
+            return self.ordering
+        return tuple(field[1:] if field.startswith('-') else '-' + field for field in self.ordering)
+
+    def _row_value(self, row, name):
+        if isinstance(row, dict):
+            return row[name]
+        return getattr(row, self.model._meta.get_field(name).attname)
+
+    def _after(self, ordering, values):
+        query = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {
+                prior.lstrip('-'): value
+                for prior, value in zip(ordering[:index], values[:index])
+            }
+            query |= Q(**equal, **{f'{name}__{lookup}': values[index]})
+        return query
+
+class MergedKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination over several sources merged in order, for pages that no
+    single index can produce.
+
+    Subclasses set ``model`` and implement ``sources(values, reverse)``, which
+    returns ``(queryset, prefix)`` pairs of windowed ``.values()`` querysets; the
+    prefix is stripped from each row's keys so all sources share one shape. The
+    ordering must run in a single direction. ``apaginate`` fetches the sources
+    concurrently on worker threads for async views and does not serve ``?page=``.
+    """
+    model = None
+
+    def sources(self, values, reverse):
+        raise NotImplementedError
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_query_param in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.request, self.legacy = request, None
+        values, reverse = self.decode_cursor(request)
+        batches = [self._fetch_source(source, prefix) for source, prefix in self.sources(values, reverse)]
+        return self._set_page(self._merge(batches, reverse), values, reverse)
+
+    async def apaginate(self, request):
+        self.request, self.legacy = request, None
+        values, reverse = self.decode_cursor(request)
+        in_thread = sync_to_async(self._in_thread, thread_sensitive=False)
+        sources = await in_thread(self.sources, values, reverse)
+        batches = await asyncio.gather(*(
+            in_thread(self._fetch_source, source, prefix) for source, prefix in sources
+        ))
+        return self._set_page(self._merge(batches, reverse), values, reverse)
+
+    def _in_thread(self, func, *args):
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    def _fetch_source(self, queryset, prefix):
+        rows = self.fetch(queryset, self.page_size + 1)
+        if not prefix:
+            return rows
+        return [{key[len(prefix):]: value for key, value in row.items()} for row in rows]
+
+    def _merge(self, batches, reverse):
+        names = self._field_names()
+
+        def key(row):
+            return tuple(self._row_value(row, name) for name in names)
+
+        rows, seen = [], set()
+        descending = self._ordering(reverse)[0].startswith('-')
+        for row in heapq.merge(*batches, key=key, reverse=descending):
+            if key(row) in seen:
+                continue
+            seen.add(key(row))
+            rows.append(row)
+            if len(rows) > self.page_size:
+                break
+        return rows
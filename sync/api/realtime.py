@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+def timeline_channel(user_id):
+    return f'timeline:{user_id}'
+
+def author_channel(user_id):
+    return f'author:{user_id}'
+
+def post_channel(post_id):
+    return f'post:{post_id}'
+
+def frame(event, data):
+    """Encode one server-sent event; it is built once per publish, not per subscriber."""
+    return f"event: {event}\ndata: {json.dumps(data, cls=JSONEncoder, separators=(',', ':'))}\n\n"
+
+class Subscription:
+    """One client's channels and a bounded queue of frames, filled on its event loop."""
+
+    def __init__(self, channels, loop, max_size):
+        self.channels = channels
+        self.loop = loop
+        self.queue = asyncio.Queue(max_size)
+        self.dropped = 0
+
+    def _put(self, payload):
+        if self.queue.full():
+            # A client that cannot keep up loses its oldest frames, not the worker's memory.
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(payload)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+class InProcessBroker:
+    """
+    Pub/sub within one process.
+
+    ``publish`` may be called from any thread (views, background tasks, the
+    like-count flusher); frames are handed to each subscriber's event loop with
+    ``call_soon_threadsafe``. Idle subscribers cost one queue and one set entry
+    per channel, with no thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = defaultdict(set)
+
+    def publish(self, channel, payload):
+        self._deliver(channel, payload)
+
+    def publish_many(self, channels, payload):
+        for channel in channels:
+            self._deliver(channel, payload)
+
+    def _deliver(self, channel, payload):
+        with self._lock:
+            subscriptions = list(self._channels.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, payload)
+            except RuntimeError:
+                pass
+
+    def _add(self, subscription):
+        with self._lock:
+            opened = [channel for channel in subscription.channels if not self._channels.get(channel)]
+            for channel in subscription.channels:
+                self._channels[channel].add(subscription)
+        return opened
+
+    def _remove(self, subscription):
+        closed = []
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[channel]
+                    closed.append(channel)
+        return closed
+
+    async def subscribe(self, channels):
+        subscription = Subscription(list(channels), asyncio.get_running_loop(), settings.REALTIME_QUEUE_SIZE)
+        self._add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        self._remove(subscription)
+
+class RedisBroker(InProcessBroker):
+    """
+    Pub/sub across workers through Redis (requires the ``redis`` package).
+
+    Publishing is a Redis PUBLISH (pipelined for fan-out). Each worker holds one
+    pub/sub connection, subscribed only to channels that have a local client,
+    and hands incoming frames to local subscribers like ``InProcessBroker``.
+    """
+    prefix = 'sync:'
+
+    def __init__(self):
+        super().__init__()
+        import redis
+        self._client = redis.Redis.from_url(settings.REALTIME_REDIS_URL)
+        self._pubsub = None
+        self._listener = None
+
+    def publish(self, channel, payload):
+        self._client.publish(self.prefix + channel, payload)
+
+    def publish_many(self, channels, payload):
+        pipeline = self._client.pipeline(transaction=False)
+        for channel in channels:
+            pipeline.publish(self.prefix + channel, payload)
+        pipeline.execute()
+
+    async def subscribe(self, channels):
+        subscription = Subscription(list(channels), asyncio.get_running_loop(), settings.REALTIME_QUEUE_SIZE)
+        opened = self._add(subscription)
+        if opened:
+            if self._pubsub is None:
+                import redis.asyncio
+                self._pubsub = redis.asyncio.Redis.from_url(settings.REALTIME_REDIS_URL).pubsub()
+            await self._pubsub.subscribe(*(self.prefix + channel for channel in opened))
+            if self._listener is None or self._listener.done():
+                self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        closed = self._remove(subscription)
+        if closed and self._pubsub is not None:
+            await self._pubsub.unsubscribe(*(self.prefix + channel for channel in closed))
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception:
+                logger.exception("Redis pub/sub listener failed; retrying")
+                await asyncio.sleep(1)
+                continue
+            if message and message['type'] == 'message':
+                channel = message['channel'].decode()[len(self.prefix):]
+                self._deliver(channel, message['data'].decode())
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.REALTIME_BROKER)()
+    return _broker
+
+def publish(channel, event, data):
+    try:
+        get_broker().publish(channel, frame(event, data))
+    except Exception:
+        logger.exception("Publishing %s to %s failed", event, channel)
+
+def publish_many(channels, event, data):
+    if not channels:
+        return
+    try:
+        get_broker().publish_many(channels, frame(event, data))
+    except Exception:
+        logger.exception("Publishing %s to %d channels failed", event, len(channels))
+
+def publish_comment(comment_id):
+    from .fastpath import comment_rows
+    from .models import Comment
+    row = comment_rows.values(Comment.objects.filter(pk=comment_id)).first()
+    if row is not None:
+        publish(post_channel(row['post']), 'comment', comment_rows.serialize(row))
+
+def publish_like_counts(post_ids):
+    from .models import Post
+    for post_id, likes_count in Post.objects.filter(pk__in=post_ids).values_list('pk', 'likes_count'):
+        publish(post_channel(post_id), 'likes', {'post': post_id, 'likes_count': likes_count})
@@ -0,0 +1,116 @@
+import logging
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, models, router, transaction
+from django.db.models.deletion import get_candidate_relations_to_delete
+from django.utils import timezone
+from .counters import COUNTERS, actual_count
+from .models import SearchDocument, User
+from .objectcache import object_cache
+from . import graph, search
+
+logger = logging.getLogger(__name__)
+
+def tombstoned(update_fields):
+    return update_fields is not None and 'deleted_at' in update_fields
+
+def _has_tombstone(model):
+    return any(field.name == 'deleted_at' for field in model._meta.concrete_fields)
+
+def _batches(queryset, batch_size):
+    # Every batch is hidden or deleted before the next is read, so the same
+    # query keeps returning the next rows.
+    while pks := list(queryset.values_list('pk', flat=True)[:batch_size]):
+        yield pks
+
+def _log_progress(model, action, count):
+    logger.info("Reaper %s %d %s rows", action, count, model._meta.label_lower)
+
+class Reaper:
+    """
+    Deletes tombstoned rows and everything that cascades from them in batches.
+
+    Dependents are found the way ``Collector`` finds them, but each batch is
+    hidden (when its model has a tombstone) and deleted in its own short
+    transaction, so a post with 500k likes never holds locks for longer than
+    one batch. Counters that count the deleted rows are recounted per batch.
+    """
+
+    def __init__(self, batch_size=None, progress=_log_progress):
+        self.batch_size = batch_size or settings.REAPER_BATCH_SIZE
+        self.progress = progress
+
+    def reap(self, model, pks):
+        for relation in get_candidate_relations_to_delete(model._meta):
+            if relation.on_delete is not models.CASCADE:
+                continue
+            related = relation.related_model
+            rows = related._base_manager.filter(**{f'{relation.field.name}__in': pks}).order_by('pk')
+            if _has_tombstone(related):
+                for batch in _batches(rows.filter(deleted_at__isnull=True), self.batch_size):
+                    self.hide(related, batch)
+            for batch in _batches(rows, self.batch_size):
+                self.reap(related, batch)
+        self.delete(model, pks)
+
+    def hide(self, model, pks):
+        parents = self._counted_parents(model, pks)
+        with transaction.atomic(using=router.db_for_write(model)):
+            model._base_manager.filter(pk__in=pks).update(deleted_at=timezone.now())
+            self._forget(model, pks)
+            self._recount(parents)
+        self.progress(model, 'hid', len(pks))
+
+    def delete(self, model, pks):
+        parents = self._counted_parents(model, pks)
+        using = router.db_for_write(model)
+        with transaction.atomic(using=using):
+            # Dependents are already gone and side effects are handled here, so
+            # skip the Collector and its per-row signals.
+            deleted = model._base_manager.filter(pk__in=pks)._raw_delete(using)
+            self._forget(model, pks)
+            self._recount(parents)
+        self.progress(model, 'deleted', deleted)
+
+    def _counted_parents(self, model, pks):
+        return [
+            (parent, field, source, fk, set(model._base_manager.filter(pk__in=pks).values_list(fk, flat=True)))
+            for parent, field, source, fk in COUNTERS if source is model
+        ]
+
+    def _recount(self, parents):
+        for parent, field, source, fk, ids in parents:
+            ids.discard(None)
+            # The default manager skips parents that are tombstoned themselves.
+            if ids and parent._default_manager.filter(pk__in=ids).update(**{field: actual_count(source, fk)}):
+                object_cache.bump_many(parent, ids)
+
+    def _forget(self, model, pks):
+        kind = search.KIND_BY_MODEL.get(model)
+        if kind is not None:
+            SearchDocument.objects.filter(kind=kind, object_id__in=pks).delete()
+        if _has_tombstone(model):
+            object_cache.bump_many(model, pks)
+
+def _reap(model, pk, pending):
+    for _ in range(3):
+        if not pending.exists():
+            return False
+        try:
+            Reaper().reap(model, [pk])
+            return True
+        except IntegrityError:
+            logger.warning("Reaping %s %s raced a concurrent write; retrying", model._meta.label_lower, pk)
+    raise IntegrityError(f"Could not reap {model._meta.label_lower} {pk}")
+
+def reap_tombstone(label, pk):
+    """Background task queued when a row is tombstoned; retried if a concurrent write added a dependent."""
+    model = apps.get_model(label)
+    _reap(model, pk, model._base_manager.filter(pk=pk, deleted_at__isnull=False))
+
+def reap_user(pk):
+    """Background task queued when an account is closed: delete it with everything it made."""
+    if _reap(User, pk, User._base_manager.filter(pk=pk, is_active=False)):
+        # Its follows went without signals, and the user has no tombstone to hide its cached profile.
+        graph.invalidate()
+        object_cache.bump(User, pk)
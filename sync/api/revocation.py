@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import RevokedToken
+from .tasks import defer
+
+logger = logging.getLogger(__name__)
+
+SEQ_KEY = 'revocations:seq'
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, sized for ``capacity`` items at ``error_rate`` false positives."""
+    __slots__ = ('size', 'hashes', 'bits', 'count')
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        if item in self:
+            return
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class Revocations:
+    """
+    Per-process view of the ``RevokedToken`` table, checked on every authenticated request.
+
+    Every unexpired revoked ``jti`` is in a Bloom filter, so the usual answer
+    ("not revoked") costs a few hashes and no I/O. A hit is confirmed against
+    an LRU of the ``REVOCATION_EXACT_SIZE`` most recent revocations and, past
+    that, the table, which also weeds out false positives. Revoking bumps a
+    sequence number in the shared cache; other processes look at it at most
+    every ``REVOCATION_SYNC_INTERVAL`` seconds and read the rows revoked since
+    their last read, less ``REVOCATION_SYNC_OVERLAP`` for transactions that
+    committed late. The filter is rebuilt without its expired entries every
+    ``REVOCATION_PRUNE_INTERVAL``, while requests keep checking the old one, and
+    revoking defers deleting the expired rows as often.
+
+    The table is always read on the primary: a replica that has not caught up
+    would let a revoked token through until the next rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rebuilding = threading.Lock()
+        self._bloom = None
+        self._recent = OrderedDict()
+        self._loading = None
+        self._seq = 0
+        self._synced_at = None
+        self._checked_at = self._built_at = 0.0
+        self._pruned_at = float('-inf')
+        self.checks = self.hits = self.false_positives = 0
+
+    def _table(self):
+        return RevokedToken.objects.using(DEFAULT_DB_ALIAS)
+
+    def clear(self):
+        with self._lock:
+            self._bloom = None
+
+    def rebuild(self):
+        """Reload unexpired revocations from the table and swap them in."""
+        with self._rebuilding:
+            self._load()
+
+    def _load(self):
+        started = time.perf_counter()
+        with self._lock:
+            self._loading = []
+        seq = cache.get(SEQ_KEY, 0)
+        now = timezone.now()
+        rows = self._table().filter(expires_at__gt=now).order_by('revoked_at').values_list('jti', 'expires_at')
+        rows = list(rows.iterator(chunk_size=10000))
+        bloom = BloomFilter(max(settings.REVOCATION_BLOOM_CAPACITY, 2 * len(rows)), settings.REVOCATION_BLOOM_ERROR_RATE)
+        recent = OrderedDict()
+        for jti, expires_at in rows:
+            _remember(bloom, recent, jti, expires_at)
+        with self._lock:
+            # Revocations made by this process while the table was read.
+            for jti, expires_at in self._loading:
+                _remember(bloom, recent, jti, expires_at)
+            self._loading = None
+            self._bloom, self._recent = bloom, recent
+            self._seq, self._synced_at = seq, now
+            self._checked_at = self._built_at = time.monotonic()
+        logger.info("Loaded %d revoked tokens in %.2fs", len(rows), time.perf_counter() - started)
+
+    def _refresh(self, wait):
+        # Requests that still have a filter keep using it while one thread rebuilds.
+        if not self._rebuilding.acquire(blocking=wait):
+            return
+        try:
+            if wait and self._bloom is not None:
+                return
+            self._load()
+        finally:
+            self._rebuilding.release()
+
+    def _sync(self):
+        now = time.monotonic()
+        with self._lock:
+            missing = self._bloom is None
+            stale = missing or now - self._built_at > settings.REVOCATION_PRUNE_INTERVAL
+            if not stale:
+                if now - self._checked_at < settings.REVOCATION_SYNC_INTERVAL:
+                    return
+                self._checked_at = now
+                known, since, count = self._seq, self._synced_at, self._bloom.count
+        if stale:
+            return self._refresh(wait=missing)
+        seq = cache.get(SEQ_KEY, 0)
+        if seq < known or count > 2 * settings.REVOCATION_BLOOM_CAPACITY:
+            return self._refresh(wait=False)
+        if seq == known:
+            return
+        synced_at = timezone.now()
+        since -= timedelta(seconds=settings.REVOCATION_SYNC_OVERLAP)
+        rows = list(self._table().filter(revoked_at__gte=since).order_by('revoked_at').values_list('jti', 'expires_at'))
+        with self._lock:
+            for jti, expires_at in rows:
+                _remember(self._bloom, self._recent, jti, expires_at)
+            if seq > self._seq:
+                self._seq, self._synced_at = seq, synced_at
+
+    def is_revoked(self, jti):
+        self._sync()
+        with self._lock:
+            self.checks += 1
+            if jti not in self._bloom:
+                return False
+            expires_at = self._recent.get(jti)
+        if expires_at is None:
+            expires_at = self._table().filter(jti=jti).values_list('expires_at', flat=True).first()
+            if expires_at is None:
+                with self._lock:
+                    self.false_positives += 1
+                return False
+        with self._lock:
+            self.hits += 1
+        return expires_at > timezone.now()
+
+    def revoke(self, jti, expires_at):
+        RevokedToken.objects.bulk_create([RevokedToken(jti=jti, expires_at=expires_at)], ignore_conflicts=True)
+        with self._lock:
+            if self._bloom is not None:
+                _remember(self._bloom, self._recent, jti, expires_at)
+            if self._loading is not None:
+                self._loading.append((jti, expires_at))
+            prune = time.monotonic() - self._pruned_at > settings.REVOCATION_PRUNE_INTERVAL
+            if prune:
+                self._pruned_at = time.monotonic()
+        transaction.on_commit(_bump)
+        if prune:
+            defer(prune_expired)
+
+    def revoke_token(self, token):
+        expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+        self.revoke(token[api_settings.JTI_CLAIM], expires_at)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'revoked': self._bloom.count if self._bloom is not None else 0,
+                'recent': len(self._recent),
+                'checks': self.checks,
+                'hits': self.hits,
+                'false_positives': self.false_positives,
+            }
+
+def _remember(bloom, recent, jti, expires_at):
+    bloom.add(jti)
+    recent[jti] = expires_at
+    recent.move_to_end(jti)
+    while len(recent) > settings.REVOCATION_EXACT_SIZE:
+        recent.popitem(last=False)
+
+def prune_expired():
+    """Delete revocations of tokens that have expired anyway."""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    if deleted:
+        logger.info("Pruned %d expired revoked tokens", deleted)
+
+def _bump():
+    try:
+        cache.incr(SEQ_KEY)
+    except ValueError:
+        cache.add(SEQ_KEY, 0, None)
+        cache.incr(SEQ_KEY)
+
+revocations = Revocations()
+
+class RevocableRefreshToken(RefreshToken):
+    """Refresh token checked against ``revocations``; ``blacklist()`` revokes it, as logout and rotation expect."""
+
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if revocations.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError("Token is revoked")
+
+    def blacklist(self):
+        revocations.revoke_token(self)
@@ -0,0 +1,115 @@
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+# Set for the duration of a safe-method request; everything else reads the primary.
+replica_reads = ContextVar('replica_reads', default=False)
+
+def _pin_key(user_id):
+    return f'pin:{user_id}'
+
+def pin_to_primary(user_id):
+    """Send ``user_id``'s reads to the primary for ``REPLICA_PIN_SECONDS`` after a write."""
+    if settings.DATABASE_REPLICAS:
+        cache.set(_pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, even in a safe-method request."""
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+def apply_pin(user_id):
+    if settings.DATABASE_REPLICAS and replica_reads.get() and cache.get(_pin_key(user_id)):
+        replica_reads.set(False)
+
+class ReplicaPool:
+    """
+    Health and lag state for the configured replicas.
+
+    Each replica is re-checked at most every ``REPLICA_HEALTH_CHECK_INTERVAL``
+    seconds by whichever request reaches it first. A replica that fails the
+    check or lags more than ``REPLICA_MAX_LAG`` seconds is left out of rotation
+    until a later check passes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+        self._state = {}
+        self._turn = itertools.count()
+
+    def _lag(self, alias):
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT CASE WHEN pg_is_in_recovery() "
+                    "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+                    "ELSE 0 END"
+                )
+                return float(cursor.fetchone()[0])
+            cursor.execute("SELECT 1")
+            return 0.0
+
+    def _check(self, alias):
+        try:
+            lag = self._lag(alias)
+        except DatabaseError as exc:
+            logger.warning("Replica %s failed its health check: %s", alias, exc)
+            self._state[alias] = {'healthy': False, 'lag': None, 'error': str(exc)}
+            return
+        healthy = lag <= settings.REPLICA_MAX_LAG
+        if not healthy:
+            logger.warning("Replica %s is %.1fs behind; skipping it", alias, lag)
+        self._state[alias] = {'healthy': healthy, 'lag': lag, 'error': None}
+
+    def healthy(self):
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for alias in settings.DATABASE_REPLICAS:
+                if now - self._checked.get(alias, float('-inf')) >= settings.REPLICA_HEALTH_CHECK_INTERVAL:
+                    self._checked[alias] = now
+                    due.append(alias)
+        for alias in due:
+            self._check(alias)
+        return [alias for alias in settings.DATABASE_REPLICAS if self._state.get(alias, {}).get('healthy')]
+
+    def choose(self):
+        aliases = self.healthy()
+        if not aliases:
+            return None
+        return aliases[next(self._turn) % len(aliases)]
+
+    def stats(self):
+        return {alias: dict(self._state.get(alias, {'healthy': None})) for alias in settings.DATABASE_REPLICAS}
+
+replica_pool = ReplicaPool()
+
+class ReplicaRouter:
+    """Route reads in safe-method requests to a healthy replica; writes and everything else go to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or not replica_reads.get():
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replica_pool.choose()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
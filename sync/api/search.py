@@ -0,0 +1,139 @@
+import re
+from django.db import connections, router
+from django.db.models import Q
+from .models import Comment, Group, Post, SearchDocument, User
+
+# Documents are written by deferred tasks after each save or delete. A task lost
+# to a crash or restart leaves its document stale until ``reconcile()`` runs, so
+# schedule ``manage.py rebuild_search_index --reconcile`` periodically (e.g. hourly
+# from cron); it only writes the documents that differ.
+
+# kind -> (model, fields joined into the title, fields joined into the body)
+SOURCES = {
+    SearchDocument.POST: (Post, ('title',), ('content',)),
+    SearchDocument.COMMENT: (Comment, (), ('content',)),
+    SearchDocument.GROUP: (Group, ('name',), ('description',)),
+    SearchDocument.USER: (User, ('username',), ('first_name', 'last_name')),
+}
+KIND_BY_MODEL = {model: kind for kind, (model, _, _) in SOURCES.items()}
+MAX_TERMS = 8
+TERM_RE = re.compile(r'(\w+)(\*?)')
+
+def indexed_fields(model):
+    _, title_fields, body_fields = SOURCES[KIND_BY_MODEL[model]]
+    return set(title_fields) | set(body_fields)
+
+def _indexed(kind):
+    model = SOURCES[kind][0]
+    # Closed accounts are taken out of search along with their content.
+    return model.objects.filter(is_active=True) if model is User else model.objects.all()
+
+def _document(kind, row):
+    _, title_fields, body_fields = SOURCES[kind]
+    return {
+        'title': ' '.join(filter(None, (row[field] for field in title_fields))),
+        'body': ' '.join(filter(None, (row[field] for field in body_fields))),
+    }
+
+def index_object(kind, pk):
+    _, title_fields, body_fields = SOURCES[kind]
+    row = _indexed(kind).filter(pk=pk).values(*title_fields, *body_fields).first()
+    if row is None:
+        remove_object(kind, pk)
+        return
+    SearchDocument.objects.update_or_create(kind=kind, object_id=pk, defaults=_document(kind, row))
+
+def remove_object(kind, pk):
+    SearchDocument.objects.filter(kind=kind, object_id=pk).delete()
+
+def rebuild(batch_size=2000):
+    SearchDocument.objects.all().delete()
+    total = 0
+    for kind, (_, title_fields, body_fields) in SOURCES.items():
+        batch = []
+        for row in _indexed(kind).values('pk', *title_fields, *body_fields).iterator(chunk_size=batch_size):
+            batch.append(SearchDocument(kind=kind, object_id=row['pk'], **_document(kind, row)))
+            if len(batch) >= batch_size:
+                total += len(SearchDocument.objects.bulk_create(batch))
+                batch = []
+        total += len(SearchDocument.objects.bulk_create(batch))
+    return total
+
+def _reconcile_batch(kind, rows):
+    documents = {
+        document.object_id: document
+        for document in SearchDocument.objects.filter(kind=kind, object_id__in=[row['pk'] for row in rows])
+    }
+    missing, stale = [], []
+    for row in rows:
+        fields = _document(kind, row)
+        document = documents.get(row['pk'])
+        if document is None:
+            missing.append(SearchDocument(kind=kind, object_id=row['pk'], **fields))
+        elif (document.title, document.body) != (fields['title'], fields['body']):
+            document.title, document.body = fields['title'], fields['body']
+            stale.append(document)
+    SearchDocument.objects.bulk_create(missing, ignore_conflicts=True)
+    SearchDocument.objects.bulk_update(stale, ['title', 'body'])
+    return len(missing) + len(stale)
+
+def reconcile(batch_size=2000):
+    """
+    Bring the index in line with its sources without rebuilding it.
+
+    Missing and stale documents are written and orphans deleted; documents that
+    already match are left alone. Returns the number of documents changed.
+    """
+    fixed = 0
+    for kind, (_, title_fields, body_fields) in SOURCES.items():
+        batch = []
+        for row in _indexed(kind).values('pk', *title_fields, *body_fields).iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                fixed += _reconcile_batch(kind, batch)
+                batch = []
+        fixed += _reconcile_batch(kind, batch)
+        indexed = SearchDocument.objects.filter(kind=kind).values_list('object_id', flat=True).order_by('object_id')
+        last = -1
+        while ids := list(indexed.filter(object_id__gt=last)[:batch_size]):
+            orphans = set(ids) - set(_indexed(kind).filter(pk__in=ids).values_list('pk', flat=True))
+            fixed += SearchDocument.objects.filter(kind=kind, object_id__in=orphans).delete()[0]
+            last = ids[-1]
+    return fixed
+
+def parse(query):
+    """Split a query into ``(term, is_prefix)`` pairs; ``foo*`` matches any word starting with ``foo``."""
+    return [(word.lower(), bool(star)) for word, star in TERM_RE.findall(query)][:MAX_TERMS]
+
+def search(query, kinds=None, offset=0, limit=10):
+    """Return ``(kind, object_id, score)`` for the best matches of every term, best first."""
+    terms = parse(query)
+    if not terms:
+        return []
+    kinds = list(kinds or SOURCES)
+    connection = connections[router.db_for_read(SearchDocument)]
+    kind_filter = ', '.join(['%s'] * len(kinds))
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{word}"' + ('*' if prefix else '') for word, prefix in terms)
+        sql = (
+            "SELECT kind, object_id, -rank FROM api_searchindex "
+            f"WHERE api_searchindex MATCH %s AND kind IN ({kind_filter}) "
+            "ORDER BY rank LIMIT %s OFFSET %s"
+        )
+    elif connection.vendor == 'postgresql':
+        match = ' & '.join(word + (':*' if prefix else '') for word, prefix in terms)
+        sql = (
+            "SELECT kind, object_id, ts_rank_cd(search_vector, query) AS score "
+            "FROM api_searchdocument, to_tsquery('simple', %s) query "
+            f"WHERE search_vector @@ query AND kind IN ({kind_filter}) "
+            "ORDER BY score DESC, id LIMIT %s OFFSET %s"
+        )
+    else:
+        matches = Q()
+        for word, _ in terms:
+            matches &= Q(title__icontains=word) | Q(body__icontains=word)
+        documents = SearchDocument.objects.filter(matches, kind__in=kinds).order_by('-id')
+        return [(kind, object_id, 0.0) for kind, object_id in documents.values_list('kind', 'object_id')[offset:offset + limit]]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, *kinds, limit, offset])
+        return cursor.fetchall()
@@ -1,9 +1,39 @@
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from django.contrib.auth.password_validation import validate_password
-from .models import User, Post, Comment, Like, Follow, Group, GroupMembership
+from .instrumentation import phase
+from .models import User, Post, Comment, Like, Follow, Group, GroupMembership, Notification
+from .revocation import RevocableRefreshToken
+
+class EagerLoadingMixin:
+    """
+    Serializers list the relations they render in ``Meta.select_related`` and
+    ``Meta.prefetch_related``; views pass querysets through
+    ``setup_eager_loading`` so nested serializers never query per row.
+    Representation time is reported as the request's ``serialize`` phase.
+    """
+
+    def to_representation(self, instance):
+        with phase('serialize'):
+            return super().to_representation(instance)
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix=None):
+        select_related = getattr(cls.Meta, 'select_related', ())
+        prefetch_related = getattr(cls.Meta, 'prefetch_related', ())
+        if prefix:
+            select_related = [prefix] + [f'{prefix}__{field}' for field in select_related]
+            prefetch_related = [f'{prefix}__{field}' for field in prefetch_related]
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
 
 class TokenSerializer(TokenObtainPairSerializer):
+    token_class = RevocableRefreshToken
+
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
@@ -11,6 +41,10 @@ class TokenSerializer(TokenObtainPairSerializer):
         token['email'] = user.email
         return token
 
+class RefreshSerializer(TokenRefreshSerializer):
+    """Refuses revoked refresh tokens; with rotation on, the old token is revoked when a new one is issued."""
+    token_class = RevocableRefreshToken
+
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     password2 = serializers.CharField(write_only=True, required=True)
@@ -25,50 +59,55 @@ class RegisterSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        user = User.objects.create(
-            username=validated_data['username'],
-            email=validated_data['email']
-        )
+        user = User(username=validated_data['username'], email=validated_data['email'])
         user.set_password(validated_data['password'])
         user.save()
         return user
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'created_at', 'first_name', 'last_name']
         read_only_fields = ['created_at']
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
         model = Post
-        fields = ['id', 'user', 'title', 'content', 'created_at', 'updated_at', 'likes_count', 'group']
-        read_only_fields = ['created_at', 'updated_at', 'likes_count', 'user']
+        fields = ['id', 'user', 'title', 'content', 'created_at', 'updated_at', 'likes_count', 'comments_count', 'group']
+        read_only_fields = ['created_at', 'updated_at', 'likes_count', 'comments_count', 'user']
+        select_related = ('user',)
 
     def create(self, validated_data):
-        user = self.context['request'].user
-        post = Post.objects.create(user=user, **validated_data)
+        validated_data.setdefault('user', self.context['request'].user)
+        post = Post.objects.create(**validated_data)
         return post
 
-class CommentSerializer(serializers.ModelSerializer):
+    def update(self, instance, validated_data):
+        # Moving a post would bypass the membership check and the groups' counters.
+        validated_data.pop('group', None)
+        return super().update(instance, validated_data)
+
+class CommentSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
         model = Comment
         fields = ['id', 'user', 'post', 'content', 'created_at']
         read_only_fields = ['created_at', 'user']
+        select_related = ('user',)
 
-class LikeSerializer(serializers.ModelSerializer):
+class LikeSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
         model = Like
         fields = ['id', 'user', 'post', 'created_at']
         read_only_fields = ['created_at', 'user', 'post']
+        select_related = ('user',)
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     follower = UserSerializer(read_only=True)
     followed = UserSerializer(read_only=True)
 
@@ -76,18 +115,18 @@ class FollowSerializer(serializers.ModelSerializer):
         model = Follow
         fields = ['id', 'follower', 'followed', 'created_at']
         read_only_fields = ['created_at', 'follower', 'followed']
+        select_related = ('follower', 'followed')
 
-class GroupSerializer(serializers.ModelSerializer):
+class GroupSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     creator = UserSerializer(read_only=True)
-    members_count = serializers.SerializerMethodField()
+    # A deleted group keeps its name until the reaper removes the row.
+    name = serializers.CharField(max_length=100, validators=[UniqueValidator(queryset=Group.all_objects.all())])
 
     class Meta:
         model = Group
-        fields = ['id', 'name', 'description', 'creator', 'created_at', 'members_count']
-        read_only_fields = ['creator', 'created_at', 'members_count']
-
-    def get_members_count(self, obj):
-        return obj.members.count()
+        fields = ['id', 'name', 'description', 'creator', 'created_at', 'members_count', 'posts_count']
+        read_only_fields = ['creator', 'created_at', 'members_count', 'posts_count']
+        select_related = ('creator',)
 
     def create(self, validated_data):
         user = self.context['request'].user
@@ -95,7 +134,7 @@ class GroupSerializer(serializers.ModelSerializer):
         GroupMembership.objects.create(user=user, group=group)
         return group
 
-class GroupMembershipSerializer(serializers.ModelSerializer):
+class GroupMembershipSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     group = serializers.PrimaryKeyRelatedField(read_only=True)
 
@@ -103,3 +142,14 @@ class GroupMembershipSerializer(serializers.ModelSerializer):
         model = GroupMembership
         fields = ['id', 'user', 'group', 'date_joined']
         read_only_fields = ['date_joined']
+        select_related = ('user',)
+
+class NotificationSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    verb = serializers.CharField(read_only=True)
+    actor = UserSerializer(read_only=True)
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'verb', 'actor', 'actor_count', 'post', 'group', 'created_at', 'updated_at', 'read_at']
+        read_only_fields = fields
+        select_related = ('actor',)
@@ -0,0 +1,155 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import principal_cache
+from .counters import adjust, latest
+from .instrumentation import install_query_timer
+from .models import Comment, Follow, Group, GroupMembership, Like, Notification, Post, User, account_closed
+from .notifications import pending_notifications
+from .objectcache import object_cache
+from . import graph, groupfeed, realtime, reaper, search, timeline, trending
+from .reaper import tombstoned
+from .tasks import defer
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.schedule_fan_out(instance)
+        trending.record(instance.pk, 'post')
+
+@receiver(post_save, sender=Follow)
+def backfill_followed_posts(sender, instance, created, **kwargs):
+    if created:
+        defer(timeline.backfill_author, instance.follower_id, instance.followed_id)
+
+@receiver(post_delete, sender=Follow)
+def remove_unfollowed_posts(sender, instance, **kwargs):
+    defer(timeline.remove_author, instance.follower_id, instance.followed_id)
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def log_follow_graph_change(sender, instance, signal, created=False, **kwargs):
+    if signal is post_delete:
+        graph.record(graph.REMOVE, instance.follower_id, instance.followed_id)
+    elif created:
+        graph.record(graph.ADD, instance.follower_id, instance.followed_id)
+
+@receiver(post_save, sender=Comment)
+def publish_new_comment(sender, instance, created, **kwargs):
+    if created:
+        defer(realtime.publish_comment, instance.pk)
+
+@receiver(post_save, sender=Like)
+def notify_like(sender, instance, created, **kwargs):
+    if created:
+        pending_notifications.add(Notification.LIKE, instance.user_id, post_id=instance.post_id)
+
+@receiver(post_save, sender=Comment)
+def notify_comment(sender, instance, created, **kwargs):
+    if created:
+        pending_notifications.add(Notification.COMMENT, instance.user_id, post_id=instance.post_id)
+
+@receiver(post_save, sender=Follow)
+def notify_follow(sender, instance, created, **kwargs):
+    if created:
+        pending_notifications.add(Notification.FOLLOW, instance.follower_id, recipient_id=instance.followed_id)
+
+@receiver(post_save, sender=GroupMembership)
+def notify_join(sender, instance, created, **kwargs):
+    if created:
+        pending_notifications.add(Notification.JOIN, instance.user_id, group_id=instance.group_id)
+
+def _row_delta(signal, instance, created=False, update_fields=None):
+    # A tombstone stops counting right away; the reaper's later delete is not counted again.
+    if signal is post_delete:
+        return 0 if getattr(instance, 'deleted_at', None) else -1
+    if tombstoned(update_fields):
+        return -1
+    return 1 if created else 0
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def count_follow(sender, instance, signal, **kwargs):
+    delta = _row_delta(signal, instance, kwargs.get('created'), kwargs.get('update_fields'))
+    if delta:
+        adjust(User, instance.followed_id, 'followers_count', delta)
+        adjust(User, instance.follower_id, 'following_count', delta)
+
+@receiver(post_save, sender=GroupMembership)
+@receiver(post_delete, sender=GroupMembership)
+def forget_cached_memberships(sender, instance, **kwargs):
+    groupfeed.forget_memberships(instance.user_id)
+
+@receiver(post_save, sender=GroupMembership)
+@receiver(post_delete, sender=GroupMembership)
+def count_membership(sender, instance, signal, **kwargs):
+    delta = _row_delta(signal, instance, kwargs.get('created'), kwargs.get('update_fields'))
+    if delta:
+        adjust(Group, instance.group_id, 'members_count', delta)
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def count_post(sender, instance, signal, **kwargs):
+    delta = _row_delta(signal, instance, kwargs.get('created'), kwargs.get('update_fields'))
+    if delta:
+        adjust(User, instance.user_id, 'posts_count', delta)
+        changes = {'last_post_at': latest('last_post_at', instance.created_at)} if kwargs.get('created') else {}
+        adjust(Group, instance.group_id, 'posts_count', delta, **changes)
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def count_comment(sender, instance, signal, **kwargs):
+    delta = _row_delta(signal, instance, kwargs.get('created'), kwargs.get('update_fields'))
+    if delta:
+        adjust(Post, instance.post_id, 'comments_count', delta)
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_object(sender, instance, **kwargs):
+    object_cache.bump(sender, instance.pk)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_cached_principal(sender, instance, **kwargs):
+    principal_cache.invalidate(instance.pk)
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=User)
+def index_search_document(sender, instance, update_fields=None, **kwargs):
+    if tombstoned(update_fields):
+        defer(search.remove_object, search.KIND_BY_MODEL[sender], instance.pk)
+        return
+    if update_fields is not None and not search.indexed_fields(sender) & set(update_fields):
+        return
+    defer(search.index_object, search.KIND_BY_MODEL[sender], instance.pk)
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=User)
+def remove_search_document(sender, instance, **kwargs):
+    defer(search.remove_object, search.KIND_BY_MODEL[sender], instance.pk)
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Group)
+def reap_tombstoned(sender, instance, update_fields=None, **kwargs):
+    if tombstoned(update_fields):
+        defer(reaper.reap_tombstone, sender._meta.label_lower, instance.pk)
+
+@receiver(account_closed)
+def reap_closed_account(sender, instance, **kwargs):
+    defer(search.remove_object, search.KIND_BY_MODEL[sender], instance.pk)
+    defer(reaper.reap_user, instance.pk)
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    install_query_timer(connection)
@@ -0,0 +1,128 @@
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BACKGROUND_TASK_WORKERS', 4),
+                    thread_name_prefix='sync-tasks',
+                )
+    return _executor
+
+def _run(func, args, kwargs, attempt=0):
+    close_old_connections()
+    name = getattr(func, '__name__', func)
+    try:
+        func(*args, **kwargs)
+    except OperationalError:
+        if attempt + 1 >= settings.BACKGROUND_TASK_MAX_ATTEMPTS:
+            logger.exception("Background task %s failed after %d attempts", name, attempt + 1)
+            return
+        # Usually a lock held by another writer; retry off this worker with backoff.
+        logger.warning("Background task %s failed on attempt %d, retrying", name, attempt + 1, exc_info=True)
+        retry = threading.Timer(
+            settings.BACKGROUND_TASK_RETRY_DELAY * 2 ** attempt, _submit, (func, args, kwargs, attempt + 1),
+        )
+        retry.daemon = True
+        retry.start()
+    except Exception:
+        logger.exception("Background task %s failed", name)
+    finally:
+        close_old_connections()
+
+def _submit(func, args, kwargs, attempt=0):
+    try:
+        _get_executor().submit(_run, func, args, kwargs, attempt)
+    except RuntimeError:
+        # The pool is already shut down when atexit flushes run; finish the work inline.
+        _run(func, args, kwargs, attempt)
+
+def defer(func, *args, **kwargs):
+    """
+    Run ``func`` off the request thread once the current transaction commits.
+
+    With ``BACKGROUND_TASK_BACKEND = 'database'`` the call is stored as a ``Job``
+    in the current transaction instead and run by ``manage.py run_tasks``, so it
+    survives restarts. ``func`` must be importable and its arguments JSON on
+    every backend, so code that works on one never breaks when switched to another.
+    Both backends retry failed calls, so ``func`` must be safe to run again.
+    """
+    try:
+        json.dumps([args, kwargs])
+    except (TypeError, ValueError) as exc:
+        raise TypeError(f"Arguments of deferred {func.__qualname__} must be JSON serializable: {exc}") from None
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        transaction.on_commit(lambda: func(*args, **kwargs))
+        return
+    if getattr(settings, 'BACKGROUND_TASK_BACKEND', 'thread') == 'database':
+        Job.objects.create(func=f'{func.__module__}.{func.__qualname__}', args=[list(args), kwargs])
+        return
+    transaction.on_commit(lambda: _submit(func, args, kwargs))
+
+def claim_jobs(limit):
+    """Lease up to ``limit`` due jobs to this worker; concurrent workers never claim the same job."""
+    now = timezone.now()
+    due = list(Job.objects.filter(run_at__lte=now).order_by('run_at', 'id').values_list('pk', flat=True)[:limit])
+    if not due:
+        return []
+    token = uuid.uuid4().hex
+    Job.objects.filter(pk__in=due, run_at__lte=now).update(
+        run_at=now + timedelta(seconds=settings.BACKGROUND_TASK_LEASE), token=token,
+    )
+    return list(Job.objects.filter(token=token))
+
+def _run_job(job):
+    close_old_connections()
+    try:
+        args, kwargs = job.args
+        import_string(job.func)(*args, **kwargs)
+        return True
+    except Exception:
+        logger.exception("Job %s (%s) failed on attempt %d", job.pk, job.func, job.attempts + 1)
+        return False
+    finally:
+        close_old_connections()
+
+def run_pending(limit=None, executor=None):
+    """
+    Claim one batch of due jobs and run it, on ``executor`` if given.
+
+    Finished jobs are deleted together; failed ones are retried with exponential
+    backoff and dropped after ``BACKGROUND_TASK_MAX_ATTEMPTS``. Returns the number
+    of jobs claimed.
+    """
+    jobs = claim_jobs(limit or settings.BACKGROUND_TASK_BATCH_SIZE)
+    if executor is None:
+        results = [_run_job(job) for job in jobs]
+    else:
+        results = list(executor.map(_run_job, jobs))
+    Job.objects.filter(pk__in=[job.pk for job, done in zip(jobs, results) if done]).delete()
+    now = timezone.now()
+    for job, done in zip(jobs, results):
+        if done:
+            continue
+        if job.attempts + 1 >= settings.BACKGROUND_TASK_MAX_ATTEMPTS:
+            logger.error("Dropping job %s (%s) after %d attempts", job.pk, job.func, job.attempts + 1)
+            job.delete()
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                attempts=job.attempts + 1, token='', run_at=now + timedelta(seconds=2 ** job.attempts),
+            )
+    return len(jobs)
@@ -1,3 +1,1706 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.db.models import F
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from . import graph, groupfeed, realtime, reaper, search, tasks, trending, urls as api_urls
+from .admission import AdmissionController, admission
+from .authentication import PrincipalCache, principal_cache
+from .graph import follow_graph
+from .hashers import offload
+from .objectcache import object_cache
+from .revocation import BloomFilter, Revocations, _bump, revocations
+from .routers import ReplicaPool, replica_reads
+from .fastpath import comment_rows, explore_rows, post_rows
+from .instrumentation import request_metrics
+from .likes import LikeCountBuffer, like_counts
+from .notifications import deliver, pending_notifications
+from .models import (
+    User, Post, Comment, Like, Follow, Group, GroupMembership, Job, Notification, RevokedToken, TimelineEntry, TrendingScore,
+)
+from .renderers import FastJSONRenderer
+from .serializers import CommentSerializer, PostSerializer
+from .timeline import celebrity_ids, rebuild_timeline
 
-# Create your tests here.
+# Maximum queries per (url name, method) with a page of related rows to render.
+QUERY_BUDGETS = {
+    ('auth-register', 'POST'): 3,
+    ('auth-login', 'POST'): 1,
+    ('auth-refresh', 'POST'): 0,
+    ('auth-logout', 'POST'): 0,
+    ('feed', 'GET'): 2,
+    ('explore-posts', 'GET'): 2,
+    ('search', 'GET'): 2,
+    ('notification-list', 'GET'): 1,
+    ('notification-read', 'POST'): 1,
+    ('account-export', 'GET'): 7,
+    ('account-close', 'DELETE'): 1,
+    ('post-list', 'GET'): 1,
+    ('post-list', 'POST'): 2,
+    ('post-detail', 'GET'): 1,
+    ('post-detail', 'PUT'): 2,
+    ('post-like', 'POST'): 4,
+    ('post-likes-list', 'GET'): 2,
+    ('post-comments', 'GET'): 2,
+    ('post-comments', 'POST'): 4,
+    ('comment-detail', 'GET'): 1,
+    ('user-suggestions', 'GET'): 1,
+    ('user-detail', 'GET'): 1,
+    ('user-posts', 'GET'): 2,
+    ('user-follow', 'POST'): 5,
+    ('user-followers', 'GET'): 2,
+    ('user-following', 'GET'): 2,
+    ('group-list', 'GET'): 1,
+    ('group-feed', 'GET'): 3,
+    ('group-detail', 'GET'): 1,
+    ('group-membership', 'POST'): 4,
+    ('group-members-list', 'GET'): 2,
+    ('group-posts', 'GET'): 2,
+    ('group-posts', 'POST'): 5,
+    ('auth-cache-metrics', 'GET'): 0,
+    ('metrics', 'GET'): 0,
+    ('batch', 'POST'): 2,
+    ('batch-likes', 'POST'): 10,
+    ('batch-follows', 'POST'): 14,
+    ('batch-memberships', 'POST'): 12,
+}
+
+@override_settings(BACKGROUND_TASKS_EAGER=True, BATCH_MAX_WORKERS=1)
+class EndpointTestCase(TestCase):
+    """Fixture with a page of related rows behind every route, and one request per (route, method)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username='viewer', email='viewer@example.com', password='secret-pass')
+        cls.author = User.objects.create(username='author', email='author@example.com')
+        cls.others = [
+            User.objects.create(username=f'user{i}', email=f'user{i}@example.com') for i in range(12)
+        ]
+        cls.group = Group.objects.create(name='group', description='', creator=cls.author)
+        GroupMembership.objects.create(user=cls.author, group=cls.group)
+        GroupMembership.objects.create(user=cls.viewer, group=cls.group)
+        Follow.objects.create(follower=cls.viewer, followed=cls.author)
+        for user in cls.others:
+            Follow.objects.create(follower=user, followed=cls.author)
+            Follow.objects.create(follower=cls.author, followed=user)
+            GroupMembership.objects.create(user=user, group=cls.group)
+            Group.objects.create(name=f'group-{user.username}', description='', creator=user)
+            Post.objects.create(user=user, title='other', content='content')
+        cls.posts = [
+            Post.objects.create(user=cls.author, group=cls.group, title=f'post {i}', content='content')
+            for i in range(12)
+        ]
+        cls.post = cls.posts[0]
+        for user in cls.others:
+            Like.objects.create(user=user, post=cls.post)
+            Comment.objects.create(user=user, post=cls.post, content='comment')
+        cls.comment = Comment.objects.create(user=cls.viewer, post=cls.post, content='mine')
+        cls.own_post = Post.objects.create(user=cls.viewer, title='mine', content='content')
+        Notification.objects.bulk_create([
+            Notification(recipient=cls.viewer, verb=Notification.LIKE, actor=user, post=cls.own_post, read_at=timezone.now())
+            for user in cls.others
+        ])
+        deliver([[Notification.FOLLOW, user.pk, None, None, cls.viewer.pk] for user in cls.others])
+        rebuild_timeline(cls.viewer.pk)
+        trending.rebuild()
+        search.rebuild()
+
+    def setUp(self):
+        cache.clear()
+        follow_graph.rebuild()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def requests(self):
+        post, group = self.post.pk, self.group.pk
+        return [
+            ('auth-register', 'POST', {}, {
+                'username': 'newcomer', 'email': 'new@example.com',
+                'password': 'an0ther-pass', 'password2': 'an0ther-pass',
+            }),
+            ('auth-login', 'POST', {}, {'username': 'viewer', 'password': 'secret-pass'}),
+            ('auth-refresh', 'POST', {}, {'refresh': 'invalid'}),
+            ('auth-logout', 'POST', {}, {'refresh': 'invalid'}),
+            ('feed', 'GET', {}, None),
+            ('explore-posts', 'GET', {}, None),
+            ('search', 'GET', {}, {'q': 'pos*'}),
+            ('notification-list', 'GET', {}, None),
+            ('notification-read', 'POST', {}, {'ids': [1, 2]}),
+            ('account-export', 'GET', {}, None),
+            ('post-list', 'GET', {}, None),
+            ('post-list', 'POST', {}, {'title': 'new', 'content': 'content'}),
+            ('post-detail', 'GET', {'pk': post}, None),
+            ('post-detail', 'PUT', {'pk': self.own_post.pk}, {'title': 'edited'}),
+            ('post-like', 'POST', {'pk': post}, None),
+            ('post-likes-list', 'GET', {'pk': post}, None),
+            ('post-comments', 'GET', {'pk': post}, None),
+            ('post-comments', 'POST', {'pk': post}, {'content': 'hello', 'post': post}),
+            ('comment-detail', 'GET', {'pk': self.comment.pk}, None),
+            ('user-suggestions', 'GET', {}, None),
+            ('user-detail', 'GET', {'username': 'author'}, None),
+            ('user-posts', 'GET', {'username': 'author'}, None),
+            ('user-follow', 'POST', {'username': 'user0'}, None),
+            ('user-followers', 'GET', {'username': 'author'}, None),
+            ('user-following', 'GET', {'username': 'author'}, None),
+            ('group-list', 'GET', {}, None),
+            ('group-feed', 'GET', {}, None),
+            ('group-detail', 'GET', {'pk': group}, None),
+            ('group-membership', 'POST', {'pk': Group.objects.get(name='group-user0').pk}, None),
+            ('group-members-list', 'GET', {'pk': group}, None),
+            ('group-posts', 'GET', {'pk': group}, None),
+            ('group-posts', 'POST', {'pk': group}, {'title': 'new', 'content': 'content'}),
+            ('auth-cache-metrics', 'GET', {}, None),
+            ('metrics', 'GET', {}, None),
+            ('batch', 'POST', {}, {'requests': [
+                {'method': 'GET', 'path': reverse('post-detail', kwargs={'pk': post})},
+                {'method': 'GET', 'path': reverse('user-detail', kwargs={'username': 'author'})},
+            ]}),
+            ('batch-likes', 'POST', {}, {'post_ids': [p.pk for p in self.posts[1:3]]}),
+            ('batch-follows', 'POST', {}, {'usernames': ['user1', 'user2']}),
+            ('batch-memberships', 'POST', {}, {
+                'group_ids': list(Group.objects.filter(name__in=['group-user1', 'group-user2']).values_list('pk', flat=True)),
+            }),
+            # Last: it closes the viewer's account.
+            ('account-close', 'DELETE', {}, None),
+        ]
+
+    def check_requests(self, check):
+        for name, method, kwargs, data in self.requests():
+            with self.subTest(route=name, method=method):
+                url = reverse(name, kwargs=kwargs)
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(self.client, method.lower())(url, data, format='json')
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertLess(response.status_code, 500)
+                check(name, method, url, queries.captured_queries)
+
+
+class QueryBudgetTests(EndpointTestCase):
+    def test_every_route_has_a_budget(self):
+        budgeted = {name for name, _ in QUERY_BUDGETS}
+        routes = {pattern.name for pattern in api_urls.urlpatterns}
+        self.assertEqual(routes - budgeted, set())
+
+    def test_query_budgets(self):
+        def check(name, method, url, queries):
+            budget = QUERY_BUDGETS[(name, method)]
+            self.assertLessEqual(
+                len(queries), budget,
+                f"{method} {url} ran {len(queries)} queries (budget {budget}):\n"
+                + "\n".join(query['sql'] for query in queries),
+            )
+        self.check_requests(check)
+
+
+@skipUnless(connection.vendor == 'sqlite', "Plans are checked with SQLite's EXPLAIN QUERY PLAN.")
+class QueryPlanTests(EndpointTestCase):
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_no_full_scans_or_temp_sorts(self):
+        def check(name, method, url, queries):
+            for query in queries:
+                if not query['sql'].startswith(('SELECT', 'UPDATE', 'DELETE')):
+                    continue
+                for step in self.plan(query['sql']):
+                    full_scan = step.startswith('SCAN') and 'INDEX' not in step
+                    self.assertFalse(
+                        full_scan or 'TEMP B-TREE' in step,
+                        f"{method} {url}: '{step}' in the plan for\n{query['sql']}",
+                    )
+        self.check_requests(check)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True, BATCH_MAX_WORKERS=1)
+class BatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username='viewer', email='viewer@example.com', password='secret-pass')
+        cls.post = Post.objects.create(user=cls.viewer, title='post', content='content')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def test_results_keep_request_order(self):
+        response = self.client.post(reverse('batch'), {'requests': [
+            {'method': 'POST', 'path': reverse('post-list'), 'body': {'title': 'new', 'content': 'content'}},
+            {'path': reverse('post-detail', kwargs={'pk': self.post.pk})},
+            {'path': '/api/missing/'},
+        ]}, format='json')
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 200, 404])
+        self.assertEqual(response.data['results'][1]['body']['id'], self.post.pk)
+
+    def test_only_sync_api_views_can_be_batched(self):
+        response = self.client.post(reverse('batch'), {'requests': [
+            {'path': reverse('async-feed')},
+            {'path': reverse('account-export')},
+            {'path': '/admin/'},
+            {'path': reverse('batch')},
+        ]}, format='json')
+        self.assertEqual([result['status'] for result in response.data['results']], [404, 400, 404, 400])
+
+    def test_atomic_batch_rolls_back_on_failed_write(self):
+        response = self.client.post(reverse('batch'), {'atomic': True, 'requests': [
+            {'method': 'POST', 'path': reverse('post-list'), 'body': {'title': 'new', 'content': 'content'}},
+            {'method': 'POST', 'path': reverse('post-list'), 'body': {}},
+        ]}, format='json')
+        self.assertTrue(response.data['rolled_back'])
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_rows_a_concurrent_request_created_are_not_counted_again(self):
+        followed = User.objects.create(username='followed', email='followed@example.com')
+        Like.objects.create(user=self.viewer, post=self.post)
+        Follow.objects.create(follower=self.viewer, followed=followed)
+        # The view's own lookup misses the rows, as if they were created after it ran.
+        for model in (Like, Follow):
+            patcher = mock.patch.object(model.objects, 'filter', return_value=model.objects.none())
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with self.captureOnCommitCallbacks() as callbacks:
+            likes = self.client.post(reverse('batch-likes'), {'post_ids': [self.post.pk]}, format='json')
+            follows = self.client.post(reverse('batch-follows'), {'usernames': ['followed']}, format='json')
+        self.assertEqual((likes.status_code, likes.data['liked'], likes.data['already_liked']), (200, [], [self.post.pk]))
+        self.assertEqual(
+            (follows.status_code, follows.data['followed'], follows.data['already_following']), (200, [], ['followed']),
+        )
+        self.assertEqual(callbacks, [])
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username='viewer', email='viewer@example.com', password='secret-pass')
+        cls.titled = Post.objects.create(user=cls.viewer, title='Sourdough starter', content='flour and water')
+        cls.mentioned = Post.objects.create(user=cls.viewer, title='Weekend', content='baked sourdough bread')
+        search.rebuild()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def results(self, **params):
+        response = self.client.get(reverse('search'), params)
+        self.assertEqual(response.status_code, 200)
+        return [(result['type'], result['object']['id']) for result in response.data['results']]
+
+    def test_prefix_matches_rank_titles_first(self):
+        self.assertEqual(self.results(q='sourd*', type='post'), [('post', self.titled.pk), ('post', self.mentioned.pk)])
+        self.assertEqual(self.results(q='sourd', type='post'), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.viewer, post=self.titled, content='Rye works too')
+            self.mentioned.title = 'Rye loaf'
+            self.mentioned.save()
+        self.assertEqual(
+            sorted(self.results(q='rye')),
+            sorted([('comment', Comment.objects.get().pk), ('post', self.mentioned.pk)]),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mentioned.delete()
+        self.assertEqual(self.results(q='rye', type='post'), [])
+
+    def test_reconcile_repairs_documents_whose_tasks_were_lost(self):
+        comment = Comment.objects.create(user=self.viewer, post=self.titled, content='Rye works too')
+        self.titled.title = 'Rye loaf'
+        self.titled.save()
+        self.mentioned.delete()
+        self.assertEqual(len(search.search('sourdough')), 2)
+        out = StringIO()
+        call_command('rebuild_search_index', '--reconcile', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Fixed 3 documents')
+        self.assertEqual(sorted(self.results(q='rye')), sorted([('comment', comment.pk), ('post', self.titled.pk)]))
+        self.assertEqual(search.search('sourdough'), [])
+        call_command('rebuild_search_index', '--reconcile', stdout=out)
+        self.assertEqual(out.getvalue().split('\n')[1], 'Fixed 0 documents')
+
+
+class TombstoneTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='author@example.com')
+        cls.fan = User.objects.create(username='fan', email='fan@example.com')
+        Follow.objects.create(follower=cls.fan, followed=cls.author)
+        cls.group = Group.objects.create(name='club', description='club', creator=cls.author)
+        GroupMembership.objects.create(user=cls.fan, group=cls.group)
+        cls.posts = [
+            Post.objects.create(user=cls.author, group=cls.group, title=f'in group {i}', content='content')
+            for i in range(3)
+        ]
+        cls.post = Post.objects.create(user=cls.author, title='popular', content='content')
+        for post in cls.posts + [cls.post]:
+            Like.objects.create(user=cls.fan, post=post)
+            Comment.objects.create(user=cls.fan, post=post, content='nice')
+        rebuild_timeline(cls.fan.pk)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_deleted_post_disappears_before_the_reaper_runs(self):
+        self.assertEqual(self.client.delete(reverse('post-detail', kwargs={'pk': self.post.pk})).status_code, 204)
+        self.assertEqual(self.client.get(reverse('post-detail', kwargs={'pk': self.post.pk})).status_code, 404)
+        self.client.force_authenticate(self.fan)
+        self.assertNotIn(self.post.pk, [post['id'] for post in self.client.get(reverse('feed')).json()['results']])
+        self.assertEqual(User.objects.get(pk=self.author.pk).posts_count, 3)
+        self.assertTrue(Like.objects.filter(post=self.post).exists())
+
+        reaper.reap_tombstone('api.post', self.post.pk)
+        self.assertFalse(Post.all_objects.filter(pk=self.post.pk).exists())
+        self.assertFalse(Like.objects.filter(post_id=self.post.pk).exists())
+        self.assertFalse(Comment.all_objects.filter(post_id=self.post.pk).exists())
+        self.assertFalse(TimelineEntry.objects.filter(post_id=self.post.pk).exists())
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True, REAPER_BATCH_SIZE=2)
+    def test_group_is_reaped_in_batches_with_its_posts(self):
+        self.client.force_authenticate(self.fan)
+        self.assertEqual(self.client.delete(reverse('group-detail', kwargs={'pk': self.group.pk})).status_code, 403)
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(reverse('group-detail', kwargs={'pk': self.group.pk})).status_code, 204)
+        self.assertFalse(Group.all_objects.exists())
+        self.assertEqual(list(Post.all_objects.values_list('pk', flat=True)), [self.post.pk])
+        self.assertEqual(Like.objects.count(), 1)
+        self.assertEqual(Comment.all_objects.count(), 1)
+        self.assertFalse(GroupMembership.objects.exists())
+        self.assertEqual(User.objects.get(pk=self.author.pk).posts_count, 1)
+
+    def test_concurrent_deletes_are_counted_once(self):
+        first, second = Post.objects.get(pk=self.post.pk), Post.objects.get(pk=self.post.pk)
+        self.assertTrue(first.tombstone())
+        self.assertFalse(second.tombstone())
+        self.assertEqual(User.objects.get(pk=self.author.pk).posts_count, 3)
+
+    def test_stale_comment_save_does_not_undo_a_delete(self):
+        stale = Comment.objects.get(post=self.post)
+        Comment.objects.get(pk=stale.pk).tombstone()
+        stale.content = 'edited'
+        stale.save()
+        self.assertIsNotNone(Comment.all_objects.get(pk=stale.pk).deleted_at)
+
+    def test_deleted_group_name_is_taken_until_reaped(self):
+        self.assertEqual(self.client.delete(reverse('group-detail', kwargs={'pk': self.group.pk})).status_code, 204)
+        data = {'name': 'club', 'description': 'again'}
+        self.assertEqual(self.client.post(reverse('group-list'), data, format='json').status_code, 400)
+        reaper.reap_tombstone('api.group', self.group.pk)
+        self.assertEqual(self.client.post(reverse('group-list'), data, format='json').status_code, 201)
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True, REAPER_BATCH_SIZE=2)
+    def test_closed_account_is_locked_out_then_reaped(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.fan)}')
+        self.assertEqual(client.get(reverse('feed')).status_code, 200)
+        self.assertEqual(client.delete(reverse('account-close')).status_code, 204)
+        self.assertEqual(client.get(reverse('feed')).status_code, 401)
+        self.assertTrue(User.objects.filter(pk=self.fan.pk).exists())
+
+        # Closing twice queues the reaper once; a closed account is reaped with everything it made.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(User.objects.get(pk=self.fan.pk).close())
+            self.assertTrue(User.objects.create_user('other', 'other@example.com', 'secret-pass').close())
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['author', 'fan'])
+        reaper.reap_user(self.fan.pk)
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['author'])
+        self.assertFalse(Like.objects.exists() or Comment.all_objects.exists())
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual((author.followers_count, author.posts_count), (0, 4))
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comments_count, 0)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).members_count, 0)
+
+
+class ExploreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(username='viewer', email='viewer@example.com')
+        followed = User.objects.create(username='followed', email='followed@example.com')
+        stranger = User.objects.create(username='stranger', email='stranger@example.com')
+        Follow.objects.create(follower=cls.viewer, followed=followed)
+        posts = [Post.objects.create(user=followed, title=f'hidden {i}', content='content') for i in range(40)]
+        posts += [Post.objects.create(user=stranger, title=f'shown {i}', content='content') for i in range(3)]
+        TrendingScore.objects.bulk_create([
+            TrendingScore(post=post, author_id=post.user_id, score=len(posts) - i, created_at=post.created_at)
+            for i, post in enumerate(posts)
+        ])
+
+    @override_settings(TRENDING_MAX_SCAN=30)
+    def test_run_of_hidden_posts_longer_than_the_scan_is_skipped(self):
+        client = APIClient()
+        client.force_authenticate(self.viewer)
+        page = client.get(reverse('explore-posts')).json()
+        self.assertEqual(page['results'], [])
+        self.assertIsNotNone(page['next'])
+        page = client.get(page['next']).json()
+        self.assertEqual([post['title'] for post in page['results']], ['shown 0', 'shown 1', 'shown 2'])
+        self.assertIsNone(page['next'])
+        back = client.get(page['previous']).json()
+        self.assertEqual(back['results'], [])
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class TrendingConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        author = User.objects.create(username='author', email='author@example.com')
+        self.post = Post.objects.create(user=author, title='title', content='content')
+        self.at = timezone.now()
+
+    def score(self):
+        return TrendingScore.objects.get(post=self.post).score
+
+    def apply_concurrently(self, *events):
+        start = threading.Barrier(len(events))
+
+        def worker(event, sign):
+            start.wait()
+            try:
+                for _ in range(50):
+                    try:
+                        return trending.apply_event(self.post.pk, event, sign, self.at.timestamp())
+                    except OperationalError:
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=event) for event in events]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrent_events_all_apply(self):
+        expected = self.score()
+        for _ in range(8):
+            expected = trending._log_add(expected, trending._log_weight('like', self.at))
+        self.apply_concurrently(*[('like', 1)] * 8)
+        self.assertAlmostEqual(self.score(), expected)
+
+    def test_removals_never_fall_below_the_post_itself(self):
+        base = self.score()
+        self.apply_concurrently(('like', 1), ('comment', 1))
+        self.assertGreater(self.score(), base)
+        self.apply_concurrently(('like', -1), ('comment', -1), ('like', -1))
+        self.assertAlmostEqual(self.score(), base)
+
+
+def admission_classes(**changes):
+    return {name: {**config, **changes.get(name, {})} for name, config in settings.ADMISSION_CLASSES.items()}
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class AsyncViewTests(TransactionTestCase):
+    """The async views answer like their sync counterparts; their queries run on other threads, so data is committed."""
+
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user('viewer', 'viewer@example.com', 'secret-pass')
+        self.author = User.objects.create(username='author', email='author@example.com')
+        stranger = User.objects.create(username='stranger', email='stranger@example.com')
+        Follow.objects.create(follower=self.viewer, followed=self.author)
+        self.group = Group.objects.create(name='club', description='club', creator=self.author)
+        GroupMembership.objects.create(user=self.viewer, group=self.group)
+        posts = [Post.objects.create(user=self.author, title=f'followed {i}', content='content') for i in range(3)]
+        posts += [Post.objects.create(user=stranger, title=f'trending {i}', content='content') for i in range(3)]
+        for i, post in enumerate(posts):
+            TrendingScore.objects.update_or_create(
+                post=post, defaults={'author_id': post.user_id, 'score': i, 'created_at': post.created_at},
+            )
+        # Deleted, with the reaper yet to remove its score.
+        Post.objects.filter(pk=posts[-1].pk).update(deleted_at=timezone.now())
+        follow_graph.rebuild()
+        self.token = str(AccessToken.for_user(self.viewer))
+
+    def sync_get(self, name, **kwargs):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        return client.get(reverse(name, kwargs=kwargs))
+
+    def async_get(self, name, token=None, **kwargs):
+        headers = {'Authorization': f'Bearer {token or self.token}'} if token != '' else {}
+        return asyncio.run(AsyncClient().get(reverse(name, kwargs=kwargs), headers=headers))
+
+    def test_responses_match_the_sync_views(self):
+        for name, kwargs in [
+            ('feed', {}), ('explore-posts', {}),
+            ('user-detail', {'username': 'author'}), ('group-detail', {'pk': self.group.pk}),
+        ]:
+            with self.subTest(route=name):
+                # The first build of an object that embeds others is served without an ETag.
+                self.sync_get(name, **kwargs)
+                expected, response = self.sync_get(name, **kwargs), self.async_get(f'async-{name}', **kwargs)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                if 'results' in expected.json():
+                    self.assertEqual(response.json()['results'], expected.json()['results'])
+                else:
+                    self.assertEqual(response.json(), expected.json())
+                    self.assertEqual(response['ETag'], expected['ETag'])
+        titles = [post['title'] for post in self.async_get('async-explore-posts').json()['results']]
+        self.assertEqual(titles, ['trending 1', 'trending 0'])
+
+    def test_conditional_get_and_missing_objects(self):
+        etag = self.async_get('async-user-detail', username='author')['ETag']
+        response = asyncio.run(AsyncClient().get(
+            reverse('async-user-detail', kwargs={'username': 'author'}),
+            headers={'Authorization': f'Bearer {self.token}', 'If-None-Match': etag},
+        ))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.async_get('async-user-detail', username='nobody').status_code, 404)
+        self.assertEqual(self.async_get('async-group-detail', pk=self.group.pk + 100).status_code, 404)
+
+    @override_settings(ADMISSION_CLASSES=admission_classes(default={'rate': 1, 'burst': 1}))
+    def test_throttled_per_user(self):
+        self.assertEqual(self.async_get('async-feed').status_code, 200)
+        response = self.async_get('async-group-detail', pk=self.group.pk)
+        self.assertEqual((response.status_code, response['Retry-After']), (429, '1'))
+
+    def test_authentication_failures(self):
+        response = self.async_get('async-feed', token='')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+        self.assertEqual(self.async_get('async-feed', token='not-a-token').status_code, 401)
+        self.viewer.close()
+        self.assertEqual(self.async_get('async-explore-posts').status_code, 401)
+        post = asyncio.run(AsyncClient().post(reverse('async-feed'), headers={'Authorization': f'Bearer {self.token}'}))
+        self.assertEqual((post.status_code, post['Allow']), (405, 'GET'))
+
+
+class LoginTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='legacy', email='legacy@example.com',
+            password=make_password('secret-pass', hasher='pbkdf2_sha256'),
+        )
+
+    def login(self, password='secret-pass'):
+        return APIClient().post(reverse('auth-login'), {'username': 'legacy', 'password': password}, format='json')
+
+    def test_login_verifies_once_and_upgrades_the_hash(self):
+        with mock.patch.object(PBKDF2PasswordHasher, 'verify', autospec=True, side_effect=PBKDF2PasswordHasher.verify) as verify:
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(verify.call_count, 1)
+        self.assertEqual(AccessToken(response.json()['access'])['username'], 'legacy')
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+        with override_settings(PASSWORD_SCRYPT_WORK_FACTOR=2 ** 10):
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password.split('$')[1], str(2 ** 10))
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.assertEqual(APIClient().post(reverse('auth-login'), {}, format='json').status_code, 400)
+
+    def test_register_inserts_once_with_the_preferred_hasher(self):
+        data = {'username': 'fresh', 'email': 'fresh@example.com', 'password': 'Sup3r-secret', 'password2': 'Sup3r-secret'}
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(APIClient().post(reverse('auth-register'), data, format='json').status_code, 201)
+        self.assertEqual([query['sql'].split()[0] for query in queries.captured_queries], ['SELECT', 'SELECT', 'INSERT'])
+        self.assertTrue(User.objects.get(username='fresh').password.startswith('scrypt$'))
+
+    @override_settings(ADMISSION_CLASSES=admission_classes(critical={'rate': 1, 'burst': 2}))
+    def test_async_login_is_throttled_like_the_sync_view(self):
+        cache.clear()
+        client = AsyncClient()
+        statuses = [asyncio.run(client.post(reverse('async-auth-login'), {})).status_code for _ in range(3)]
+        self.assertEqual(statuses, [400, 400, 429])
+        response = asyncio.run(client.post(reverse('async-auth-login'), {}))
+        self.assertEqual((response['Retry-After'], response.json()['detail'][:19]), ('1', 'Request was throttl'))
+
+    def test_offload_runs_on_the_hashing_pool(self):
+        self.assertTrue(asyncio.run(offload(lambda: threading.current_thread().name)).startswith('password-hash'))
+
+
+class RevocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='leaving', email='leaving@example.com', password='secret-pass')
+
+    def setUp(self):
+        cache.clear()
+        revocations.rebuild()
+
+    def tokens(self):
+        return APIClient().post(reverse('auth-login'), {'username': 'leaving', 'password': 'secret-pass'}, format='json').json()
+
+    def client_for(self, access):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return client
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'in-{i}')
+        self.assertTrue(all(f'in-{i}' in bloom for i in range(1000)))
+        self.assertLess(sum(f'out-{i}' in bloom for i in range(10000)), 300)
+
+    @override_settings(REVOCATION_SYNC_INTERVAL=0)
+    def test_logout_revokes_both_tokens_in_every_process(self):
+        tokens = self.tokens()
+        client = self.client_for(tokens['access'])
+        self.assertEqual(client.get(reverse('feed')).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post(reverse('auth-logout'), {'refresh': tokens['refresh']}, format='json').status_code, 205)
+        self.assertEqual(client.get(reverse('feed')).status_code, 401)
+        refresh = APIClient().post(reverse('auth-refresh'), {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(refresh.status_code, 401)
+
+        # Another worker that built its filter before the logout catches up through the cache.
+        other = Revocations()
+        other.rebuild()
+        other._synced_at -= timedelta(minutes=5)
+        other._seq -= 1
+        self.assertTrue(other.is_revoked(AccessToken(tokens['access'])['jti']))
+        fresh = AccessToken(self.tokens()['access'])['jti']
+        with self.assertNumQueries(0):
+            self.assertFalse(other.is_revoked(fresh))
+
+    def test_rotation_revokes_the_old_refresh_token(self):
+        tokens = self.tokens()
+        # simplejwt rebinds rather than reloads its settings on override_settings.
+        with mock.patch.object(jwt_settings, 'ROTATE_REFRESH_TOKENS', True):
+            rotated = APIClient().post(reverse('auth-refresh'), {'refresh': tokens['refresh']}, format='json').json()
+            self.assertNotEqual(rotated['refresh'], tokens['refresh'])
+            again = APIClient().post(reverse('auth-refresh'), {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(again.status_code, 401)
+
+    def test_stale_filter_is_checked_while_another_thread_rebuilds(self):
+        process = Revocations()
+        process.rebuild()
+        process.revoke('revoked', timezone.now() + timedelta(hours=1))
+        process._built_at -= settings.REVOCATION_PRUNE_INTERVAL + 1
+        with process._rebuilding, self.assertNumQueries(0):
+            self.assertTrue(process.is_revoked('revoked'))
+            self.assertFalse(process.is_revoked('other'))
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_expired_revocations_are_pruned(self):
+        process = Revocations()
+        process.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            process.revoke('old', timezone.now() - timedelta(seconds=1))
+            process.revoke('current', timezone.now() + timedelta(hours=1))
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['current'])
+        self.assertFalse(process.is_revoked('old'))
+        self.assertTrue(process.is_revoked('current'))
+        process.rebuild()
+        self.assertEqual(process.stats()['revoked'], 1)
+        self.assertEqual(APIClient().post(reverse('auth-logout'), {}, format='json').status_code, 401)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class GroupFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create(username='member', email='member@example.com')
+        cls.groups = [Group.objects.create(name=f'club{i}', description='', creator=cls.member) for i in range(4)]
+        for group in cls.groups:
+            GroupMembership.objects.create(user=cls.member, group=group)
+        start = timezone.now() - timedelta(days=1)
+        # Clubs 0 and 1 alternate recent posts; club 2 only posted long ago and club 3 never did.
+        for i in range(12):
+            post = Post.objects.create(user=cls.member, group=cls.groups[i % 2], title=f'recent {i}', content='content')
+            Post.all_objects.filter(pk=post.pk).update(created_at=start + timedelta(minutes=i))
+        old = Post.objects.create(user=cls.member, group=cls.groups[2], title='old', content='content')
+        Post.all_objects.filter(pk=old.pk).update(created_at=start - timedelta(days=30))
+        Group.objects.filter(pk=cls.groups[0].pk).update(last_post_at=start + timedelta(minutes=10))
+        Group.objects.filter(pk=cls.groups[1].pk).update(last_post_at=start + timedelta(minutes=11))
+        Group.objects.filter(pk=cls.groups[2].pk).update(last_post_at=start - timedelta(days=30))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.member)
+
+    def titles(self, data):
+        return [post['title'] for post in data['results']]
+
+    def test_pages_merge_groups_in_time_order_and_skip_inactive_ones(self):
+        url = reverse('group-feed')
+        self.client.get(url)
+        # The membership set comes from the cache; then the groups and only the two active clubs.
+        with self.assertNumQueries(3):
+            first = self.client.get(url).json()
+        self.assertEqual(self.titles(first), [f'recent {i}' for i in range(11, 1, -1)])
+        second = self.client.get(first['next']).json()
+        self.assertEqual(self.titles(second), ['recent 1', 'recent 0', 'old'])
+        self.assertIsNone(second['next'])
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(self.titles(back), self.titles(first))
+        legacy = self.client.get(url, {'page': 2}).json()
+        self.assertEqual(self.titles(legacy), ['recent 1', 'recent 0', 'old'])
+
+    def test_membership_changes_reach_the_feed_and_post_check(self):
+        outsider = User.objects.create(username='outsider', email='outsider@example.com')
+        client = APIClient()
+        client.force_authenticate(outsider)
+        url = reverse('group-posts', kwargs={'pk': self.groups[3].pk})
+        self.assertEqual(client.post(url, {'title': 'hi', 'content': 'there'}, format='json').status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            GroupMembership.objects.create(user=outsider, group=self.groups[3])
+        self.assertEqual(client.post(url, {'title': 'hi', 'content': 'there'}, format='json').status_code, 201)
+        self.assertIsNotNone(Group.objects.get(pk=self.groups[3].pk).last_post_at)
+        self.assertEqual(self.titles(client.get(reverse('group-feed')).json()), ['hi'])
+        with self.captureOnCommitCallbacks(execute=True):
+            GroupMembership.objects.filter(user=outsider).delete()
+        self.assertEqual(self.titles(client.get(reverse('group-feed')).json()), [])
+
+    def test_post_check_ignores_a_stale_membership_cache(self):
+        url = reverse('group-posts', kwargs={'pk': self.groups[3].pk})
+        self.assertIn(self.groups[3].pk, groupfeed.member_group_ids(self.member.pk))
+        # Left on another worker: the drop never reaches this process's cache.
+        GroupMembership.objects.filter(user=self.member, group=self.groups[3]).delete()
+        self.assertIn(self.groups[3].pk, groupfeed.member_group_ids(self.member.pk))
+        self.assertEqual(self.client.post(url, {'title': 'hi', 'content': 'there'}, format='json').status_code, 403)
+
+    def test_posts_cannot_be_moved_between_groups(self):
+        post = Post.objects.filter(group=self.groups[0]).latest('created_at')
+        url = reverse('post-detail', kwargs={'pk': post.pk})
+        response = self.client.put(url, {'title': 'moved', 'group': self.groups[3].pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['title'], response.json()['group']), ('moved', self.groups[0].pk))
+        self.assertEqual(Post.objects.get(pk=post.pk).group_id, self.groups[0].pk)
+        moved_to = Group.objects.get(pk=self.groups[3].pk)
+        self.assertEqual((moved_to.posts_count, moved_to.last_post_at), (0, None))
+        self.assertEqual(Group.objects.get(pk=self.groups[0].pk).posts_count, 6)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class FollowGraphTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create(username=f'member{i}', email=f'member{i}@example.com') for i in range(6)]
+        me, friend, other, *rest = cls.users
+        Follow.objects.create(follower=me, followed=friend)
+        Follow.objects.create(follower=me, followed=other)
+        for user in rest:
+            Follow.objects.create(follower=friend, followed=user)
+        Follow.objects.create(follower=other, followed=rest[0])
+
+    def setUp(self):
+        cache.clear()
+        follow_graph.rebuild()
+
+    def test_suggestions_and_mutual_counts_follow_the_change_log(self):
+        me, friend, other, first, second, third = (user.pk for user in self.users)
+        self.assertEqual(follow_graph.suggestions(me, 2), [(first, 2), (second, 1)])
+        self.assertEqual(follow_graph.mutual_count(me, first), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower_id=other, followed_id=third)
+            Follow.objects.filter(follower_id=friend, followed_id=first).delete()
+            Follow.objects.create(follower_id=me, followed_id=second)
+        self.assertEqual(follow_graph.suggestions(me, 5), [(third, 2), (first, 1)])
+        self.assertEqual(list(follow_graph.followers(third)), [friend, other])
+
+        with override_settings(FOLLOW_GRAPH_COMPACT_THRESHOLD=0), self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower_id=third, followed_id=me)
+        self.assertEqual(list(follow_graph.following(third)), [me])
+        self.assertEqual(follow_graph.suggestions(me, 5), [(third, 2), (first, 1)])
+
+    def test_bulk_writes_rebuild_after_invalidate(self):
+        me, *_, third = (user.pk for user in self.users)
+        Follow.objects.bulk_create([Follow(follower_id=third, followed_id=me)])
+        self.assertEqual(list(follow_graph.followers(me)), [])
+        graph.invalidate()
+        self.assertEqual(list(follow_graph.followers(me)), [third])
+
+    def test_readers_keep_the_current_graph_while_it_is_rebuilt(self):
+        me, *_, third = (user.pk for user in self.users)
+        Follow.objects.bulk_create([Follow(follower_id=third, followed_id=me)])
+        graph.invalidate()
+        with follow_graph._building:
+            self.assertEqual(list(follow_graph.followers(me)), [])
+        self.assertEqual(list(follow_graph.followers(me)), [third])
+
+    def test_profile_etag_covers_the_viewers_mutual_count(self):
+        me, friend, other, first, second, third = self.users
+        client = APIClient()
+        client.force_authenticate(me)
+        url = reverse('user-detail', kwargs={'username': first.username})
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=second, followed=first)
+        response = client.get(url)
+        self.assertEqual(response.json()['mutual_followers_count'], 2)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=me, followed=second)
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['mutual_followers_count'], response.json()['is_following']), (3, False))
+        other_viewer = APIClient()
+        other_viewer.force_authenticate(friend)
+        self.assertEqual(other_viewer.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_user_detail_reports_mutual_followers(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        data = client.get(reverse('user-detail', kwargs={'username': 'member3'})).json()
+        self.assertEqual(data['mutual_followers_count'], 2)
+        suggestions = client.get(reverse('user-suggestions'), {'limit': 1}).json()['results']
+        self.assertEqual([(user['username'], user['mutual_followers_count']) for user in suggestions], [('member3', 2)])
+
+    def test_closed_accounts_are_not_suggested(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        # Closed but not yet reaped, so still in the follow graph.
+        User.objects.filter(username='member3').update(is_active=False)
+        suggestions = client.get(reverse('user-suggestions'), {'limit': 1}).json()['results']
+        self.assertEqual([(user['username'], user['mutual_followers_count']) for user in suggestions], [('member4', 1)])
+
+
+class AdmissionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='busy', email='busy@example.com')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(ADMISSION_MAX_CONCURRENCY=4)
+    def test_lower_classes_are_shed_first(self):
+        controller = AdmissionController()
+        with override_settings(ADMISSION_CLASSES=admission_classes(expensive={'queue': 0}, default={'queue': 0})):
+            self.assertTrue(controller.acquire('explore-posts', 'expensive'))
+            self.assertFalse(controller.acquire('explore-posts', 'expensive'))
+            self.assertTrue(all(controller.acquire('feed', 'default') for _ in range(2)))
+            self.assertFalse(controller.acquire('feed', 'default'))
+            self.assertTrue(controller.acquire('post-like', 'critical'))
+            controller.release('post-like')
+            controller.release('feed')
+            self.assertTrue(controller.acquire('feed', 'default'))
+        self.assertEqual(controller.stats()['rejected'], {('explore-posts', 'queue_full'): 1, ('feed', 'queue_full'): 1})
+
+    @override_settings(ADMISSION_ROUTE_LIMITS={'explore-posts': 0}, ADMISSION_CLASSES=admission_classes(expensive={'queue': 0}))
+    def test_full_route_answers_503_without_running_the_view(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('explore-posts'))
+        self.assertEqual((response.status_code, response['Retry-After'], len(queries)), (503, '1', 0))
+        self.assertEqual(self.client.get(reverse('feed')).status_code, 200)
+
+    def test_streamed_response_closed_unread_releases_its_slot(self):
+        for _ in range(3):
+            response = self.client.get(reverse('account-export'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(admission.stats()['routes'], {'account-export': 1})
+            response.close()
+            response.close()
+        self.assertEqual((admission.stats()['in_flight'], admission.stats()['routes']), (0, {}))
+
+    @override_settings(ADMISSION_CLASSES=admission_classes(critical={'rate': 1, 'burst': 2}))
+    def test_token_bucket_answers_429_with_retry_after(self):
+        statuses = [self.client.post(reverse('auth-refresh'), {'refresh': 'x'}).status_code for _ in range(3)]
+        self.assertEqual(statuses[2], 429)
+        self.assertNotEqual(statuses[1], 429)
+        response = self.client.post(reverse('auth-refresh'), {'refresh': 'x'})
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='author', email='author@example.com')
+        cls.post = Post.objects.create(user=cls.user, title='timed', content='content')
+
+    def setUp(self):
+        request_metrics.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_reports_the_queries_of_the_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('post-detail', kwargs={'pk': self.post.pk}))
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertIn(f'desc="{len(queries)} queries"', timing['db'])
+        self.assertLessEqual({'render', 'app', 'total'}, set(timing))
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_metrics_are_aggregated_per_route(self):
+        for _ in range(2):
+            self.client.get(reverse('post-detail', kwargs={'pk': self.post.pk}))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        body = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape').content.decode()
+        labels = '{route="api/posts/<int:pk>/",method="GET"'
+        self.assertIn(f'sync_http_requests_total{labels},status="200"}} 2', body)
+        self.assertIn(f'sync_http_request_duration_seconds_count{labels}}} 2', body)
+        self.assertIn('sync_auth_principal_cache_hits', body)
+
+
+class NdjsonTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create(username='alice', email='alice@example.com', password='hash')
+        cls.bob = User.objects.create(username='bob', email='bob@example.com', password='hash')
+        Follow.objects.create(follower=cls.bob, followed=cls.alice)
+        cls.group = Group.objects.create(name='readers', description='books', creator=cls.alice)
+        GroupMembership.objects.create(user=cls.bob, group=cls.group)
+        cls.post = Post.objects.create(user=cls.alice, group=cls.group, title='hello', content='world')
+        Comment.objects.create(user=cls.bob, post=cls.post, content='hi')
+        Like.objects.create(user=cls.bob, post=cls.post)
+
+    def test_import_restores_an_export_and_resumes_from_its_checkpoint(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'graph.ndjson')
+        call_command('export_ndjson', path, stderr=StringIO())
+        with open(path, 'rb') as f:
+            lines = f.readlines()
+        created_at = Post.objects.get().created_at
+        User.objects.all().delete()
+
+        # The first run stops at a bad line after committing the user rows before it.
+        with open(path, 'wb') as f:
+            f.writelines(lines[:2] + [b'{"model": "api.nope", "pk": 1, "fields": {}}\n'])
+        with self.assertRaisesMessage(CommandError, 'Line 3'):
+            call_command('import_ndjson', path, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(User.objects.count(), 2)
+
+        with open(path, 'wb') as f:
+            f.writelines(lines)
+        call_command('import_ndjson', path, stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(os.path.exists(path + '.progress'))
+        post = Post.objects.get()
+        self.assertEqual((post.created_at, post.likes_count, post.comments_count), (created_at, 1, 1))
+        self.assertEqual(User.objects.get(pk=self.alice.pk).followers_count, 1)
+        self.assertEqual(Group.objects.get().members_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.bob, post=post).exists())
+
+    def test_export_leaves_out_rows_of_tombstoned_parents(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'graph.ndjson')
+
+        def exported():
+            call_command('export_ndjson', path, stderr=StringIO())
+            with open(path, 'rb') as f:
+                return [json.loads(line)['model'] for line in f]
+
+        self.post.tombstone()
+        self.assertEqual(exported(), ['api.user', 'api.user', 'api.follow', 'api.group', 'api.groupmembership'])
+        Post.all_objects.filter(pk=self.post.pk).update(deleted_at=None)
+        self.group.tombstone()
+        self.assertEqual(exported(), ['api.user', 'api.user', 'api.follow'])
+
+    def test_account_export_streams_only_the_users_own_rows(self):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        response = client.get(reverse('account-export'))
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(
+            [record['model'] for record in records],
+            ['api.user', 'api.follow', 'api.groupmembership', 'api.comment', 'api.like'],
+        )
+        self.assertNotIn('password', records[0]['fields'])
+
+
+class GenerateSocialGraphTests(TestCase):
+    def test_small_graph_has_the_requested_rows_in_time_order(self):
+        started = timezone.now()
+        call_command(
+            'generate_social_graph', users=30, posts=40, likes=80, comments=25, groups=3, avg_following=4,
+            celebrities=2, batch_size=16, days=5, stdout=StringIO(),
+        )
+        self.assertEqual((User.objects.count(), Post.objects.count(), Comment.objects.count()), (30, 40, 25))
+        self.assertTrue(0 < Like.objects.count() <= 80)
+        now = timezone.now()
+        for model in (Like, Comment):
+            rows = model.objects.all()
+            self.assertFalse(rows.filter(created_at__lt=F('post__created_at')).exists())
+            self.assertFalse(rows.filter(created_at__gt=now).exists())
+            # Spread over the days since each post, not stamped with the time of the run.
+            self.assertGreater(rows.filter(created_at__lt=started).count(), rows.count() // 2)
+
+
+class NotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='author@example.com')
+        cls.fans = [User.objects.create(username=f'fan{i}', email=f'fan{i}@example.com') for i in range(3)]
+        cls.post = Post.objects.create(user=cls.author, title='popular', content='content')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def results(self):
+        return self.client.get(reverse('notification-list')).json()['results']
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_bursts_coalesce_into_one_unread_row(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for fan in self.fans:
+                Like.objects.create(user=fan, post=self.post)
+            Like.objects.create(user=self.author, post=self.post)
+            Follow.objects.create(follower=self.fans[0], followed=self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.fans[1], post=self.post, content='nice')
+        self.assertEqual(
+            [(row['verb'], row['actor']['username'], row['actor_count']) for row in self.results()],
+            [('comment', 'fan1', 1), ('follow', 'fan0', 1), ('like', 'fan2', 3)],
+        )
+        self.assertEqual(self.client.post(reverse('notification-read'), {}, format='json').json(), {'marked': 3})
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.filter(user=self.fans[0]).delete()
+            Like.objects.create(user=self.fans[0], post=self.post)
+        self.assertEqual([(row['verb'], row['actor_count'], row['read_at']) for row in self.results()][0], ('like', 1, None))
+
+    def test_repeat_actors_are_counted_once(self):
+        first, second, _ = self.fans
+        for actor in (first, first, second, first):
+            deliver([['like', actor.pk, self.post.pk, None, None]])
+        self.assertEqual([(row['actor']['username'], row['actor_count']) for row in self.results()], [('fan0', 2)])
+
+    def test_events_of_deleted_users_are_dropped(self):
+        gone = User.objects.create(username='gone', email='gone@example.com')
+        gone_pk = gone.pk
+        gone.delete()
+        delivered = deliver([
+            ['like', self.fans[0].pk, self.post.pk, None, None],
+            ['follow', gone_pk, None, None, self.author.pk],
+            ['follow', self.fans[1].pk, None, None, gone_pk],
+        ])
+        self.assertEqual(delivered, 1)
+        self.assertEqual([row['verb'] for row in self.results()], ['like'])
+
+    @override_settings(BACKGROUND_TASK_BACKEND='database')
+    def test_database_backend_queues_jobs_until_a_worker_runs_them(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.fans[0], post=self.post)
+        pending_notifications.flush()
+        Job.objects.create(func='api.missing.task', args=[[], {}])
+        self.assertEqual(self.results(), [])
+        self.assertEqual(tasks.run_pending(), 2)
+        self.assertEqual([row['verb'] for row in self.results()], ['like'])
+        self.assertEqual(list(Job.objects.values_list('func', 'attempts', 'token')), [('api.missing.task', 1, '')])
+
+    @override_settings(BACKGROUND_TASK_BACKEND='database')
+    def test_database_backend_runs_jobs_queued_by_api_writes(self):
+        fan = APIClient()
+        fan.force_authenticate(self.fans[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('post-list'), {'title': 'fresh', 'content': 'content'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        post_id = response.json()['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(fan.post(reverse('post-like', kwargs={'pk': post_id})).status_code, 201)
+        like_counts.flush()
+        pending_notifications.flush()
+        while tasks.run_pending():
+            pass
+        self.assertFalse(Job.objects.exists())
+        self.assertTrue(TrendingScore.objects.filter(post_id=post_id).exists())
+        self.assertEqual([row['verb'] for row in self.results()], ['like'])
+
+    @override_settings(BACKGROUND_TASK_RETRY_DELAY=0, BACKGROUND_TASK_MAX_ATTEMPTS=3)
+    def test_thread_backend_retries_database_errors(self):
+        calls, done = [], threading.Event()
+
+        def flaky(fails):
+            calls.append(fails)
+            if len(calls) <= fails:
+                if len(calls) == 3:
+                    done.set()
+                raise OperationalError('database is locked')
+            done.set()
+
+        with self.assertLogs('api.tasks', 'WARNING'):
+            tasks._run(flaky, [1], {})
+            self.assertTrue(done.wait(5))
+        self.assertEqual(len(calls), 2)
+        calls.clear()
+        done.clear()
+        with self.assertLogs('api.tasks', 'ERROR') as logs:
+            tasks._run(flaky, [5], {})
+            self.assertTrue(done.wait(5))
+            time.sleep(0.05)
+        self.assertEqual(len(calls), 3)
+        self.assertIn('after 3 attempts', logs.output[-1])
+
+    def test_defer_rejects_arguments_jobs_cannot_store(self):
+        with self.assertRaises(TypeError):
+            tasks.defer(trending.apply_event, 1, 'like', 1, timezone.now())
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class RealtimeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='author@example.com')
+        cls.reader = User.objects.create(username='reader', email='reader@example.com')
+        Follow.objects.create(follower=cls.reader, followed=cls.author)
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def subscribe(self, *channels):
+        subscription = self.loop.run_until_complete(realtime.get_broker().subscribe(channels))
+        self.addCleanup(lambda: self.loop.run_until_complete(realtime.get_broker().unsubscribe(subscription)))
+        return subscription
+
+    def receive(self, subscription):
+        event, data = self.loop.run_until_complete(subscription.get(1)).strip().split('\n')
+        return event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+    def test_followers_receive_posts_comments_and_like_counts(self):
+        timeline = self.subscribe(realtime.timeline_channel(self.reader.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(user=self.author, title='live', content='content')
+        event, data = self.receive(timeline)
+        self.assertEqual((event, data['id'], data['user']['username']), ('post', post.pk, 'author'))
+
+        watched = self.subscribe(realtime.post_channel(post.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = Comment.objects.create(user=self.reader, post=post, content='first')
+        self.assertEqual(self.receive(watched), ('comment', comment_rows.serialize(
+            comment_rows.values(Comment.objects.filter(pk=comment.pk)).get()
+        )))
+        with self.captureOnCommitCallbacks(execute=True):
+            like_counts.add(post.pk, 1)
+        like_counts.flush()
+        self.assertEqual(self.receive(watched), ('likes', {'post': post.pk, 'likes_count': 1}))
+        self.assertTrue(timeline.queue.empty())
+
+
+class FastPathTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='ünïcode', email='author@example.com', first_name='Zoë')
+        group = Group.objects.create(name='group', description='', creator=author)
+        Post.objects.create(user=author, title='plain', content='content')
+        post = Post.objects.create(
+            user=author, group=group, title='emoji 🎉', content='line\u2028separator "quoted"', likes_count=3,
+        )
+        Comment.objects.create(user=author, post=post, content='</script>\u2029')
+        trending.rebuild()
+
+    def assertSameBytes(self, expected, actual):
+        self.assertEqual(JSONRenderer().render(expected), FastJSONRenderer().render(actual))
+
+    def test_posts_match_serializer(self):
+        posts = Post.objects.order_by('-created_at', '-id')
+        self.assertSameBytes(PostSerializer(posts, many=True).data, post_rows.serialize_many(post_rows.values(posts)))
+
+    def test_comments_match_serializer(self):
+        comments = Comment.objects.order_by('-created_at')
+        self.assertSameBytes(
+            CommentSerializer(comments, many=True).data,
+            comment_rows.serialize_many(comment_rows.values(comments)),
+        )
+
+    def test_explore_rows_match_serializer(self):
+        ranking = TrendingScore.objects.order_by('-score', '-post')
+        self.assertSameBytes(
+            PostSerializer([entry.post for entry in ranking], many=True).data,
+            explore_rows.serialize_many(explore_rows.values(ranking)),
+        )
+
+    def test_renderer_matches_stock_renderer(self):
+        data = {'results': [1, 2.5, None, True], 'detail': 'naïve \u2028', 'when': Post.objects.first().created_at}
+        self.assertEqual(JSONRenderer().render(data), FastJSONRenderer().render(data))
+
+class ObjectCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='author@example.com')
+        cls.reader = User.objects.create(username='reader', email='reader@example.com')
+        cls.post = Post.objects.create(user=cls.author, title='title', content='content')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        self.url = reverse('post-detail', kwargs={'pk': self.post.pk})
+
+    def get(self, etag=None):
+        return self.client.get(self.url, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(self.url)
+
+    def test_conditional_get_is_answered_from_the_cache(self):
+        self.assertNotIn('ETag', self.get())
+        response = self.get()
+        with self.assertNumQueries(0):
+            cached = self.get(response['ETag'])
+        self.assertEqual((cached.status_code, cached['ETag']), (304, response['ETag']))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().json(), response.json())
+
+    def test_saving_the_object_changes_the_etag(self):
+        self.get()
+        etag = self.get()['ETag']
+        self.post.title = 'edited'
+        self.post.save()
+        response = self.get(etag)
+        self.assertEqual((response.status_code, response.json()['title']), (200, 'edited'))
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_changing_the_embedded_author_changes_the_etag(self):
+        self.get()
+        etag = self.get()['ETag']
+        self.author.username = 'renamed'
+        self.author.save()
+        response = self.get(etag)
+        self.assertEqual((response.status_code, response.json()['user']['username']), (200, 'renamed'))
+        self.assertEqual(self.get(response['ETag']).status_code, 304)
+
+    def test_dependency_versions_are_read_before_building(self):
+        author = {'id': self.author.pk, 'username': 'before'}
+        renamed = []
+
+        def build():
+            data = {'id': self.post.pk, 'user': dict(author)}
+            if renamed == [False]:
+                # The author is renamed right after build() read them.
+                author['username'] = 'after'
+                object_cache.bump(User, self.author.pk)
+                renamed[0] = True
+            return data
+
+        def respond():
+            request = RequestFactory().get(self.url)
+            return object_cache.respond(request, Post, self.post.pk, build, dependencies=lambda data: [(User, data['user']['id'])])
+
+        respond()
+        object_cache.bump(Post, self.post.pk)
+        renamed.append(False)
+        self.assertEqual(respond().data['user']['username'], 'before')
+        self.assertEqual(respond().data['user']['username'], 'after')
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True, DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A second SQLite database standing in for a replica that has not caught up.
+        # It is registered only while these tests run, so the test runner and every
+        # other test see the configured databases alone.
+        cls.databases = {'default', 'replica'}
+        connections.settings['replica'] = {
+            **connections['default'].settings_dict,
+            'NAME': settings.BASE_DIR / 'replica.sqlite3',
+            'TEST': {**connections['default'].settings_dict['TEST'], 'MIRROR': None},
+        }
+        connections['replica'].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            connections['replica'].creation.destroy_test_db(
+                connections['replica'].settings_dict['NAME'], verbosity=0,
+            )
+            del connections['replica']
+            del connections.settings['replica']
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('api.routers.replica_pool', ReplicaPool())
+        self.pool = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.author = User.objects.create_user('author', 'author@example.com', 'secret-pass')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'secret-pass')
+        self.post = Post.objects.create(user=self.author, title='old', content='content')
+        self.catch_up()
+
+    def catch_up(self):
+        for model in (User, Post):
+            model._base_manager.using('replica').all().delete()
+            model._base_manager.using('replica').bulk_create(model._base_manager.using('default').all())
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def titles(self, user):
+        response = self.client_for(user).get(reverse('post-list'))
+        self.assertEqual(response.status_code, 200)
+        return [post['title'] for post in response.data['results']]
+
+    def test_reads_go_to_the_replica_unless_the_user_just_wrote(self):
+        author = self.client_for(self.author)
+        self.assertEqual(author.post(reverse('post-list'), {'title': 'new', 'content': 'content'}, format='json').status_code, 201)
+        self.assertEqual(self.titles(self.reader), ['old'])
+        self.assertEqual(self.titles(self.author), ['new', 'old'])
+        cache.delete(f'pin:{self.author.pk}')
+        self.assertEqual(self.titles(self.author), ['old'])
+
+    def test_lagging_replica_is_skipped(self):
+        Post.objects.create(user=self.author, title='new', content='content')
+        self.assertEqual(self.titles(self.reader), ['old'])
+        self.pool._checked.clear()
+        with mock.patch.object(ReplicaPool, '_lag', return_value=settings.REPLICA_MAX_LAG + 1):
+            self.assertEqual(self.titles(self.reader), ['new', 'old'])
+        self.assertFalse(self.pool.stats()['replica']['healthy'])
+
+    def test_cached_representations_are_built_from_the_primary(self):
+        author = self.client_for(self.author)
+        url = reverse('post-detail', kwargs={'pk': self.post.pk})
+        self.assertEqual(author.put(url, {'title': 'edited'}, format='json').status_code, 200)
+        self.assertEqual(self.titles(self.reader), ['old'])
+        self.client_for(self.reader).get(url)
+        response = self.client_for(self.reader).get(url)
+        self.assertEqual(response.data['title'], 'edited')
+        cache.delete(f'pin:{self.author.pk}')
+        cached = author.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(author.get(url).data['title'], 'edited')
+
+    def test_profile_lookup_is_built_from_the_primary(self):
+        Post.objects.create(user=self.author, title='new', content='content')
+        response = self.client_for(self.reader).get(reverse('user-detail', kwargs={'username': 'author'}))
+        self.assertEqual(response.data['posts_count'], 2)
+
+    @override_settings(REVOCATION_SYNC_INTERVAL=0)
+    def test_revocations_are_read_from_the_primary(self):
+        process = Revocations()
+        process.rebuild()
+        RevokedToken.objects.create(jti='revoked', expires_at=timezone.now() + timedelta(hours=1))
+        _bump()
+        token = replica_reads.set(True)
+        try:
+            self.assertTrue(process.is_revoked('revoked'))
+            process.rebuild()
+            process._recent.clear()
+            self.assertTrue(process.is_revoked('revoked'))
+        finally:
+            replica_reads.reset(token)
+
+    def test_follow_graph_is_built_from_the_primary(self):
+        Follow.objects.create(follower=self.reader, followed=self.author)
+        follow_graph.clear()
+        token = replica_reads.set(True)
+        try:
+            self.assertEqual(list(follow_graph.followers(self.author.pk)), [self.reader.pk])
+        finally:
+            replica_reads.reset(token)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True, TIMELINE_FANOUT_FOLLOWER_LIMIT=3)
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='author@example.com')
+        cls.star = User.objects.create(username='star', email='star@example.com')
+        cls.fans = [User.objects.create(username=f'fan{i}', email=f'fan{i}@example.com') for i in range(3)]
+        Follow.objects.create(follower=cls.fans[0], followed=cls.author)
+        for fan in cls.fans:
+            Follow.objects.create(follower=fan, followed=cls.star)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.fans[0])
+
+    def post(self, user, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(user=user, title=title, content='content')
+
+    def entries(self, user):
+        return list(TimelineEntry.objects.filter(user=user).order_by('-created_at', '-post').values_list('post__title', flat=True))
+
+    def titles(self):
+        return [post['title'] for post in self.client.get(reverse('feed')).json()['results']]
+
+    def test_posts_fan_out_to_the_author_and_followers(self):
+        post = self.post(self.author, 'hello')
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(post=post).values_list('user', flat=True)), {self.author.pk, self.fans[0].pk},
+        )
+        self.assertEqual(self.titles(), ['hello'])
+
+    def test_celebrity_posts_are_merged_at_read_time(self):
+        self.assertEqual(celebrity_ids(), {self.star.pk})
+        self.post(self.author, 'fanned out')
+        post = self.post(self.star, 'famous')
+        self.assertEqual(list(TimelineEntry.objects.filter(post=post).values_list('user', flat=True)), [self.star.pk])
+        self.assertEqual(self.titles(), ['famous', 'fanned out'])
+        self.client.force_authenticate(self.fans[1])
+        self.assertEqual(self.titles(), ['famous'])
+
+    @override_settings(TIMELINE_MAX_LENGTH=3, TIMELINE_TRIM_SLACK=1)
+    def test_timelines_are_trimmed_past_the_slack(self):
+        for i in range(4):
+            self.post(self.author, f'post {i}')
+        self.assertEqual(self.entries(self.fans[0]), ['post 3', 'post 2', 'post 1', 'post 0'])
+        self.post(self.author, 'post 4')
+        self.assertEqual(self.entries(self.fans[0]), ['post 4', 'post 3', 'post 2'])
+
+    @override_settings(TIMELINE_MAX_LENGTH=3, TIMELINE_TRIM_SLACK=1, TIMELINE_FANOUT_FOLLOWER_LIMIT=10)
+    def test_followers_are_trimmed_in_one_statement(self):
+        for fan in self.fans[1:]:
+            Follow.objects.create(follower=fan, followed=self.author)
+        for i in range(4):
+            self.post(self.author, f'post {i}')
+        with CaptureQueriesContext(connection) as queries:
+            self.post(self.author, 'post 4')
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE FROM "api_timelineentry"')]
+        self.assertEqual(len(deletes), 1)
+        for user in (self.author, *self.fans):
+            self.assertEqual(self.entries(user), ['post 4', 'post 3', 'post 2'])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        for i in range(2):
+            self.post(self.author, f'post {i}')
+        fan = self.fans[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=fan, followed=self.author)
+        self.assertEqual(self.entries(fan), ['post 1', 'post 0'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.filter(follower=fan, followed=self.author).delete()
+        self.assertEqual(self.entries(fan), [])
+        # Celebrities are read at request time, so following one copies nothing.
+        self.post(self.star, 'famous')
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=self.author, followed=self.star)
+        self.assertEqual(self.entries(self.author), ['post 1', 'post 0'])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='author@example.com')
+        start = timezone.now() - timedelta(days=1)
+        posts = [Post.objects.create(user=cls.author, title=f'post {i}', content='content') for i in range(25)]
+        # Three posts per timestamp, so page boundaries fall inside runs of equal created_at.
+        for i, post in enumerate(posts):
+            Post.objects.filter(pk=post.pk).update(created_at=start + timedelta(minutes=i // 3))
+        cls.expected = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def ids(self, data):
+        return [post['id'] for post in data['results']]
+
+    def test_cursors_walk_every_post_once_in_both_directions(self):
+        pages = [self.client.get(reverse('post-list')).json()]
+        self.assertIsNone(pages[0]['previous'])
+        while pages[-1]['next']:
+            pages.append(self.client.get(pages[-1]['next']).json())
+        self.assertEqual([len(page['results']) for page in pages], [10, 10, 5])
+        self.assertEqual([id for page in pages for id in self.ids(page)], self.expected)
+        back = [pages[-1]]
+        while back[-1]['previous']:
+            back.append(self.client.get(back[-1]['previous']).json())
+        self.assertEqual([self.ids(page) for page in reversed(back)], [self.ids(page) for page in pages])
+
+    def test_previous_pages_reach_posts_newer_than_the_first_page(self):
+        second = self.client.get(self.client.get(reverse('post-list')).json()['next']).json()
+        newest = Post.objects.create(user=self.author, title='newest', content='content')
+        first = self.client.get(second['previous']).json()
+        self.assertEqual(self.ids(first), self.expected[:10])
+        self.assertEqual(self.ids(self.client.get(first['previous']).json()), [newest.pk])
+
+    def test_page_numbers_are_served_for_older_clients(self):
+        response = self.client.get(reverse('post-list'), {'page': 2}).json()
+        self.assertEqual(response['count'], 25)
+        self.assertEqual(self.ids(response), self.expected[10:20])
+        self.assertIn('page=3', response['next'])
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('post-list'), {'cursor': 'not-a-cursor'}).status_code, 404)
+
+
+@override_settings(LIKE_BUFFER_FLUSH_INTERVAL=60)
+class LikeCountBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='author@example.com')
+        cls.posts = [Post.objects.create(user=cls.author, title=f'post {i}', content='content') for i in range(3)]
+
+    def setUp(self):
+        self.buffer = LikeCountBuffer()
+        self.addCleanup(self.buffer.flush)
+
+    def counts(self):
+        return list(Post.objects.filter(pk__in=[post.pk for post in self.posts]).order_by('pk').values_list('likes_count', flat=True))
+
+    def add(self, *changes):
+        with self.captureOnCommitCallbacks(execute=True):
+            for post, delta in changes:
+                self.buffer.add(post.pk, delta)
+
+    def test_deltas_are_buffered_until_flushed(self):
+        first, second, third = self.posts
+        self.add((first, 1), (first, 1), (second, 1), (first, 1), (first, -1), (third, 1), (third, -1))
+        self.assertEqual(self.counts(), [0, 0, 0])
+        # One UPDATE per distinct delta and one read of the new counts to publish;
+        # the post that netted zero is skipped.
+        with self.assertNumQueries(3):
+            self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(self.counts(), [2, 1, 0])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.buffer.flush(), 0)
+
+    def test_rolled_back_likes_are_not_counted(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self.buffer.add(self.posts[0].pk, 1)
+        self.buffer.flush()
+        self.assertEqual(self.counts(), [0, 0, 0])
+
+    def test_counts_never_go_negative(self):
+        self.add((self.posts[0], -2))
+        self.buffer.flush()
+        self.assertEqual(self.counts(), [0, 0, 0])
+
+    @override_settings(LIKE_BUFFER_MAX_PENDING=2)
+    def test_full_buffer_flushes_at_once(self):
+        self.add((self.posts[0], 1))
+        self.assertEqual(self.counts(), [0, 0, 0])
+        self.add((self.posts[1], 1))
+        self.assertEqual(self.counts(), [1, 1, 0])
+
+    def test_reconcile_repairs_lost_deltas(self):
+        fan = User.objects.create(username='fan', email='fan@example.com')
+        Like.objects.bulk_create([Like(user=user, post=self.posts[0]) for user in (self.author, fan)])
+        Post.objects.filter(pk=self.posts[1].pk).update(likes_count=5)
+        out = StringIO()
+        call_command('reconcile_like_counts', stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Fixed likes_count on 2 posts")
+        self.assertEqual(self.counts(), [2, 0, 0])
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='author@example.com')
+        cls.fan = User.objects.create(username='fan', email='fan@example.com')
+        cls.group = Group.objects.create(name='club', description='', creator=cls.author)
+
+    def counts(self, instance, *fields):
+        return tuple(type(instance).objects.filter(pk=instance.pk).values_list(*fields).get())
+
+    def test_signals_keep_counters_in_step(self):
+        follow = Follow.objects.create(follower=self.fan, followed=self.author)
+        membership = GroupMembership.objects.create(user=self.fan, group=self.group)
+        post = Post.objects.create(user=self.author, group=self.group, title='title', content='content')
+        comment = Comment.objects.create(user=self.fan, post=post, content='nice')
+        self.assertEqual(self.counts(self.author, 'followers_count', 'posts_count'), (1, 1))
+        self.assertEqual(self.counts(self.fan, 'following_count'), (1,))
+        self.assertEqual(self.counts(self.group, 'members_count', 'posts_count'), (1, 1))
+        self.assertEqual(self.counts(post, 'comments_count'), (1,))
+        comment.delete()
+        membership.delete()
+        follow.delete()
+        self.assertEqual(self.counts(post, 'comments_count'), (0,))
+        self.assertEqual(self.counts(self.group, 'members_count'), (0,))
+        self.assertEqual(self.counts(self.author, 'followers_count'), (0,))
+        self.assertEqual(self.counts(self.fan, 'following_count'), (0,))
+
+    def test_counters_never_go_below_zero(self):
+        follow = Follow.objects.create(follower=self.fan, followed=self.author)
+        # Drifted low, as if an increment had been lost.
+        User.objects.filter(pk=self.author.pk).update(followers_count=0)
+        follow.delete()
+        self.assertEqual(self.counts(self.author, 'followers_count'), (0,))
+
+    def test_full_save_of_a_stale_instance_keeps_the_counters(self):
+        author = User.objects.get(pk=self.author.pk)
+        Follow.objects.create(follower=self.fan, followed=self.author)
+        author.first_name = 'Ada'
+        author.save()
+        self.assertEqual(self.counts(self.author, 'first_name', 'followers_count'), ('Ada', 1))
+
+    def test_audit_reports_and_repairs_drift(self):
+        post = Post.objects.create(user=self.author, title='title', content='content')
+        Follow.objects.create(follower=self.fan, followed=self.author)
+        User.objects.filter(pk=self.author.pk).update(followers_count=7, posts_count=0)
+        Post.objects.filter(pk=post.pk).update(comments_count=3)
+        out = StringIO()
+        call_command('audit_counters', stdout=out)
+        self.assertIn('User.followers_count: 1 stale', out.getvalue())
+        self.assertIn('Post.comments_count: 1 stale', out.getvalue())
+        self.assertIn('Group.members_count: ok', out.getvalue())
+        self.assertEqual(self.counts(self.author, 'followers_count'), (7,))
+        out = StringIO()
+        call_command('audit_counters', '--repair', stdout=out)
+        self.assertIn('User.posts_count: 1 repaired', out.getvalue())
+        self.assertEqual(self.counts(self.author, 'followers_count', 'posts_count'), (1, 1))
+        self.assertEqual(self.counts(post, 'comments_count'), (0,))
+        out = StringIO()
+        call_command('audit_counters', stdout=out)
+        self.assertNotIn('stale', out.getvalue())
+
+
+class PrincipalCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='staff', email='staff@example.com', password='secret-pass', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.url = reverse('auth-cache-metrics')
+
+    def test_repeat_requests_skip_the_user_query(self):
+        before = principal_cache.stats()
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        with self.assertNumQueries(0):
+            stats = self.client.get(self.url).json()
+        self.assertEqual(
+            (stats['hits'] - before['hits'], stats['misses'] - before['misses'], stats['size']), (1, 1, 1),
+        )
+
+    def test_deactivation_evicts_the_user(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(principal_cache.stats()['size'], 0)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_password_change_evicts_the_user(self):
+        self.client.get(self.url)
+        self.user.set_password('new-secret-pass')
+        self.user.save()
+        self.assertEqual(principal_cache.stats()['size'], 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_version_check_catches_writes_from_other_workers(self):
+        self.client.get(self.url)
+        stale = principal_cache.stats()['stale']
+        # Another process deactivated the user; only the shared version tells this one.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        object_cache.bump(User, self.user.pk)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.assertEqual(principal_cache.stats()['stale'], stale + 1)
+
+    def test_entries_are_bounded_and_expire(self):
+        other = User.objects.create(username='other', email='other@example.com')
+        lru = PrincipalCache(max_size=1, ttl=60)
+        lru.set(self.user)
+        lru.set(other)
+        self.assertIsNone(lru.get(self.user.pk))
+        self.assertEqual(lru.get(other.pk).username, 'other')
+        self.assertEqual(lru.stats()['evictions'], 1)
+        expired = PrincipalCache(max_size=1, ttl=-1)
+        expired.set(other)
+        self.assertIsNone(expired.get(other.pk))
@@ -0,0 +1,154 @@
+import heapq
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from .fastpath import post_rows
+from .models import Follow, Post, TimelineEntry, User
+from .pagination import MergedKeysetPagination
+from .tasks import defer
+from . import realtime
+
+CELEBRITY_CACHE_KEY = 'timeline:celebrity_ids'
+
+def celebrity_ids():
+    ids = cache.get(CELEBRITY_CACHE_KEY)
+    if ids is None:
+        ids = set(
+            User.objects.filter(followers_count__gte=settings.TIMELINE_FANOUT_FOLLOWER_LIMIT)
+            .values_list('id', flat=True)
+        )
+        cache.set(CELEBRITY_CACHE_KEY, ids, settings.TIMELINE_CELEBRITY_CACHE_SECONDS)
+    return ids
+
+def home_timeline(user):
+    query = Q(pk__in=TimelineEntry.objects.filter(user=user).values('post_id'))
+    celebrities = celebrity_ids() - {user.id}
+    if celebrities:
+        followed = Follow.objects.filter(follower=user, followed_id__in=celebrities).values('followed_id')
+        query |= Q(user_id__in=followed)
+    return Post.objects.filter(query).order_by('-created_at', '-id')
+
+class TimelinePagination(MergedKeysetPagination):
+    """
+    Pages of ``home_timeline`` read from the user's timeline entries in index
+    order, merged with the posts of followed celebrities, which are never fanned
+    out. Entries copy the post's ``created_at`` and order by ``(created_at, post)``
+    so cursors are the same as for a plain post list.
+    """
+    model = Post
+
+    def __init__(self, user):
+        self.user = user
+
+    def sources(self, values, reverse):
+        ordering = self._ordering(reverse)
+        entry_ordering = tuple(field[:-2] + 'post' if field.lstrip('-') == 'id' else field for field in ordering)
+        entries = TimelineEntry.objects.filter(user=self.user, post__deleted_at__isnull=True).order_by(*entry_ordering)
+        if values is not None:
+            entries = entries.filter(self._after(entry_ordering, values))
+        sources = [(entries.values(*('post__' + path for path in post_rows.paths)), 'post__')]
+        celebrities = celebrity_ids() - {self.user.id}
+        if celebrities:
+            followed = Follow.objects.filter(follower=self.user, followed_id__in=celebrities).values('followed_id')
+            posts = post_rows.values(Post.objects.filter(user_id__in=followed))
+            sources.append((self._window(posts, values, reverse), ''))
+        return sources
+
+def trim_timelines(user_ids):
+    """
+    Cut the timelines of ``user_ids`` back to ``TIMELINE_MAX_LENGTH`` entries.
+
+    One grouped count finds the users past the slack, usually none, and one
+    DELETE trims all of them.
+    """
+    max_length = settings.TIMELINE_MAX_LENGTH
+    overflowing = list(
+        TimelineEntry.objects.filter(user_id__in=user_ids).values('user_id')
+        .annotate(length=Count('*')).filter(length__gt=max_length + settings.TIMELINE_TRIM_SLACK)
+        .values_list('user_id', flat=True)
+    )
+    if not overflowing:
+        return
+    position = Window(RowNumber(), partition_by=F('user_id'), order_by=[F('created_at').desc(), F('post').desc()])
+    excess = TimelineEntry.objects.filter(user_id__in=overflowing).annotate(position=position).filter(
+        position__gt=max_length,
+    )
+    TimelineEntry.objects.filter(pk__in=excess.values('pk')).delete()
+
+def trim_timeline(user_id):
+    trim_timelines([user_id])
+
+def _push(post_id, created_at, user_ids, payload):
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id, created_at=created_at) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+    trim_timelines(user_ids)
+    realtime.publish_many([realtime.timeline_channel(user_id) for user_id in user_ids], 'post', payload)
+
+def fan_out_post(post_id):
+    row = post_rows.values(Post.objects.filter(pk=post_id)).first()
+    if row is None:
+        return
+    author_id, created_at = row['user'], row['created_at']
+    payload = post_rows.serialize(row)
+    if author_id in celebrity_ids():
+        # Celebrity posts are read at request time, and streamed on one channel per author.
+        _push(post_id, created_at, [author_id], payload)
+        realtime.publish(realtime.author_channel(author_id), 'post', payload)
+        return
+    batch = [author_id]
+    followers = Follow.objects.filter(followed_id=author_id).values_list('follower_id', flat=True)
+    for follower_id in followers.iterator(chunk_size=settings.TIMELINE_FANOUT_BATCH_SIZE):
+        batch.append(follower_id)
+        if len(batch) >= settings.TIMELINE_FANOUT_BATCH_SIZE:
+            _push(post_id, created_at, batch, payload)
+            batch = []
+    if batch:
+        _push(post_id, created_at, batch, payload)
+
+def schedule_fan_out(post):
+    defer(fan_out_post, post.pk)
+
+def _recent_posts(author_ids):
+    max_length = settings.TIMELINE_MAX_LENGTH
+    author_ids = list(author_ids)
+    chunks = []
+    for start in range(0, len(author_ids), settings.TIMELINE_FANOUT_BATCH_SIZE):
+        chunk = author_ids[start:start + settings.TIMELINE_FANOUT_BATCH_SIZE]
+        chunks.append(list(
+            Post.objects.filter(user_id__in=chunk)
+            .order_by('-created_at', '-id')
+            .values_list('created_at', 'id')[:max_length]
+        ))
+    merged = heapq.merge(*chunks, reverse=True)
+    return [row for row, _ in zip(merged, range(max_length))]
+
+def backfill_author(user_id, author_id):
+    if author_id in celebrity_ids():
+        return
+    entries = [
+        TimelineEntry(user_id=user_id, post_id=post_id, created_at=created_at)
+        for created_at, post_id in _recent_posts([author_id])
+    ]
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    trim_timeline(user_id)
+
+def remove_author(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, post__user_id=author_id).delete()
+
+def rebuild_timeline(user_id):
+    celebrities = celebrity_ids()
+    following_ids = Follow.objects.filter(follower_id=user_id).values_list('followed_id', flat=True)
+    sources = {author_id for author_id in following_ids if author_id not in celebrities}
+    sources.add(user_id)
+    entries = [
+        TimelineEntry(user_id=user_id, post_id=post_id, created_at=created_at)
+        for created_at, post_id in _recent_posts(sources)
+    ]
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        TimelineEntry.objects.bulk_create(entries)
+    return len(entries)
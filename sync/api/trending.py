@@ -0,0 +1,151 @@
+import math
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Exp, Greatest, Least, Ln
+from django.utils import timezone
+from .models import Comment, Follow, Like, Post, TrendingScore
+from .pagination import KeysetPagination
+from .tasks import defer
+
+# Scores are kept as log(sum(weight * 2 ** ((t - EPOCH) / half_life))). Ranking by
+# that value is the same as ranking by exponentially decayed engagement, so old
+# rows never need to be rewritten as time passes.
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+def _log_weight(event, at):
+    half_life = settings.TRENDING_HALF_LIFE.total_seconds()
+    return math.log(settings.TRENDING_WEIGHTS[event]) + (at - EPOCH).total_seconds() * math.log(2) / half_life
+
+def _log_add(a, b):
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+def _in_window(created_at):
+    return created_at >= timezone.now() - settings.TRENDING_WINDOW
+
+def _log_add_score(weight):
+    high, low = Greatest(F('score'), Value(weight)), Least(F('score'), Value(weight))
+    return high + Ln(Value(1.0) + Exp(low - high))
+
+def _log_sub_score(weight, base):
+    remaining = F('score') + Ln(Value(1.0) - Exp(Value(weight) - F('score')))
+    return Case(When(score__gt=weight, then=Greatest(remaining, Value(base))), default=Value(base))
+
+def apply_event(post_id, event, sign, at):
+    """
+    Apply one engagement event; ``at`` is a POSIX timestamp so the call can be stored as a job.
+
+    The score is changed by a single UPDATE computed in the database, never
+    read and written back: concurrent events on one post each apply, and on
+    SQLite no read transaction has to be upgraded to a write one.
+    """
+    at = datetime.fromtimestamp(at, tz=dt_timezone.utc)
+    post = Post.objects.filter(pk=post_id).values('user_id', 'created_at').first()
+    if post is None or not _in_window(post['created_at']):
+        return
+    base = _log_weight('post', post['created_at'])
+    ranked = TrendingScore.objects.filter(post_id=post_id)
+    if event != 'post':
+        weight = _log_weight(event, at)
+        score = _log_add_score(weight) if sign > 0 else _log_sub_score(weight, base)
+        if ranked.update(score=score, updated_at=timezone.now()):
+            return
+    # Not ranked yet: the post's own event or its first engagement adds it.
+    TrendingScore.objects.bulk_create(
+        [TrendingScore(post_id=post_id, author_id=post['user_id'], created_at=post['created_at'], score=base)],
+        ignore_conflicts=True,
+    )
+    if event != 'post':
+        ranked.update(score=score, updated_at=timezone.now())
+
+def record(post_id, event, sign=1):
+    defer(apply_event, post_id, event, sign, timezone.now().timestamp())
+
+def prune():
+    return TrendingScore.objects.filter(created_at__lt=timezone.now() - settings.TRENDING_WINDOW).delete()[0]
+
+def rebuild():
+    since = timezone.now() - settings.TRENDING_WINDOW
+    scores = {}
+    for post_id, author_id, created_at in Post.objects.filter(created_at__gte=since).values_list(
+        'id', 'user_id', 'created_at'
+    ).iterator():
+        scores[post_id] = [author_id, created_at, _log_weight('post', created_at)]
+    for model, event in ((Like, 'like'), (Comment, 'comment')):
+        rows = model.objects.filter(post__created_at__gte=since).values_list('post_id', 'created_at')
+        for post_id, created_at in rows.iterator():
+            if post_id in scores:
+                scores[post_id][2] = _log_add(scores[post_id][2], _log_weight(event, created_at))
+    entries = [
+        TrendingScore(post_id=post_id, author_id=author_id, created_at=created_at, score=score)
+        for post_id, (author_id, created_at, score) in scores.items()
+    ]
+    with transaction.atomic():
+        TrendingScore.objects.all().delete()
+        TrendingScore.objects.bulk_create(entries, batch_size=1000)
+    return len(entries)
+
+class ExplorePagination(KeysetPagination):
+    """
+    Walks the precomputed ranking from the cursor and drops posts by the viewer
+    or by accounts they follow, checking only the authors in each scanned batch.
+    A walk that reaches ``TRENDING_MAX_SCAN`` rows before filling the page links
+    on from the last row it scanned, so a long run of hidden posts is skipped
+    over several requests rather than ending the listing.
+    """
+    ordering = ('-score', '-post')
+
+    def __init__(self, viewer):
+        self.viewer = viewer
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.resume = None
+        if self.page_query_param in request.query_params:
+            followed = Follow.objects.filter(follower=self.viewer).values('followed_id')
+            queryset = queryset.exclude(author_id__in=followed).exclude(author=self.viewer)
+        return super().paginate_queryset(queryset, request, view)
+
+    def fetch(self, queryset, limit):
+        rows = []
+        scanned = 0
+        batch_size = limit * 3
+        last = None
+        while len(rows) < limit and scanned < settings.TRENDING_MAX_SCAN:
+            batch = list(queryset[scanned:scanned + batch_size])
+            scanned += len(batch)
+            # A short batch is the end of the ranking.
+            last = batch[-1] if len(batch) == batch_size else None
+            if not batch:
+                break
+            authors = {self._row_value(entry, 'author') for entry in batch}
+            hidden = set(
+                Follow.objects.filter(follower=self.viewer, followed_id__in=authors)
+                .values_list('followed_id', flat=True)
+            )
+            hidden.add(self.viewer.id)
+            rows.extend(entry for entry in batch if self._row_value(entry, 'author') not in hidden)
+        if len(rows) < limit:
+            self.resume = last
+        return rows[:limit]
+
+    def _set_page(self, rows, values, reverse):
+        rows = super()._set_page(rows, values, reverse)
+        self.reverse = reverse
+        if self.resume is not None:
+            if reverse:
+                self.has_previous = True
+            else:
+                self.has_next = True
+        return rows
+
+    def get_next_link(self):
+        if self.resume is not None and not self.reverse:
+            return self.encode_cursor(self.resume, reverse=False)
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.resume is not None and self.reverse:
+            return self.encode_cursor(self.resume, reverse=True)
+        return super().get_previous_link()
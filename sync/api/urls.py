@@ -9,12 +9,16 @@ from .views.posts import (
 from .views.comments import comment_detail
 from .views.users import (
     user_detail, user_posts, user_follow,
-    user_followers, user_following,
+    user_followers, user_following, user_suggestions, account_export, account_close,
 )
 from .views.groups import (
     group_list, group_detail, group_membership,
-    group_members_list, group_posts,
+    group_members_list, group_posts, group_feed_posts,
 )
+from .views.metrics import auth_cache_metrics, prometheus_metrics
+from .views.search import search_content
+from .views.notifications import notification_list, notification_read
+from .views.batch import batch, batch_likes, batch_follows, batch_memberships
 
 urlpatterns = [
     path("auth/register/", register_view, name="auth-register"),
@@ -24,6 +28,11 @@ urlpatterns = [
 
     path("feed/", feed, name="feed"),
     path("explore/", explore_posts, name="explore-posts"),
+    path("search/", search_content, name="search"),
+    path("notifications/", notification_list, name="notification-list"),
+    path("notifications/read/", notification_read, name="notification-read"),
+    path("export/", account_export, name="account-export"),
+    path("account/", account_close, name="account-close"),
 
     path("posts/", post_list, name="post-list"),
     path("posts/<int:pk>/", post_detail, name="post-detail"),
@@ -33,6 +42,7 @@ urlpatterns = [
 
     path("comments/<int:pk>/", comment_detail, name="comment-detail"),
 
+    path("users/suggestions/", user_suggestions, name="user-suggestions"),
     path("users/<str:username>/", user_detail, name="user-detail"),
     path("users/<str:username>/posts/", user_posts, name="user-posts"),
     path("users/<str:username>/follow/", user_follow, name="user-follow"),
@@ -40,8 +50,17 @@ urlpatterns = [
     path("users/<str:username>/following/", user_following, name="user-following"),
 
     path("groups/", group_list, name="group-list"),
+    path("groups/feed/", group_feed_posts, name="group-feed"),
     path("groups/<int:pk>/", group_detail, name="group-detail"),
     path("groups/<int:pk>/membership/", group_membership, name="group-membership"),
     path("groups/<int:pk>/members/", group_members_list, name="group-members-list"),
     path("groups/<int:pk>/posts/", group_posts, name="group-posts"),
+
+    path("batch/", batch, name="batch"),
+    path("batch/likes/", batch_likes, name="batch-likes"),
+    path("batch/follows/", batch_follows, name="batch-follows"),
+    path("batch/memberships/", batch_memberships, name="batch-memberships"),
+
+    path("metrics/", prometheus_metrics, name="metrics"),
+    path("metrics/auth-cache/", auth_cache_metrics, name="auth-cache-metrics"),
 ]
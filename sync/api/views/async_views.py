@@ -0,0 +1,187 @@
+import asyncio
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, Throttled
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from ..authentication import CachedJWTAuthentication
+from ..fastpath import explore_rows, post_rows
+from ..graph import follow_graph
+from ..hashers import offload
+from ..models import Follow, TrendingScore, User
+from ..objectcache import object_cache
+from ..renderers import FastJSONRenderer
+from ..routers import primary_reads
+from ..serializers import RegisterSerializer
+from ..timeline import TimelinePagination, home_timeline
+from ..trending import ExplorePagination
+from .auth import credentials, missing_credentials, token_response
+from .groups import cached_group
+from .users import profile_data
+
+_authentication = CachedJWTAuthentication()
+
+def _call(func, args):
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+def run(func, *args):
+    # Off the shared sync thread, so independent queries really run side by side.
+    return sync_to_async(_call, thread_sensitive=False)(func, args)
+
+def _render(data, status_code=status.HTTP_200_OK, headers=None):
+    return HttpResponse(
+        FastJSONRenderer().render(data), status=status_code,
+        content_type='application/json', headers=headers,
+    )
+
+def _respond(response):
+    headers = {'ETag': response['ETag']} if response.has_header('ETag') else None
+    if response.status_code == status.HTTP_304_NOT_MODIFIED:
+        return HttpResponse(status=response.status_code, headers=headers)
+    return _render(response.data, response.status_code, headers)
+
+def _not_allowed(request, allowed):
+    return _render(
+        {'detail': f'Method "{request.method}" not allowed.'},
+        status.HTTP_405_METHOD_NOT_ALLOWED, {'Allow': allowed},
+    )
+
+def _render_exception(request, exc):
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    headers = {}
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        headers['WWW-Authenticate'] = _authentication.authenticate_header(request)
+    if getattr(exc, 'wait', None):
+        headers['Retry-After'] = '%d' % exc.wait
+    return _render(data, exc.status_code, headers or None)
+
+def _check_throttles(request):
+    """``APIView.check_throttles`` for the async views: every configured throttle, the longest wait wins."""
+    waits = []
+    for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, None):
+            waits.append(throttle.wait())
+    if waits:
+        raise Throttled(max((wait for wait in waits if wait is not None), default=None))
+
+def async_api_view(view):
+    """Authenticated GET-only async view: JWT auth and throttles run once off the event loop, errors render like DRF's."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return _not_allowed(request, 'GET')
+        try:
+            result = await run(_authentication.authenticate, request)
+            if result is None:
+                raise NotAuthenticated()
+            request.user, request.auth = result
+            drf_request = Request(request)
+            drf_request.user, drf_request.auth = result
+            await run(_check_throttles, drf_request)
+            return await view(drf_request, request.user, *args, **kwargs)
+        except Http404:
+            return _render({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+        except APIException as exc:
+            return _render_exception(request, exc)
+    return wrapper
+
+def async_auth_view(view):
+    """Unauthenticated POST-only async view for the credential endpoints, throttled and CSRF-exempt like DRF's views."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return _not_allowed(request, 'POST')
+        try:
+            drf_request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+            await run(_check_throttles, drf_request)
+            return await view(drf_request, *args, **kwargs)
+        except APIException as exc:
+            return _render_exception(request, exc)
+    wrapper.csrf_exempt = True
+    return wrapper
+
+@async_auth_view
+async def login(request):
+    fields = credentials(request.data)
+    if fields is None:
+        return _respond(missing_credentials())
+    user = await offload(authenticate, request._request, **fields)
+    return _respond(await run(token_response, user))
+
+@async_auth_view
+async def register(request):
+    serializer = RegisterSerializer(data=request.data)
+    if not await run(serializer.is_valid):
+        return _render(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    await offload(serializer.save)
+    return _render(serializer.data, status.HTTP_201_CREATED)
+
+def _legacy_feed(request, user):
+    paginator = TimelinePagination(user)
+    paginator.page_size = 10
+    rows = paginator.paginate_queryset(post_rows.values(home_timeline(user)), request)
+    return paginator.get_paginated_response(post_rows.serialize_many(rows))
+
+@async_api_view
+async def feed(request, user):
+    if TimelinePagination.page_query_param in request.query_params:
+        return _respond(await run(_legacy_feed, request, user))
+    # Timeline entries and followed celebrities' posts are read concurrently.
+    paginator = TimelinePagination(user)
+    paginator.page_size = 10
+    rows = await paginator.apaginate(request)
+    return _render(paginator.get_paginated_data(post_rows.serialize_many(rows)))
+
+def _explore(request, user):
+    ranking = explore_rows.values(TrendingScore.objects.filter(post__deleted_at__isnull=True), 'score', 'post', 'author')
+    paginator = ExplorePagination(user)
+    paginator.page_size = 10
+    rows = paginator.paginate_queryset(ranking, request)
+    return paginator.get_paginated_response(explore_rows.serialize_many(rows))
+
+@async_api_view
+async def explore_posts(request, user):
+    return _respond(await run(_explore, request, user))
+
+def _profile(request, user, username):
+    user_id = object_cache.lookup(User, 'username', username)
+    fetched = None
+    if user_id is None:
+        with primary_reads():
+            fetched = User.objects.filter(username=username).first()
+        if fetched is None:
+            return None
+        user_id = fetched.pk
+        object_cache.remember(User, 'username', username, user_id)
+    try:
+        return object_cache.respond(
+            request, User, user_id, lambda: profile_data(fetched or User.objects.get(pk=user_id)),
+            vary=[(User, user.pk)],
+        )
+    except User.DoesNotExist:
+        return None
+
+@async_api_view
+async def user_detail(request, user, username):
+    response, is_following = await asyncio.gather(
+        run(_profile, request, user, username),
+        run(Follow.objects.filter(follower=user, followed__username=username).exists),
+    )
+    if response is None:
+        return _render({"error": "User not found"}, status.HTTP_404_NOT_FOUND)
+    if response.status_code == status.HTTP_200_OK:
+        mutual = await run(follow_graph.mutual_count, user.pk, response.data['id'])
+        response.data = dict(response.data, is_following=is_following, mutual_followers_count=mutual)
+    return _respond(response)
+
+@async_api_view
+async def group_detail(request, user, pk):
+    return _respond(await run(cached_group, request, pk))
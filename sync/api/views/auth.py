@@ -2,8 +2,11 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth import authenticate
+from django.contrib.auth.models import update_last_login
+from ..revocation import RevocableRefreshToken, revocations
 from ..serializers import RegisterSerializer, TokenSerializer
 
 @api_view(['POST'])
@@ -15,26 +18,43 @@ def register_view(request):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def credentials(data):
+    username, password = data.get("username"), data.get("password")
+    if not username or not password:
+        return None
+    return {'username': username, 'password': password}
+
+def missing_credentials():
+    return Response({'detail': 'Username and password are required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+def token_response(user):
+    # Credentials were checked once by authenticate(); the pair is issued from that result.
+    if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+        return Response({'detail': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+    refresh = TokenSerializer.get_token(user)
+    if api_settings.UPDATE_LAST_LOGIN:
+        update_last_login(None, user)
+    return Response({'refresh': str(refresh), 'access': str(refresh.access_token)}, status=status.HTTP_200_OK)
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def login_view(request):
-    username = request.data["username"]
-    password = request.data["password"]
-    user = authenticate(username=username, password=password)
-    if user is not None:
-        serializer = TokenSerializer(data=request.data)
-        if serializer.is_valid():
-            return Response(serializer.validated_data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    return Response({'detail': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+    fields = credentials(request.data)
+    if fields is None:
+        return missing_credentials()
+    return token_response(authenticate(request._request, **fields))
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
     try:
-        refresh_token = request.data["refresh"]
-        token = RefreshToken(refresh_token)
-        token.blacklist()
-        return Response(status=status.HTTP_205_RESET_CONTENT)
-    except Exception as e:
+        token = RevocableRefreshToken(request.data["refresh"])
+    except KeyError:
+        return Response({"error": "A refresh token is required."}, status=status.HTTP_400_BAD_REQUEST)
+    except TokenError as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    token.blacklist()
+    # The access token presented with the request stops working too.
+    if request.auth is not None and api_settings.JTI_CLAIM in request.auth:
+        revocations.revoke_token(request.auth)
+    return Response(status=status.HTTP_205_RESET_CONTENT)
@@ -0,0 +1,246 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from io import BytesIO
+from urllib.parse import urlsplit
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import IntegrityError, connections, transaction
+from django.http import Http404
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from ..likes import like_counts
+from ..models import Follow, Group, GroupMembership, Like, Post, User
+from .. import trending
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+BATCH_METHODS = SAFE_METHODS + ('POST', 'PUT', 'PATCH', 'DELETE')
+
+class _RollBack(Exception):
+    pass
+
+def _sub_request(parent, method, path, body):
+    url = urlsplit(path)
+    payload = b'' if body is None else json.dumps(body).encode()
+    environ = {key: value for key, value in parent.META.items() if isinstance(value, str)}
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': BytesIO(payload),
+    })
+    request = WSGIRequest(environ)
+    # Reuse the batch's authentication instead of decoding the JWT again.
+    request._force_auth_user = parent.user
+    request._force_auth_token = parent.auth
+    return request
+
+@cache
+def _api_views():
+    from ..urls import urlpatterns
+    return frozenset(pattern.callback for pattern in urlpatterns)
+
+def _dispatch(parent, spec):
+    method, path = spec['method'], spec['path']
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        match = None
+    # Only the synchronous API in api.urls can be called from here.
+    if match is None or match.func not in _api_views():
+        return {'status': status.HTTP_404_NOT_FOUND, 'body': {'error': 'No such route.'}}
+    if match.url_name in BATCH_ROUTE_NAMES:
+        return {'status': status.HTTP_400_BAD_REQUEST, 'body': {'error': 'Batches cannot be nested.'}}
+    if iscoroutinefunction(match.func):
+        return {'status': status.HTTP_400_BAD_REQUEST, 'body': {'error': 'Async views cannot be batched.'}}
+    try:
+        response = match.func(_sub_request(parent, method, path, spec.get('body')), *match.args, **match.kwargs)
+    except Http404:
+        return {'status': status.HTTP_404_NOT_FOUND, 'body': {'detail': 'Not found.'}}
+    if response.streaming:
+        response.close()
+        return {'status': status.HTTP_400_BAD_REQUEST, 'body': {'error': 'Streaming responses cannot be batched.'}}
+    if hasattr(response, 'data'):
+        body = response.data
+    elif response.get('Content-Type', '').startswith('application/json'):
+        body = json.loads(response.content or b'null')
+    else:
+        body = response.content.decode(response.charset or 'utf-8')
+    result = {'status': response.status_code, 'body': body}
+    if response.has_header('ETag'):
+        result['headers'] = {'ETag': response['ETag']}
+    return result
+
+def _dispatch_in_thread(parent, spec):
+    try:
+        return _dispatch(parent, spec)
+    finally:
+        connections.close_all()
+
+def _validate(specs):
+    if not isinstance(specs, list) or not specs:
+        return "'requests' must be a non-empty list."
+    if len(specs) > settings.BATCH_MAX_REQUESTS:
+        return f"A batch can hold at most {settings.BATCH_MAX_REQUESTS} requests."
+    for spec in specs:
+        if not isinstance(spec, dict) or not isinstance(spec.get('path'), str):
+            return "Every request needs a 'path'."
+        spec['method'] = str(spec.get('method', 'GET')).upper()
+        if spec['method'] not in BATCH_METHODS:
+            return f"Unsupported method {spec['method']}."
+    return None
+
+def _run_sequential(parent, specs, atomic):
+    results = []
+    if not atomic:
+        return [_dispatch(parent, spec) for spec in specs], False
+    try:
+        with transaction.atomic():
+            for spec in specs:
+                result = _dispatch(parent, spec)
+                results.append(result)
+                if spec['method'] not in SAFE_METHODS and result['status'] >= 400:
+                    raise _RollBack
+    except _RollBack:
+        return results, True
+    return results, False
+
+def _run_concurrent(parent, specs):
+    results = [None] * len(specs)
+    reads = []
+    with ThreadPoolExecutor(max_workers=settings.BATCH_MAX_WORKERS) as executor:
+        for index, spec in enumerate(specs + [None]):
+            if spec is not None and spec['method'] in SAFE_METHODS:
+                reads.append(index)
+                continue
+            # Independent reads between two writes run together; writes keep their order.
+            futures = {i: executor.submit(_dispatch_in_thread, parent, specs[i]) for i in reads}
+            for i, future in futures.items():
+                results[i] = future.result()
+            reads = []
+            if spec is not None:
+                results[index] = _dispatch(parent, spec)
+    return results
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch(request):
+    specs = request.data.get('requests')
+    error = _validate(specs)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    atomic = bool(request.data.get('atomic', False))
+    rolled_back = False
+    if atomic or settings.BATCH_MAX_WORKERS <= 1:
+        results, rolled_back = _run_sequential(request, specs, atomic)
+    else:
+        results = _run_concurrent(request, specs)
+    body = {'results': results}
+    if atomic:
+        body['rolled_back'] = rolled_back
+    return Response(body)
+
+def _id_list(request, key, kind=int):
+    values = request.data.get(key)
+    if not isinstance(values, list) or not values:
+        return None, f"'{key}' must be a non-empty list."
+    if len(values) > settings.BATCH_MAX_ITEMS:
+        return None, f"At most {settings.BATCH_MAX_ITEMS} items per request."
+    try:
+        return list(dict.fromkeys(kind(value) for value in values)), None
+    except (TypeError, ValueError):
+        return None, f"'{key}' contains an invalid value."
+
+def _create_once(model, **fields):
+    """Create the row unless a concurrent request already did; returns whether it was created."""
+    try:
+        with transaction.atomic():
+            model.objects.create(**fields)
+    except IntegrityError:
+        return False
+    return True
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_likes(request):
+    post_ids, error = _id_list(request, 'post_ids')
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    found = set(Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True))
+    already = set(Like.objects.filter(user=request.user, post_id__in=found).values_list('post_id', flat=True))
+    liked = []
+    with transaction.atomic():
+        # A savepoint per row tells likes made by a concurrent request apart from
+        # ours, so only ours are counted and notified (by the post_save signal).
+        for post_id in post_ids:
+            if post_id not in found or post_id in already:
+                continue
+            if not _create_once(Like, user=request.user, post_id=post_id):
+                already.add(post_id)
+                continue
+            liked.append(post_id)
+            like_counts.add(post_id, 1)
+            trending.record(post_id, 'like')
+    return Response({
+        'liked': liked,
+        'already_liked': [post_id for post_id in post_ids if post_id in already],
+        'not_found': [post_id for post_id in post_ids if post_id not in found],
+    }, status=status.HTTP_201_CREATED if liked else status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_follows(request):
+    usernames, error = _id_list(request, 'usernames', kind=str)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    users = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+    already = set(
+        Follow.objects.filter(follower=request.user, followed_id__in=users.values())
+        .values_list('followed__username', flat=True)
+    )
+    followed = [
+        username for username in usernames
+        if username in users and username not in already and users[username] != request.user.pk
+    ]
+    with transaction.atomic():
+        # Row-by-row creates so counter and timeline signals fire for each follow.
+        for username in list(followed):
+            if not _create_once(Follow, follower=request.user, followed_id=users[username]):
+                followed.remove(username)
+                already.add(username)
+    return Response({
+        'followed': followed,
+        'already_following': [username for username in usernames if username in already],
+        'not_found': [username for username in usernames if username not in users],
+    }, status=status.HTTP_201_CREATED if followed else status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_memberships(request):
+    group_ids, error = _id_list(request, 'group_ids')
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    found = set(Group.objects.filter(pk__in=group_ids).values_list('pk', flat=True))
+    already = set(
+        GroupMembership.objects.filter(user=request.user, group_id__in=found).values_list('group_id', flat=True)
+    )
+    joined = [group_id for group_id in group_ids if group_id in found and group_id not in already]
+    with transaction.atomic():
+        for group_id in list(joined):
+            if not _create_once(GroupMembership, user=request.user, group_id=group_id):
+                joined.remove(group_id)
+                already.add(group_id)
+    return Response({
+        'joined': joined,
+        'already_member': [group_id for group_id in group_ids if group_id in already],
+        'not_found': [group_id for group_id in group_ids if group_id not in found],
+    }, status=status.HTTP_201_CREATED if joined else status.HTTP_200_OK)
+
+BATCH_ROUTE_NAMES = {'batch', 'batch-likes', 'batch-follows', 'batch-memberships'}
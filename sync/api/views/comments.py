@@ -3,17 +3,21 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from ..models import Comment
+from ..models import Comment, User
 from ..serializers import CommentSerializer
+from .. import trending
+from ..objectcache import object_cache
 
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def comment_detail(request, pk):
-    comment = get_object_or_404(Comment, pk=pk)
     if request.method == 'GET':
-        serializer = CommentSerializer(comment)
-        return Response(serializer.data)
-    elif request.method == 'PUT':
+        def build():
+            comment = get_object_or_404(CommentSerializer.setup_eager_loading(Comment.objects.all()), pk=pk)
+            return CommentSerializer(comment).data
+        return object_cache.respond(request, Comment, pk, build, dependencies=lambda data: [(User, data['user']['id'])])
+    comment = get_object_or_404(CommentSerializer.setup_eager_loading(Comment.objects.all()), pk=pk)
+    if request.method == 'PUT':
         if comment.user != request.user:
             return Response({"error": "You don't have permission to edit this comment."}, status=status.HTTP_403_FORBIDDEN)
         serializer = CommentSerializer(comment, data=request.data, partial=True)
@@ -24,5 +28,6 @@ def comment_detail(request, pk):
     elif request.method == 'DELETE':
         if comment.user != request.user and comment.post.user != request.user:
             return Response({"error": "You don't have permission to delete this comment."}, status=status.HTTP_403_FORBIDDEN)
-        comment.delete()
+        if comment.tombstone():
+            trending.record(comment.post_id, 'comment', sign=-1)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,33 +1,25 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
-from ..models import Post, Follow
-from ..serializers import PostSerializer
-
-def _get_following_ids(user):
-    following_ids = list(Follow.objects.filter(follower=user).values_list('followed_id', flat=True))
-    following_ids.append(user.id)
-    return following_ids
+from ..models import TrendingScore
+from ..fastpath import explore_rows, post_rows
+from ..timeline import TimelinePagination, home_timeline
+from ..trending import ExplorePagination
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def explore_posts(request):
-    following_ids = _get_following_ids(request.user)
-    posts = Post.objects.exclude(user_id__in=following_ids).order_by('-created_at')
-    paginator = PageNumberPagination()
+    ranking = explore_rows.values(TrendingScore.objects.filter(post__deleted_at__isnull=True), 'score', 'post', 'author')
+    paginator = ExplorePagination(request.user)
     paginator.page_size = 10
-    result_page = paginator.paginate_queryset(posts, request)
-    serializer = PostSerializer(result_page, many=True)
-    return paginator.get_paginated_response(serializer.data)
+    result_page = paginator.paginate_queryset(ranking, request)
+    return paginator.get_paginated_response(explore_rows.serialize_many(result_page))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def feed(request):
-    following_ids = _get_following_ids(request.user)
-    posts = Post.objects.filter(user_id__in=following_ids).order_by('-created_at')
-    paginator = PageNumberPagination()
+    posts = post_rows.values(home_timeline(request.user))
+    paginator = TimelinePagination(request.user)
     paginator.page_size = 10
     result_page = paginator.paginate_queryset(posts, request)
-    serializer = PostSerializer(result_page, many=True)
-    return paginator.get_paginated_response(serializer.data)
+    return paginator.get_paginated_response(post_rows.serialize_many(result_page))
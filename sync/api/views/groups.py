@@ -2,17 +2,20 @@ from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
-from ..models import Group, GroupMembership, Post
+from ..models import Group, GroupMembership, Post, User
 from ..serializers import GroupSerializer, GroupMembershipSerializer, PostSerializer
+from ..pagination import KeysetPagination
+from ..fastpath import post_rows
+from ..groupfeed import GroupFeedPagination, group_feed
+from ..objectcache import object_cache
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def group_list(request):
     if request.method == 'GET':
-        groups = Group.objects.all().order_by('-created_at')
-        paginator = PageNumberPagination()
+        groups = GroupSerializer.setup_eager_loading(Group.objects.all()).order_by('-created_at')
+        paginator = KeysetPagination()
         paginator.page_size = 10
         result_page = paginator.paginate_queryset(groups, request)
         serializer = GroupSerializer(result_page, many=True, context={'request': request})
@@ -20,20 +23,24 @@ def group_list(request):
     elif request.method == 'POST':
         serializer = GroupSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
-            group = serializer.save(owner=request.user)
-            GroupMembership.objects.create(user=request.user, group=group, role='admin')
+            serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def cached_group(request, pk):
+    def build():
+        group = get_object_or_404(GroupSerializer.setup_eager_loading(Group.objects.all()), pk=pk)
+        return GroupSerializer(group, context={'request': request}).data
+    return object_cache.respond(request, Group, pk, build, dependencies=lambda data: [(User, data['creator']['id'])])
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def group_detail(request, pk):
-    group = get_object_or_404(Group, pk=pk)
     if request.method == 'GET':
-        serializer = GroupSerializer(group, context={'request': request})
-        return Response(serializer.data)
-    elif request.method == 'PUT':
-        if group.owner != request.user:
+        return cached_group(request, pk)
+    group = get_object_or_404(GroupSerializer.setup_eager_loading(Group.objects.all()), pk=pk)
+    if request.method == 'PUT':
+        if group.creator != request.user:
             return Response({"error": "You don't have permission to edit this group."}, status=status.HTTP_403_FORBIDDEN)
         serializer = GroupSerializer(group, data=request.data, partial=True, context={'request': request})
         if serializer.is_valid():
@@ -41,9 +48,9 @@ def group_detail(request, pk):
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     elif request.method == 'DELETE':
-        if group.owner != request.user:
+        if group.creator != request.user:
             return Response({"error": "You don't have permission to delete this group."}, status=status.HTTP_403_FORBIDDEN)
-        group.delete()
+        group.tombstone()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['POST', 'DELETE'])
@@ -58,7 +65,7 @@ def group_membership(request, pk):
         serializer = GroupMembershipSerializer(membership)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     elif request.method == 'DELETE':
-        if group.owner == user:
+        if group.creator_id == user.id:
             return Response({"error": "Group owner cannot leave the group directly. Transfer ownership or delete the group."}, status=status.HTTP_400_BAD_REQUEST)
         membership = GroupMembership.objects.filter(user=user, group=group).first()
         if not membership:
@@ -70,26 +77,37 @@ def group_membership(request, pk):
 @permission_classes([IsAuthenticated])
 def group_members_list(request, pk):
     group = get_object_or_404(Group, pk=pk)
-    memberships = GroupMembership.objects.filter(group=group).order_by('date_joined')
-    paginator = PageNumberPagination()
+    memberships = GroupMembershipSerializer.setup_eager_loading(GroupMembership.objects.filter(group=group)).order_by('date_joined')
+    paginator = KeysetPagination()
     paginator.page_size = 20
+    paginator.ordering = ('date_joined', 'id')
     result_page = paginator.paginate_queryset(memberships, request)
     serializer = GroupMembershipSerializer(result_page, many=True, context={'request': request})
     return paginator.get_paginated_response(serializer.data)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def group_feed_posts(request):
+    posts = post_rows.values(group_feed(request.user))
+    paginator = GroupFeedPagination(request.user)
+    paginator.page_size = 10
+    result_page = paginator.paginate_queryset(posts, request)
+    return paginator.get_paginated_response(post_rows.serialize_many(result_page))
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def group_posts(request, pk):
     group = get_object_or_404(Group, pk=pk)
     user = request.user
     if request.method == 'GET':
-        posts = Post.objects.filter(group=group).order_by('-created_at')
-        paginator = PageNumberPagination()
+        posts = post_rows.values(Post.objects.filter(group=group)).order_by('-created_at')
+        paginator = KeysetPagination()
         paginator.page_size = 10
         result_page = paginator.paginate_queryset(posts, request)
-        serializer = PostSerializer(result_page, many=True, context={'request': request})
-        return paginator.get_paginated_response(serializer.data)
+        return paginator.get_paginated_response(post_rows.serialize_many(result_page))
     elif request.method == 'POST':
+        # Checked against the database: a cached membership set can be stale on
+        # workers that did not see the change.
         if not GroupMembership.objects.filter(user=user, group=group).exists():
             return Response({"error": "You must be a member of the group to post."}, status=status.HTTP_403_FORBIDDEN)
         serializer = PostSerializer(data=request.data, context={'request': request})
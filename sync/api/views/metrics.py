@@ -0,0 +1,55 @@
+import hmac
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from ..admission import admission
+from ..authentication import principal_cache
+from ..instrumentation import gauge, request_metrics
+from ..revocation import revocations
+from ..routers import replica_pool
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def auth_cache_metrics(request):
+    return Response(principal_cache.stats())
+
+def _authorized(request):
+    if not settings.METRICS_TOKEN:
+        return settings.DEBUG
+    supplied = request.META.get('HTTP_AUTHORIZATION', '')
+    return hmac.compare_digest(supplied.encode(), f'Bearer {settings.METRICS_TOKEN}'.encode())
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([])
+def prometheus_metrics(request):
+    if not _authorized(request):
+        return Response({"error": "Metrics require the METRICS_TOKEN bearer token."}, status=status.HTTP_403_FORBIDDEN)
+    lines = request_metrics.render()
+    cache_stats = principal_cache.stats()
+    for name in ('size', 'hits', 'misses', 'evictions', 'invalidations', 'stale'):
+        gauge(lines, f'sync_auth_principal_cache_{name}', f'Principal cache {name}.', [({}, cache_stats[name])])
+    revoked = revocations.stats()
+    gauge(lines, 'sync_revoked_tokens', 'Unexpired revoked tokens in the Bloom filter.', [({}, revoked['revoked'])])
+    for name in ('checks', 'hits', 'false_positives'):
+        gauge(lines, f'sync_revocation_{name}_total', f'Revocation {name.replace("_", " ")}.', [({}, revoked[name])], kind='counter')
+    replicas = replica_pool.stats()
+    gauge(lines, 'sync_replica_healthy', 'Whether the replica passed its last health check.', [
+        ({'alias': alias}, None if state['healthy'] is None else int(state['healthy']))
+        for alias, state in replicas.items()
+    ])
+    gauge(lines, 'sync_replica_lag_seconds', 'Replication lag at the last health check.', [
+        ({'alias': alias}, state.get('lag')) for alias, state in replicas.items()
+    ])
+    state = admission.stats()
+    gauge(lines, 'sync_admission_in_flight', 'Requests admitted and not yet finished.', [({}, state['in_flight'])])
+    gauge(lines, 'sync_admission_waiting', 'Requests queued for a slot, by priority class.', [
+        ({'class': name}, count) for name, count in sorted(state['waiting'].items())
+    ])
+    gauge(lines, 'sync_admission_rejected_total', 'Requests shed with 503 or rate limited with 429.', [
+        ({'route': route, 'reason': reason}, count) for (route, reason), count in sorted(state['rejected'].items())
+    ], kind='counter')
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
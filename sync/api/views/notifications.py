@@ -0,0 +1,29 @@
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from ..fastpath import notification_rows
+from ..models import Notification
+from ..pagination import KeysetPagination
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def notification_list(request):
+    notifications = notification_rows.values(Notification.objects.filter(recipient=request.user))
+    paginator = KeysetPagination()
+    paginator.page_size = 20
+    paginator.ordering = ('-updated_at', '-id')
+    result_page = paginator.paginate_queryset(notifications, request)
+    return paginator.get_paginated_response(notification_rows.serialize_many(result_page))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def notification_read(request):
+    notifications = Notification.objects.filter(recipient=request.user, read_at__isnull=True)
+    ids = request.data.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+            return Response({"error": "ids must be a list of notification ids."}, status=status.HTTP_400_BAD_REQUEST)
+        notifications = notifications.filter(pk__in=ids)
+    return Response({'marked': notifications.update(read_at=timezone.now())})
@@ -1,22 +1,26 @@
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
-from ..models import Post, Like, Comment
+from ..models import Post, Like, Comment, User
 from ..serializers import PostSerializer, LikeSerializer, CommentSerializer
+from ..pagination import KeysetPagination
+from ..fastpath import comment_rows, post_rows
+from ..objectcache import object_cache
+from .. import trending
+from ..likes import like_counts
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def post_list(request):
     if request.method == 'GET':
-        paginator = PageNumberPagination()
+        paginator = KeysetPagination()
         paginator.page_size = 10
-        posts = Post.objects.all().order_by('-created_at')
+        posts = post_rows.values(Post.objects.all()).order_by('-created_at')
         result_page = paginator.paginate_queryset(posts, request)
-        serializer = PostSerializer(result_page, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        return paginator.get_paginated_response(post_rows.serialize_many(result_page))
     elif request.method == 'POST':
         serializer = PostSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
@@ -30,11 +34,13 @@ def post_list(request):
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def post_detail(request, pk):
-    post = get_object_or_404(Post, pk=pk)
     if request.method == 'GET':
-        serializer = PostSerializer(post)
-        return Response(serializer.data)
-    elif request.method == 'PUT':
+        def build():
+            post = get_object_or_404(PostSerializer.setup_eager_loading(Post.objects.all()), pk=pk)
+            return PostSerializer(post).data
+        return object_cache.respond(request, Post, pk, build, dependencies=lambda data: [(User, data['user']['id'])])
+    post = get_object_or_404(PostSerializer.setup_eager_loading(Post.objects.all()), pk=pk)
+    if request.method == 'PUT':
         if post.user != request.user:
             return Response({"error": "You don't have permission to edit this post."}, status=status.HTTP_403_FORBIDDEN)
         serializer = PostSerializer(post, data=request.data, partial=True)
@@ -45,7 +51,7 @@ def post_detail(request, pk):
     elif request.method == 'DELETE':
         if post.user != request.user:
             return Response({"error": "You don't have permission to delete this post."}, status=status.HTTP_403_FORBIDDEN)
-        post.delete()
+        post.tombstone()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['POST', 'DELETE'])
@@ -54,27 +60,29 @@ def post_like(request, pk):
     post = get_object_or_404(Post, pk=pk)
     user = request.user
     if request.method == 'POST':
-        if Like.objects.filter(user=user, post=post).exists():
+        try:
+            with transaction.atomic():
+                Like.objects.create(user=user, post=post)
+        except IntegrityError:
             return Response({"error": "You have already liked this post"}, status=status.HTTP_400_BAD_REQUEST)
-        Like.objects.create(user=user, post=post)
-        post.likes_count += 1
-        post.save()
+        like_counts.add(post.pk, 1)
+        trending.record(post.pk, 'like')
         return Response({"success": "Post liked successfully"}, status=status.HTTP_201_CREATED)
     elif request.method == 'DELETE':
         like = Like.objects.filter(user=user, post=post).first()
         if not like:
             return Response({"error": "You have not liked this post"}, status=status.HTTP_400_BAD_REQUEST)
         like.delete()
-        post.likes_count = max(0, post.likes_count - 1)
-        post.save()
+        like_counts.add(post.pk, -1)
+        trending.record(post.pk, 'like', sign=-1)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def post_likes_list(request, pk):
     post = get_object_or_404(Post, pk=pk)
-    likes = Like.objects.filter(post=post)
-    paginator = PageNumberPagination()
+    likes = LikeSerializer.setup_eager_loading(Like.objects.filter(post=post))
+    paginator = KeysetPagination()
     paginator.page_size = 10
     result_page = paginator.paginate_queryset(likes, request)
     serializer = LikeSerializer(result_page, many=True)
@@ -85,16 +93,16 @@ def post_likes_list(request, pk):
 def post_comments(request, pk):
     post = get_object_or_404(Post, pk=pk)
     if request.method == 'GET':
-        comments = Comment.objects.filter(post=post).order_by('-created_at')
-        paginator = PageNumberPagination()
+        comments = comment_rows.values(Comment.objects.filter(post=post)).order_by('-created_at')
+        paginator = KeysetPagination()
         paginator.page_size = 10
         result_page = paginator.paginate_queryset(comments, request)
-        serializer = CommentSerializer(result_page, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        return paginator.get_paginated_response(comment_rows.serialize_many(result_page))
     elif request.method == 'POST':
         serializer = CommentSerializer(data=request.data)
         if serializer.is_valid():
             user = request.user
             serializer.save(user=user, post=post)
+            trending.record(post.pk, 'comment')
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
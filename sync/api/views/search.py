@@ -0,0 +1,65 @@
+from collections import defaultdict
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from ..models import Comment, Group, Post, SearchDocument, User
+from ..serializers import GroupSerializer, UserSerializer
+from ..fastpath import comment_rows, post_rows
+from .. import search
+
+def _hydrate(hits, request):
+    ids = defaultdict(list)
+    for kind, pk, _ in hits:
+        ids[kind].append(pk)
+    found = defaultdict(dict)
+    if ids[SearchDocument.POST]:
+        rows = post_rows.values(Post.objects.filter(pk__in=ids[SearchDocument.POST]))
+        found[SearchDocument.POST] = {row['id']: row for row in post_rows.serialize_many(rows)}
+    if ids[SearchDocument.COMMENT]:
+        rows = comment_rows.values(Comment.objects.filter(pk__in=ids[SearchDocument.COMMENT]))
+        found[SearchDocument.COMMENT] = {row['id']: row for row in comment_rows.serialize_many(rows)}
+    if ids[SearchDocument.GROUP]:
+        groups = GroupSerializer.setup_eager_loading(Group.objects.filter(pk__in=ids[SearchDocument.GROUP]))
+        data = GroupSerializer(groups, many=True, context={'request': request}).data
+        found[SearchDocument.GROUP] = {group['id']: group for group in data}
+    if ids[SearchDocument.USER]:
+        data = UserSerializer(User.objects.filter(pk__in=ids[SearchDocument.USER]), many=True).data
+        found[SearchDocument.USER] = {user['id']: user for user in data}
+    return found
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_content(request):
+    query = request.query_params.get('q', '').strip()
+    if not search.parse(query):
+        return Response({"error": "Provide a search query with ?q=."}, status=status.HTTP_400_BAD_REQUEST)
+    kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+    if set(kinds) - set(search.SOURCES):
+        return Response(
+            {"error": f"type must be one of {', '.join(search.SOURCES)}."}, status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        page = int(request.query_params.get('page', 1))
+    except ValueError:
+        page = 0
+    if page < 1:
+        return Response({"detail": "Invalid page."}, status=status.HTTP_404_NOT_FOUND)
+    page_size = 10
+    hits = search.search(query, kinds, offset=(page - 1) * page_size, limit=page_size + 1)
+    has_next = len(hits) > page_size
+    hits = hits[:page_size]
+    found = _hydrate(hits, request)
+    url = request.build_absolute_uri()
+    previous = None
+    if page > 1:
+        previous = replace_query_param(url, 'page', page - 1) if page > 2 else remove_query_param(url, 'page')
+    return Response({
+        'next': replace_query_param(url, 'page', page + 1) if has_next else None,
+        'previous': previous,
+        'results': [
+            {'type': kind, 'score': score, 'object': found[kind][pk]}
+            for kind, pk, score in hits if pk in found[kind]
+        ],
+    })
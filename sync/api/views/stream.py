@@ -0,0 +1,60 @@
+import asyncio
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from ..models import Follow
+from ..realtime import author_channel, get_broker, post_channel, timeline_channel
+from ..timeline import celebrity_ids
+from .async_views import async_api_view, run
+
+def _followed_celebrities(user):
+    celebrities = celebrity_ids() - {user.id}
+    if not celebrities:
+        return []
+    return list(
+        Follow.objects.filter(follower=user, followed_id__in=celebrities).values_list('followed_id', flat=True)
+    )
+
+def _watched_posts(request):
+    value = request.query_params.get('posts', '')
+    try:
+        post_ids = {int(pk) for pk in value.split(',') if pk}
+    except ValueError:
+        raise ValidationError({"error": "posts must be a comma-separated list of post ids."})
+    if len(post_ids) > settings.REALTIME_MAX_WATCHED:
+        raise ValidationError({"error": f"Watch at most {settings.REALTIME_MAX_WATCHED} posts."})
+    return post_ids
+
+async def _events(channels):
+    # Django 4.2 does not report client disconnects to streaming responses, so
+    # every stream ends after REALTIME_MAX_DURATION and the client reconnects.
+    broker = get_broker()
+    subscription = await broker.subscribe(channels)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.REALTIME_MAX_DURATION
+    try:
+        yield f'retry: {settings.REALTIME_RETRY_MS}\n\n'
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                yield await subscription.get(min(settings.REALTIME_HEARTBEAT, remaining))
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+    finally:
+        await broker.unsubscribe(subscription)
+
+@async_api_view
+async def stream(request, user):
+    post_ids = _watched_posts(request)
+    celebrities = await run(_followed_celebrities, user)
+    channels = [
+        timeline_channel(user.id),
+        *(author_channel(author_id) for author_id in celebrities),
+        *(post_channel(post_id) for post_id in post_ids),
+    ]
+    return StreamingHttpResponse(
+        _events(channels), content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
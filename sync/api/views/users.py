@@ -1,27 +1,78 @@
+from itertools import chain
+from django.db.models import Exists, OuterRef
+from django.http import StreamingHttpResponse
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
-from ..models import User, Post, Follow
-from ..serializers import UserSerializer, PostSerializer, FollowSerializer
+from ..models import User, Post, Follow, Group, GroupMembership, Comment, Like
+from ..serializers import UserSerializer, FollowSerializer
+from ..pagination import KeysetPagination
+from ..fastpath import post_rows
+from ..objectcache import object_cache
+from ..routers import primary_reads
+from ..ndjson import records
+from ..graph import follow_graph
+
+def profile_data(user):
+    data = UserSerializer(user).data
+    data['followers_count'] = user.followers_count
+    data['following_count'] = user.following_count
+    data['posts_count'] = user.posts_count
+    return data
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_detail(request, username):
+    user_id = object_cache.lookup(User, 'username', username)
+    fetched = None
+    if user_id is None:
+        is_following = Follow.objects.filter(follower=request.user, followed=OuterRef('pk'))
+        try:
+            # build() reuses this row, so it has to come from the primary too.
+            with primary_reads():
+                fetched = User.objects.annotate(is_following=Exists(is_following)).get(username=username)
+        except User.DoesNotExist:
+            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        user_id = fetched.pk
+        object_cache.remember(User, 'username', username, user_id)
+
+    def build():
+        return profile_data(fetched or User.objects.get(pk=user_id))
+
+    def extend(data):
+        if fetched is not None:
+            data['is_following'] = fetched.is_following
+        else:
+            data['is_following'] = Follow.objects.filter(follower=request.user, followed_id=user_id).exists()
+        data['mutual_followers_count'] = follow_graph.mutual_count(request.user.pk, user_id)
+        return data
+
     try:
-        user = User.objects.get(username=username)
+        return object_cache.respond(request, User, user_id, build, extend=extend, vary=[(User, request.user.pk)])
     except User.DoesNotExist:
         return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
-    serializer = UserSerializer(user)
-    followers_count = user.followers.count()
-    following_count = user.following.count()
-    data = serializer.data
-    data['followers_count'] = followers_count
-    data['following_count'] = following_count
-    is_following = Follow.objects.filter(follower=request.user, followed=user).exists()
-    data['is_following'] = is_following
-    return Response(data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def user_suggestions(request):
+    try:
+        limit = min(int(request.query_params.get('limit', 10)), 50)
+    except ValueError:
+        return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+    # Closed accounts stay in the follow graph until the reaper deletes them, so
+    # rank a few spares to fill the page once they are dropped below.
+    ranked = follow_graph.suggestions(request.user.pk, limit * 2)
+    if not ranked:
+        # Nobody to go through yet: fall back to the most followed accounts.
+        popular = User.objects.filter(is_active=True).exclude(pk=request.user.pk).order_by('-followers_count')
+        ranked = [(user_id, 0) for user_id in popular.values_list('pk', flat=True)[:limit]]
+    users = User.objects.filter(is_active=True).in_bulk([user_id for user_id, _ in ranked])
+    results = []
+    for user_id, mutual in ranked:
+        if user_id in users:
+            results.append(dict(UserSerializer(users[user_id]).data, mutual_followers_count=mutual))
+    return Response({'results': results[:limit]})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -30,12 +81,11 @@ def user_posts(request, username):
         user = User.objects.get(username=username)
     except User.DoesNotExist:
         return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
-    posts = Post.objects.filter(user=user).order_by('-created_at')
-    paginator = PageNumberPagination()
+    posts = post_rows.values(Post.objects.filter(user=user)).order_by('-created_at')
+    paginator = KeysetPagination()
     paginator.page_size = 10
     result_page = paginator.paginate_queryset(posts, request)
-    serializer = PostSerializer(result_page, many=True)
-    return paginator.get_paginated_response(serializer.data)
+    return paginator.get_paginated_response(post_rows.serialize_many(result_page))
 
 @api_view(['POST', 'DELETE'])
 @permission_classes([IsAuthenticated])
@@ -67,8 +117,8 @@ def user_followers(request, username):
         user = User.objects.get(username=username)
     except User.DoesNotExist:
         return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
-    follows = Follow.objects.filter(followed=user)
-    paginator = PageNumberPagination()
+    follows = FollowSerializer.setup_eager_loading(Follow.objects.filter(followed=user))
+    paginator = KeysetPagination()
     paginator.page_size = 10
     result_page = paginator.paginate_queryset(follows, request)
     serializer = FollowSerializer(result_page, many=True)
@@ -81,9 +131,35 @@ def user_following(request, username):
         user = User.objects.get(username=username)
     except User.DoesNotExist:
         return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
-    follows = Follow.objects.filter(follower=user)
-    paginator = PageNumberPagination()
+    follows = FollowSerializer.setup_eager_loading(Follow.objects.filter(follower=user))
+    paginator = KeysetPagination()
     paginator.page_size = 10
     result_page = paginator.paginate_queryset(follows, request)
     serializer = FollowSerializer(result_page, many=True)
     return paginator.get_paginated_response(serializer.data)
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def account_close(request):
+    request.user.close()
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def account_export(request):
+    user = request.user
+    querysets = [
+        User.objects.filter(pk=user.pk),
+        Follow.objects.filter(follower=user).order_by(),
+        Group.objects.filter(creator=user).order_by(),
+        GroupMembership.objects.filter(user=user).order_by(),
+        Post.objects.filter(user=user).order_by(),
+        Comment.objects.filter(user=user).order_by(),
+        Like.objects.filter(user=user).order_by(),
+    ]
+    response = StreamingHttpResponse(
+        chain.from_iterable(records(queryset, exclude=('password',)) for queryset in querysets),
+        content_type='application/x-ndjson',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{user.username}.ndjson"'
+    return response
@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
+from urllib.parse import unquote, urlsplit
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.performance_middleware',
+    'api.middleware.admission_control_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -53,6 +57,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.replica_routing_middleware',
 ]
 
 # CORS settings
@@ -90,9 +95,79 @@ DATABASES = {
     }
 }
 
+# Read replicas
+# DATABASE_REPLICAS is a comma-separated list of postgres:// URLs or SQLite paths.
+# Safe-method requests read from a healthy replica unless the user wrote in the
+# last REPLICA_PIN_SECONDS; replicas further behind than REPLICA_MAX_LAG seconds
+# or failing their health check are skipped until the next check.
+
+def _replica(url):
+    parts = urlsplit(url)
+    if parts.scheme in ('postgres', 'postgresql'):
+        config = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': parts.path.lstrip('/'),
+            'USER': unquote(parts.username or ''),
+            'PASSWORD': unquote(parts.password or ''),
+            'HOST': parts.hostname or '',
+            'PORT': str(parts.port or ''),
+        }
+    else:
+        config = {**DATABASES['default'], 'NAME': BASE_DIR / url}
+    return {**config, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_REPLICAS = []
+for _index, _url in enumerate(filter(None, map(str.strip, os.environ.get('DATABASE_REPLICAS', '').split(',')))):
+    DATABASES[f'replica{_index + 1}'] = _replica(_url)
+    DATABASE_REPLICAS.append(f'replica{_index + 1}')
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 5
+REPLICA_MAX_LAG = 5.0
+REPLICA_HEALTH_CHECK_INTERVAL = 10.0
+
+# Caches
+# Object versions and cached representations must be shared by every worker,
+# so production should point REDIS_URL at a shared Redis.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+OBJECT_CACHE_TIMEOUT = 300
+
 # Custom user model
 AUTH_USER_MODEL = 'api.User'
 
+# Password hashing. New hashes use PASSWORD_HASHER (scrypt unless set; argon2
+# needs argon2-cffi); the others stay listed so existing hashes still verify and
+# are rewritten with the preferred hasher on the next login. The async auth views
+# hash on a pool of PASSWORD_HASH_WORKERS threads.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'scrypt')
+_PASSWORD_HASHERS = {
+    'scrypt': 'api.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'pbkdf2_sha1': 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+]
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))
+PASSWORD_SCRYPT_BLOCK_SIZE = 8
+PASSWORD_SCRYPT_PARALLELISM = 1
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -142,21 +217,172 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.admission.TokenBucketThrottle',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
 }
 
+# Admission control. Each URL name belongs to a priority class (default unless
+# listed). A class may start requests while fewer than its share of
+# ADMISSION_MAX_CONCURRENCY are in flight in the process, routes in
+# ADMISSION_ROUTE_LIMITS have their own cap, and requests that do not fit wait
+# up to `timeout` seconds in a queue of `queue` entries before a 503. Each user
+# (or address) also gets a token bucket of `rate` requests/s and `burst` per class,
+# answered with 429 when empty; buckets live in Redis when REDIS_URL is set.
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', 32))
+ADMISSION_CLASSES = {
+    'critical': {'share': 1.0, 'queue': 64, 'timeout': 2.0, 'rate': 10, 'burst': 30},
+    'default': {'share': 0.75, 'queue': 32, 'timeout': 1.0, 'rate': 20, 'burst': 60},
+    'expensive': {'share': 0.25, 'queue': 8, 'timeout': 0.5, 'rate': 2, 'burst': 20},
+}
+ADMISSION_ROUTE_CLASSES = {
+    'auth-register': 'critical',
+    'auth-login': 'critical',
+    'auth-refresh': 'critical',
+    'auth-logout': 'critical',
+    'async-auth-register': 'critical',
+    'async-auth-login': 'critical',
+    'post-like': 'critical',
+    'explore-posts': 'expensive',
+    'async-explore-posts': 'expensive',
+    'search': 'expensive',
+    'group-members-list': 'expensive',
+    'account-export': 'expensive',
+    'batch': 'expensive',
+    'batch-likes': 'expensive',
+    'batch-follows': 'expensive',
+    'batch-memberships': 'expensive',
+}
+ADMISSION_ROUTE_LIMITS = {
+    'explore-posts': 8,
+    'async-explore-posts': 8,
+    'search': 8,
+    'group-members-list': 8,
+    'account-export': 2,
+    'batch': 8,
+}
+# Long-lived streams and the metrics scrape are never shed.
+ADMISSION_EXEMPT_ROUTES = ('async-stream', 'metrics')
+ADMISSION_RETRY_AFTER = 1
+ADMISSION_POLL_INTERVAL = 0.01
+ADMISSION_REDIS_URL = os.environ.get('REDIS_URL')
+ADMISSION_BUCKETS = 'api.admission.RedisTokenBuckets' if ADMISSION_REDIS_URL else 'api.admission.CacheTokenBuckets'
+
+# Home timeline settings
+TIMELINE_MAX_LENGTH = 800
+TIMELINE_TRIM_SLACK = 50
+TIMELINE_FANOUT_BATCH_SIZE = 500
+TIMELINE_FANOUT_FOLLOWER_LIMIT = 10000
+TIMELINE_CELEBRITY_CACHE_SECONDS = 300
+
+# Explore ranking: engagement decays with the given half-life and posts older
+# than the window drop out of the trending table.
+TRENDING_HALF_LIFE = timedelta(hours=12)
+TRENDING_WINDOW = timedelta(days=7)
+TRENDING_WEIGHTS = {'post': 1.0, 'like': 1.0, 'comment': 3.0}
+TRENDING_MAX_SCAN = 500
+
+# Like counts are buffered in memory and flushed to Post.likes_count in batches.
+LIKE_BUFFER_FLUSH_INTERVAL = 1.0
+LIKE_BUFFER_MAX_PENDING = 1000
+
+# Background tasks run on a thread pool after commit; set eager to run them inline.
+# A task that fails with a database OperationalError (a locked SQLite file, a
+# dropped connection) is retried after BACKGROUND_TASK_RETRY_DELAY seconds,
+# doubling each time, up to BACKGROUND_TASK_MAX_ATTEMPTS runs.
+# The 'database' backend stores them as Job rows for `manage.py run_tasks` instead,
+# leased for BACKGROUND_TASK_LEASE seconds and retried with backoff.
+BACKGROUND_TASK_BACKEND = os.environ.get('BACKGROUND_TASK_BACKEND', 'thread')
+BACKGROUND_TASK_WORKERS = 4
+BACKGROUND_TASKS_EAGER = False
+BACKGROUND_TASK_BATCH_SIZE = 50
+BACKGROUND_TASK_LEASE = 300
+BACKGROUND_TASK_MAX_ATTEMPTS = 5
+BACKGROUND_TASK_RETRY_DELAY = 0.1
+BACKGROUND_TASK_POLL_INTERVAL = 1.0
+
+# Deleted posts, comments and groups are tombstoned in the request; the reaper
+# task then deletes them and their dependents REAPER_BATCH_SIZE rows per transaction.
+REAPER_BATCH_SIZE = 1000
+
+# Follow graph index: each process builds CSR arrays from the Follow table on first
+# use and replays follows and unfollows from a change log kept in the cache for
+# FOLLOW_GRAPH_LOG_TTL seconds. A log entry still missing after FOLLOW_GRAPH_LOG_GRACE
+# seconds forces a rebuild. Suggestions for users following more accounts than
+# FOLLOW_GRAPH_SUGGESTION_FRIENDS are computed from a sample of them.
+FOLLOW_GRAPH_LOG_TTL = 3600
+FOLLOW_GRAPH_LOG_GRACE = 5
+FOLLOW_GRAPH_COMPACT_THRESHOLD = 10000
+FOLLOW_GRAPH_SUGGESTION_FRIENDS = 500
+
+# Membership sets behind /api/groups/feed/ are cached per user and dropped whenever
+# one of their memberships changes. Without a shared cache the drop only reaches the
+# worker that made the change, so the others may serve a stale feed until expiry;
+# the group post check always reads the database.
+GROUP_MEMBERSHIP_CACHE_SECONDS = 3600 if os.environ.get('REDIS_URL') else 60
+
+# Notification events are buffered per process and delivered as one coalescing task per flush.
+NOTIFICATION_FLUSH_INTERVAL = 2.0
+NOTIFICATION_MAX_PENDING = 500
+
+# /api/batch/ limits; reads between writes run on up to BATCH_MAX_WORKERS threads.
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_ITEMS = 100
+BATCH_MAX_WORKERS = 4
+
+# Real-time streams (/api/async/stream/, served under ASGI). Events go through an
+# in-process broker unless REDIS_URL is set, in which case every worker shares Redis pub/sub.
+REALTIME_REDIS_URL = os.environ.get('REDIS_URL')
+REALTIME_BROKER = 'api.realtime.RedisBroker' if REALTIME_REDIS_URL else 'api.realtime.InProcessBroker'
+REALTIME_QUEUE_SIZE = 100
+REALTIME_MAX_WATCHED = 50
+REALTIME_HEARTBEAT = 15
+REALTIME_RETRY_MS = 5000
+REALTIME_MAX_DURATION = 300
+
+# /api/metrics/ serves Prometheus metrics to requests bearing METRICS_TOKEN
+# (any request when DEBUG is on and no token is set).
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Authenticated users are kept in a per-process LRU; VERIFY_VERSION checks each
+# hit against the shared object-cache version so writes on other workers evict it.
+AUTH_PRINCIPAL_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'VERIFY_VERSION': True,
+}
+
+# Token revocation (logout, refresh rotation). Each process keeps revoked jtis in
+# a Bloom filter sized for REVOCATION_BLOOM_CAPACITY at REVOCATION_BLOOM_ERROR_RATE
+# and the most recent REVOCATION_EXACT_SIZE exactly; other hits are confirmed in
+# the RevokedToken table. Processes check the shared cache for new revocations
+# every REVOCATION_SYNC_INTERVAL seconds and drop expired ones every
+# REVOCATION_PRUNE_INTERVAL seconds.
+REVOCATION_BLOOM_CAPACITY = 100000
+REVOCATION_BLOOM_ERROR_RATE = 0.001
+REVOCATION_EXACT_SIZE = 10000
+REVOCATION_SYNC_INTERVAL = 1.0
+REVOCATION_SYNC_OVERLAP = 60
+REVOCATION_PRUNE_INTERVAL = 3600
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.RefreshSerializer',
     'UPDATE_LAST_LOGIN': False,
 
     'ALGORITHM': 'HS256',
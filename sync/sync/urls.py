@@ -18,5 +18,6 @@ Including another URLconf
 from django.urls import path, include
 
 urlpatterns = [
+    path("api/async/", include("api.async_urls")),
     path("api/", include("api.urls")),
 ]